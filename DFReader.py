@@ -9,6 +9,9 @@ Partly based on SDLog2Parser by Anton Babushkin
 '''
 
 import array
+import bisect
+import copy
+import heapq
 import math
 import sys
 import os
@@ -23,10 +26,12 @@ import io
 try:
     from . import mavutil
     from . import dfindexer
+    from . import logindex
 except ImportError:
     # allows running uninstalled
     from pymavlink import mavutil
     from pymavlink import dfindexer
+    from pymavlink import logindex
 
 try:
     long        # Python 2 has long
@@ -57,6 +62,32 @@ FORMAT_TO_STRUCT = {
     "Q": ("Q", None, long),  # Backward compat
     }
 
+# numpy dtypes with the same layout as FORMAT_TO_STRUCT, used for
+# columnar extraction
+FORMAT_TO_DTYPE = {
+    "a": ("<i2", (32,)),
+    "b": "i1",
+    "B": "u1",
+    "g": "<f2",
+    "h": "<i2",
+    "H": "<u2",
+    "i": "<i4",
+    "I": "<u4",
+    "f": "<f4",
+    "n": "S4",
+    "N": "S16",
+    "Z": "S64",
+    "c": "<i2",
+    "C": "<u2",
+    "e": "<i4",
+    "E": "<u4",
+    "L": "<i4",
+    "d": "<f8",
+    "M": "i1",
+    "q": "<i8",
+    "Q": "<u8",
+    }
+
 MULT_TO_PREFIX = {
     0: "",
     1: "",
@@ -77,6 +108,13 @@ def is_quiet_nan(val):
     else:
         return False
 
+# DFMessage subclasses made by DFFormat.message_class, by format layout
+_message_classes = {}
+
+# the time index used by DFReader_binary.seek_time() holds one in this
+# many messages of each timestamped type
+TIME_INDEX_SPACING = 128
+
 class DFFormat(object):
     def __init__(self, type, name, flen, format, columns, oldfmt=None):
         self.type = type
@@ -143,6 +181,95 @@ class DFFormat(object):
         (ifmt,) = self.format[instance_idx]
         self.instance_len = struct.calcsize(ifmt)
 
+    def __getattr__(self, name):
+        if name == 'message_class':
+            # built on first use, and shared between formats with the same
+            # layout as logs often repeat their FMT messages
+            key = (self.name, self.format, tuple(self.columns))
+            if key not in _message_classes:
+                _message_classes[key] = self._make_message_class()
+            self.message_class = _message_classes[key]
+            return self.message_class
+        raise AttributeError(name)
+
+    def _make_getter(self, i):
+        '''return a function reading column i of a message in this format.
+        This makes the decisions DFMessage.__getattr__ makes on every
+        read once per format'''
+        fmtchar = self.format[i]
+        conv = self.msg_types[i]
+        mul = self.msg_mults[i]
+
+        def get_decoded(m):
+            v = m._elements[i]
+            if isinstance(v, bytes):
+                try:
+                    v = v.decode("utf-8")
+                except UnicodeDecodeError:
+                    # try western europe
+                    v = v.decode("ISO-8859-1")
+            return v
+
+        if self.msg_fmts[i] == 'Z' and self.name == 'FILE':
+            # special case for FILE contents as bytes
+            return lambda m: m._elements[i]
+        if fmtchar == 'a':
+            return get_decoded
+        if conv == str:
+            return lambda m: null_term(str(get_decoded(m)))
+        if fmtchar == 'M':
+            def get_mode(m):
+                if m._apply_multiplier:
+                    return conv(m._elements[i])
+                return m._elements[i]
+            return get_mode
+        if mul is None:
+            return lambda m: conv(m._elements[i])
+        if mul > 0.0 and mul < 1.0:
+            # For reasons relating to floating point accuracy, you get a
+            # more accurate result by dividing by 1e2 or 1e7 than
+            # multiplying by 1e-2 or 1e-7
+            divisor = 1/mul
+
+            def get_divided(m):
+                if m._apply_multiplier:
+                    return conv(m._elements[i]) / divisor
+                return conv(m._elements[i])
+            return get_divided
+
+        def get_multiplied(m):
+            if m._apply_multiplier:
+                return conv(m._elements[i]) * mul
+            return conv(m._elements[i])
+        return get_multiplied
+
+    def _make_message_class(self):
+        '''create a DFMessage subclass with a property for each column'''
+        attrs = {'__slots__': ()}
+        getters = []
+        for i in range(len(self.columns)):
+            if i >= len(self.msg_types):
+                break
+            getter = self._make_getter(i)
+            getters.append(getter)
+            field = self.columns[i]
+            if field in ('__slots__', '_getters') or hasattr(DFMessage, field) or \
+               not field.isidentifier():
+                continue
+            attrs[field] = property(getter, DFMessage._field_setter(field))
+        attrs['_getters'] = getters
+        return type("DFMessage_%s" % self.name, (DFMessage,), attrs)
+
+    def field_unpacker(self, field):
+        '''return the offset of a field from the start of a message,
+        including the header, and a struct to unpack just that field'''
+        idx = self.colhash[field]
+        pre_sfmt = "<"
+        for c in self.format[:idx]:
+            pre_sfmt += FORMAT_TO_STRUCT[c][0]
+        return (3 + struct.calcsize(pre_sfmt),
+                struct.Struct("<" + FORMAT_TO_STRUCT[self.format[idx]][0]))
+
     def set_unit_ids(self, unit_ids, unit_lookup):
         '''set unit IDs string from FMTU'''
         if unit_ids is None:
@@ -175,6 +302,24 @@ class DFFormat(object):
                 else:
                     self.units[i] = "%.4g %s" % (unitmult, self.units[i])
 
+    def get_dtype(self):
+        '''return a numpy dtype matching the wire layout of this message,
+        including the three byte header'''
+        import numpy as np
+        names = []
+        formats = []
+        offsets = []
+        ofs = 3
+        for (col, c) in zip(self.columns, self.msg_fmts):
+            names.append(col)
+            formats.append(FORMAT_TO_DTYPE[c])
+            offsets.append(ofs)
+            ofs += struct.calcsize(FORMAT_TO_STRUCT[c][0])
+        if ofs > self.len:
+            raise ValueError("Format %s is longer than its message length %u" % (self.name, self.len))
+        return np.dtype({'names': names, 'formats': formats,
+                         'offsets': offsets, 'itemsize': self.len})
+
     def get_unit(self, col):
         '''Return the unit for the specified field'''
         if self.units is None:
@@ -205,18 +350,32 @@ def null_term(string):
 
 
 class DFMessage(object):
+    '''a dataflash message. Messages are normally created as instances of
+    fmt.message_class, a subclass of this with a property per column, so
+    field reads don't go through __getattr__'''
+    __slots__ = ('fmt', '_elements', '_apply_multiplier', '_fieldnames', '_parent',
+                 '_timestamp', '__dict__')
+    _getters = None
+
     def __init__(self, fmt, elements, apply_multiplier, parent):
-        self.fmt = fmt
-        self._elements = elements
-        self._apply_multiplier = apply_multiplier
-        self._fieldnames = fmt.columns
-        self._parent = parent
+        setattr = object.__setattr__
+        setattr(self, 'fmt', fmt)
+        setattr(self, '_elements', elements)
+        setattr(self, '_apply_multiplier', apply_multiplier)
+        setattr(self, '_fieldnames', fmt.columns)
+        setattr(self, '_parent', parent)
+
+    def _values(self):
+        '''return the values of all the columns of this message'''
+        if self._getters is not None:
+            return [get(self) for get in self._getters]
+        return [self.__getattr__(c) for c in self.fmt.columns]
 
     def to_dict(self):
         d = {'mavpackettype': self.fmt.name}
 
-        for field in self._fieldnames:
-            d[field] = self.__getattr__(field)
+        for (field, value) in zip(self._fieldnames, self._values()):
+            d[field] = value
 
         return d
 
@@ -259,10 +418,19 @@ class DFMessage(object):
         if not field[0].isupper() or not field in self.fmt.colhash:
             super(DFMessage,self).__setattr__(field, value)
         else:
-            i = self.fmt.colhash[field]
-            if self.fmt.msg_mults[i] is not None and self._apply_multiplier:
-                value /= self.fmt.msg_mults[i]
-            self._elements[i] = value
+            self._set_field(field, value)
+
+    def _set_field(self, field, value):
+        '''set the value of a column'''
+        i = self.fmt.colhash[field]
+        if self.fmt.msg_mults[i] is not None and self._apply_multiplier:
+            value /= self.fmt.msg_mults[i]
+        self._elements[i] = value
+
+    @staticmethod
+    def _field_setter(field):
+        '''return a property setter for a column'''
+        return lambda m, value: m._set_field(field, value)
 
     def get_type(self):
         return self.fmt.name
@@ -270,8 +438,7 @@ class DFMessage(object):
     def __str__(self):
         ret = "%s {" % self.fmt.name
         col_count = 0
-        for c in self.fmt.columns:
-            val = self.__getattr__(c)
+        for (c, val) in zip(self.fmt.columns, self._values()):
             if is_quiet_nan(val):
                 val = "qnan"
             # Add the value to the return string
@@ -463,6 +630,11 @@ class DFReaderClock(object):
     def rewind_event(self):
         pass
 
+    def timestamps(self, fmt, values):
+        '''return timestamps for an array of messages of one format, or None
+        if they can't be worked out without reading the log in order'''
+        return None
+
 
 class DFReaderClock_usec(DFReaderClock):
     '''DFReaderClock_usec - use microsecond timestamps from messages'''
@@ -512,6 +684,11 @@ class DFReaderClock_usec(DFReaderClock):
             m._timestamp = self.timestamp
         self.timestamp = m._timestamp
 
+    def timestamps(self, fmt, values):
+        if len(fmt.columns) > 0 and fmt.columns[0] == 'TimeUS':
+            return self.timebase + values['TimeUS']*0.000001
+        return None
+
 
 class DFReaderClock_msec(DFReaderClock):
     '''DFReaderClock_msec - a format where many messages have TimeMS in
@@ -540,6 +717,13 @@ class DFReaderClock_msec(DFReaderClock):
             m._timestamp = self.timestamp
         self.timestamp = m._timestamp
 
+    def timestamps(self, fmt, values):
+        if len(fmt.columns) > 0 and fmt.columns[0] == 'TimeMS':
+            return self.timebase + values['TimeMS']*0.001
+        if fmt.name in ['GPS', 'GPS2'] and 'T' in fmt.colhash:
+            return self.timebase + values['T']*0.001
+        return None
+
 
 class DFReaderClock_px4(DFReaderClock):
     '''DFReaderClock_px4 - a format where a starting time is explicitly
@@ -640,6 +824,30 @@ class DFReaderClock_gps_interpolated(DFReaderClock):
         m._timestamp = self.timebase + count/rate
 
 
+class DFReaderClock_lazy(object):
+    '''placeholder for the clock of a log which hasn't been worked out
+    yet. The reader's real clock is found the first time a message needs
+    a timestamp, and replaces this one'''
+    def __init__(self, reader):
+        self.reader = reader
+
+    def resolve(self):
+        '''work out the real clock, returning it'''
+        return self.reader.resolve_clock()
+
+    def rewind_event(self):
+        pass
+
+    def message_arrived(self, m):
+        self.resolve().message_arrived(m)
+
+    def set_message_timestamp(self, m):
+        self.resolve().set_message_timestamp(m)
+
+    def timestamps(self, fmt, values):
+        return self.resolve().timestamps(fmt, values)
+
+
 class DFMetaData(object):
     '''handle dataflash messages metadata'''
     def __init__(self, parent):
@@ -1021,22 +1229,37 @@ class DFReader(object):
                 self.flightmode = mavutil.mode_string_acm(m.Mode)
         if type == 'STAT' and 'MainState' in m._fieldnames:
             self.flightmode = mavutil.mode_string_px4(m.MainState)
-        if type == 'PARM' and getattr(m, 'Name', None) is not None:
-            self.params[m.Name] = m.Value
-            if hasattr(m,'Default') and not math.isnan(m.Default):
-                if not hasattr(self,'param_defaults'):
-                    self.param_defaults = {}
-                self.param_defaults[m.Name] = m.Default
+        if type == 'PARM':
+            self._param_arrived(m)
         self._set_time(m)
 
-    def recv_match(self, condition=None, type=None, blocking=False, strict=False):
+    def _param_arrived(self, m):
+        '''record the value and default of a PARM message'''
+        if getattr(m, 'Name', None) is None:
+            return
+        self.params[m.Name] = m.Value
+        if hasattr(m,'Default') and not math.isnan(m.Default):
+            if not hasattr(self,'param_defaults'):
+                self.param_defaults = {}
+            self.param_defaults[m.Name] = m.Default
+
+    def _skip_to_time(self, t):
+        '''skip forward towards time t, where the log can be searched'''
+        pass
+
+    def recv_match(self, condition=None, type=None, blocking=False, strict=False,
+                   start_time=None, end_time=None):
         '''recv the next message that matches the given condition
-        type can be a string or a list of strings'''
+        type can be a string or a list of strings. If start_time or
+        end_time are given only messages with timestamps in that range
+        are returned, seeking forward to start_time where possible'''
         if type is not None:
             if isinstance(type, str):
                 type = set([type])
             elif isinstance(type, list):
                 type = set(type)
+        if start_time is not None:
+            self._skip_to_time(start_time)
         while True:
             if type is not None:
                 self.skip_to_type(type, strict=strict)
@@ -1045,6 +1268,10 @@ class DFReader(object):
                 return None
             if type is not None and not m.get_type() in type:
                 continue
+            if end_time is not None and m._timestamp > end_time:
+                return None
+            if start_time is not None and m._timestamp < start_time:
+                continue
             if not mavutil.evaluate_condition(condition, self.messages):
                 continue
             return m
@@ -1096,9 +1323,11 @@ class DFReader(object):
 
 class DFReader_binary(DFReader):
     '''parse a binary dataflash file'''
-    def __init__(self, filename, zero_time_base=False, progress_callback=None):
+    def __init__(self, filename, zero_time_base=False, progress_callback=None,
+                 cache_index=None, index_threads=None):
         DFReader.__init__(self)
         # read the whole file into memory for simplicity
+        self.filename = filename
         self.filehandle = open(filename, 'rb')
         self.filehandle.seek(0, 2)
         self.data_len = self.filehandle.tell()
@@ -1120,32 +1349,504 @@ class DFReader_binary(DFReader):
         }
         self._zero_time_base = zero_time_base
         self.prev_type = None
-        default_fast_index = '1' if dfindexer.available else '0'
-        use_fast_indexer = os.getenv('PYMAVLINK_FAST_INDEX', default_fast_index) == '1'
-        if use_fast_indexer and not dfindexer.available:
-            print("Warning: dfindexer is not available. Falling back to legacy indexer.")
-            print("You may need to pip install pymavlink again with PYMAVLINK_FAST_INDEX=1")
-            use_fast_indexer = False
-        if use_fast_indexer and dfindexer.available:
-            self.init_arrays_fast(progress_callback=progress_callback)
-        else:
-            self.init_arrays(progress_callback=progress_callback)
-        self.init_clock()
+        # the clock as it was when first worked out, before any messages
+        # were read, which iter_messages() starts from
+        self._initial_clock = None
+        # built by seek_time() when first needed
+        self._time_index_cache = None
+        # optionally keep the results of indexing in a sidecar file so
+        # the next open of the same log can skip the scans below
+        if cache_index is None:
+            cache_index = os.getenv('PYMAVLINK_INDEX_CACHE', '0') == '1'
+        if not cache_index or not self.load_index():
+            # without the compiled dfindexer the fast indexer uses a
+            # slower pure Python scan, which is still much faster than
+            # the legacy indexer
+            use_fast_indexer = os.getenv('PYMAVLINK_FAST_INDEX', '1') == '1'
+            if use_fast_indexer:
+                # the fast indexer can split large logs across threads
+                if index_threads is None:
+                    index_threads = int(os.getenv('PYMAVLINK_INDEX_THREADS', '1'))
+                self.init_arrays_fast(progress_callback=progress_callback,
+                                      index_threads=index_threads)
+            else:
+                self.init_arrays(progress_callback=progress_callback)
+            # the clock is worked out when it is first needed, so opening
+            # a log only costs as much as indexing it
+            self._find_gps_week()
+            self.clock = DFReaderClock_lazy(self)
+            if cache_index:
+                self.save_index()
         self.prev_type = None
         self._rewind(keep_messages=True)
+        # the messages a freshly opened log starts with, which
+        # seek_offset() starts from
+        self._initial_messages = dict(self.messages)
 
     def _rewind(self, keep_messages=False):
         '''rewind to start of log'''
+        if self._initial_clock is not None:
+            # clocks which learn from the log as it is read, or have been
+            # moved by seek_time(), start again as they were first set up
+            self._restore_clock(self._initial_clock)
         DFReader._rewind(self, keep_messages=keep_messages)
         self.offset = 0
         self.remaining = self.data_len
         self.type_nums = None
         self.timestamp = 0
 
+    def _restore_clock(self, state):
+        '''put the clock back into a state copied from it earlier'''
+        self.clock.__dict__.update(copy.deepcopy(state.__dict__))
+
     def rewind(self):
         '''rewind to start of log'''
         self._rewind()
 
+    def _type_offsets(self, name):
+        '''return the offsets of all messages of one type'''
+        if name not in self.name_to_id:
+            return []
+        mtype = self.name_to_id[name]
+        return self.offsets[mtype][:self.counts[mtype]]
+
+    def _message_at(self, ofs):
+        '''decode the message at ofs without it affecting the state of the
+        reader, returning None if it is truncated'''
+        mtype = self.data_map[ofs+2]
+        fmt = self.formats[mtype]
+        body = self.data_map[ofs+3:ofs+fmt.len]
+        if len(body)+3 < fmt.len:
+            return None
+        if not mtype in self.unpackers:
+            self.unpackers[mtype] = struct.Struct(fmt.msg_struct).unpack
+        elements = list(self.unpackers[mtype](body))
+        for a_index in fmt.a_indexes:
+            elements[a_index] = array.array('h', elements[a_index])
+        return fmt.message_class(fmt, elements, True, self)
+
+    def iter_messages(self, types=None, track_state=False):
+        '''iterate over the messages in the log, or only those with a type
+        name in types, in log order.
+
+        With track_state=False messages are decoded straight from the
+        offset index without changing the state of the reader: the
+        position, self.messages, params and flight mode are left alone,
+        which makes this much cheaper than recv_match() for exports which
+        only want the messages. Timestamps are worked out by a private
+        copy of the clock, and are the same as recv_match() with
+        strict=True gives on a freshly opened log.
+
+        With track_state=True the log is rewound and read with
+        recv_match(), so the reader's state follows the messages returned.
+        '''
+        if types is not None:
+            types = set([types]) if isinstance(types, str) else set(types)
+        if track_state:
+            self._rewind()
+            while True:
+                m = self.recv_match(type=types, strict=True)
+                if m is None:
+                    return
+                yield m
+
+        if types is None:
+            type_ids = [t for t in range(256) if self.counts[t] > 0]
+        else:
+            type_ids = [self.name_to_id[n] for n in types if n in self.name_to_id]
+        streams = [self.offsets[t][:self.counts[t]] for t in type_ids]
+        if len(streams) == 1:
+            offsets = streams[0]
+        else:
+            offsets = heapq.merge(*streams)
+
+        self.resolve_clock()
+        clock = copy.deepcopy(self._initial_clock)
+        if clock is not None:
+            clock.rewind_event()
+        message_at = self._message_at
+        for ofs in offsets:
+            m = message_at(ofs)
+            if m is None:
+                continue
+            m._timestamp = 0
+            if clock is not None:
+                clock.message_arrived(m)
+                if len(m._fieldnames) > 0:
+                    clock.set_message_timestamp(m)
+            yield m
+
+    def _time_index(self):
+        '''return the sparse time index of the log, building it if needed.
+
+        The index is a tuple of three lists in log order: the largest
+        timestamp seen up to each sampled message, which can be binary
+        searched, the offset of the message, and the state of the clock
+        just before the message or None if the clock doesn't need one.
+
+        For clocks which can timestamp a message on its own only the time
+        field of every TIME_INDEX_SPACING'th message of each timestamped
+        type is read. Other clocks need the whole log to be replayed once.
+        '''
+        if self._time_index_cache is not None:
+            return self._time_index_cache
+        self.resolve_clock()
+        clock = copy.deepcopy(self._initial_clock)
+        samples = []
+        if clock is not None:
+            clock.rewind_event()
+            for mtype in range(256):
+                if self.counts[mtype] == 0:
+                    continue
+                fmt = self.formats[mtype]
+                offsets = self.offsets[mtype][:self.counts[mtype]]
+                if offsets[0] + fmt.len > self.data_len:
+                    continue
+                unpack = struct.Struct(fmt.msg_struct).unpack_from
+                values = dict(zip(fmt.columns, unpack(self.data_map, offsets[0]+3)))
+                if clock.timestamps(fmt, values) is None:
+                    continue
+                for ofs in offsets[::TIME_INDEX_SPACING]:
+                    if ofs + fmt.len > self.data_len:
+                        break
+                    values = dict(zip(fmt.columns, unpack(self.data_map, ofs+3)))
+                    samples.append((ofs, clock.timestamps(fmt, values), None))
+            if len(samples) == 0:
+                samples = self._replay_time_samples(clock)
+        samples.sort()
+        keys = []
+        latest = None
+        for (ofs, t, state) in samples:
+            if latest is None or t > latest:
+                latest = t
+            keys.append(latest)
+        self._time_index_cache = (keys, [s[0] for s in samples], [s[2] for s in samples])
+        return self._time_index_cache
+
+    def _replay_time_samples(self, clock):
+        '''sample the timestamps of every TIME_INDEX_SPACING'th message by
+        replaying the whole log through clock, keeping the state of the
+        clock before each sample'''
+        streams = [self.offsets[t][:self.counts[t]] for t in range(256) if self.counts[t] > 0]
+        samples = []
+        for (i, ofs) in enumerate(heapq.merge(*streams)):
+            state = None
+            if i % TIME_INDEX_SPACING == 0:
+                state = copy.deepcopy(clock)
+            m = self._message_at(ofs)
+            if m is None:
+                break
+            m._timestamp = 0
+            clock.message_arrived(m)
+            if len(m._fieldnames) > 0:
+                clock.set_message_timestamp(m)
+            if state is not None:
+                samples.append((ofs, m._timestamp, state))
+        return samples
+
+    def _peek_timestamp(self):
+        '''return the timestamp the message at the current offset will be
+        given, without reading it, or None if there isn't a valid message
+        there'''
+        ofs = self.offset
+        if self.data_len - ofs < 3:
+            return None
+        if self.data_map[ofs] != self.HEAD1 or self.data_map[ofs+1] != self.HEAD2:
+            return None
+        fmt = self.formats.get(self.data_map[ofs+2], None)
+        if fmt is None or ofs + fmt.len > self.data_len:
+            return None
+        values = dict(zip(fmt.columns, struct.unpack_from(fmt.msg_struct, self.data_map, ofs+3)))
+        t = self.clock.timestamps(fmt, values)
+        if t is None:
+            # messages without a time of their own follow the last one
+            t = self.clock.timestamp
+        return t
+
+    def seek_time(self, t):
+        '''position the reader at the first message with a timestamp of at
+        least t, so that it is the next one returned by recv_msg() or
+        recv_match().
+
+        The sparse time index is binary searched for the last sampled
+        message before t, and the log is read forward from there. The
+        latest message of each type before that point is loaded into
+        self.messages and the flight mode is set from them, but params
+        are left as they were, as for rewind().
+        '''
+        (keys, offsets, states) = self._time_index()
+        i = bisect.bisect_left(keys, t) - 1
+        replayed = self._seek_sample(i)
+        if self.clock is None:
+            return
+
+        # read forward to the first message at or after t
+        while True:
+            saved = None
+            if replayed:
+                saved = (self.offset, copy.deepcopy(self.clock))
+            else:
+                peek = self._peek_timestamp()
+                if peek is not None and peek >= t:
+                    break
+            m = self._parse_next()
+            if m is None:
+                break
+            if saved is not None and m._timestamp >= t:
+                self.offset = saved[0]
+                self._restore_clock(saved[1])
+                break
+        self.remaining = self.data_len - self.offset
+
+    def _seek_sample(self, i, messages=None):
+        '''position the reader at the i'th message of the sparse time
+        index, or the start of the log if i is negative, loading the
+        latest message of each type before it over messages if given.
+        Returns True if the clock was restored from a replayed index'''
+        (keys, offsets, states) = self._time_index()
+        self._rewind()
+        if messages is not None:
+            self.messages.update(messages)
+        # a replayed index keeps the state of the clock at each sample,
+        # which has to be restored and can't be used to peek at messages
+        replayed = len(states) > 0 and states[0] is not None
+        if i >= 0:
+            ofs = offsets[i]
+            # pick up the latest message of each type before the sample
+            latest = []
+            for mtype in range(256):
+                count = self.counts[mtype]
+                if count == 0:
+                    continue
+                j = bisect.bisect_left(self.offsets[mtype], ofs, 0, count)
+                if j > 0:
+                    latest.append(self.offsets[mtype][j-1])
+            for prev in sorted(latest):
+                m = self._message_at(prev)
+                if m is not None:
+                    self._add_msg(m)
+            if replayed:
+                self._restore_clock(states[i])
+            else:
+                self.clock.timestamp = keys[i]
+            self.offset = ofs
+        return replayed
+
+    def seek_offset(self, start, end=None):
+        '''position the reader at the first message at or after offset
+        start, so that the reader is as it would be after reading the log
+        from when it was opened up to there, apart from params. If end is
+        given the log is read as if it stopped there, until the next
+        call'''
+        (keys, offsets, states) = self._time_index()
+        self.data_len = len(self.data_map)
+        self._seek_sample(bisect.bisect_right(offsets, start) - 1,
+                          messages=self._initial_messages)
+        # read the messages from the sample up to start, going by the
+        # index so that bad data just before start doesn't make the
+        # parser run on into the first message after it
+        types = [t for t in range(256) if self.counts[t] > 0]
+        cursor = mavutil.TypeCursor([self.offsets[t] for t in types],
+                                    [self.counts[t] for t in types])
+        cursor.seek(self.offset)
+        while True:
+            ofs = cursor.next()
+            if ofs is None or ofs >= start:
+                break
+            self.offset = ofs
+            self._parse_next()
+        if start > 0:
+            self.offset = self.data_len if ofs is None else ofs
+        if end is not None:
+            self.data_len = min(end, self.data_len)
+        self.remaining = self.data_len - self.offset
+
+    def _skip_to_time(self, t):
+        '''seek forward to time t if that skips part of the log'''
+        (keys, offsets, states) = self._time_index()
+        i = bisect.bisect_left(keys, t) - 1
+        if i >= 0 and self.offset < offsets[i]:
+            self.seek_time(t)
+
+    def _find_gps_week(self):
+        '''find the first GPS message with a valid week number, if the log
+        has modern GPS messages, loading the parameters which come before
+        it. Only the GPS and PARM messages are read'''
+        first_modern_gps_message = None
+        stop = self.data_len
+        gps_offsets = self._type_offsets('GPS')
+        if len(gps_offsets) > 0:
+            fmt = self.formats[self.name_to_id['GPS']]
+            if 'TimeUS' in fmt.colhash and 'GWk' in fmt.colhash and 'GMS' in fmt.colhash:
+                # only the week number is needed to find the first fix
+                (gwk_ofs, gwk_struct) = fmt.field_unpacker('GWk')
+                last = None
+                for ofs in gps_offsets:
+                    if ofs + fmt.len > self.data_len:
+                        break
+                    last = ofs
+                    if gwk_struct.unpack_from(self.data_map, ofs+gwk_ofs)[0] > 0:
+                        stop = ofs
+                        break
+                if last is not None:
+                    first_modern_gps_message = self._message_at(last)
+            else:
+                # not a modern GPS message
+                stop = gps_offsets[0]
+        for ofs in self._type_offsets('PARM'):
+            if ofs >= stop:
+                break
+            m = self._message_at(ofs)
+            if m is None:
+                break
+            self._param_arrived(m)
+        self._first_modern_gps = (first_modern_gps_message, stop)
+
+    def resolve_clock(self):
+        '''make sure the clock for the log has been worked out, returning it'''
+        if isinstance(self.clock, DFReaderClock_lazy):
+            self.init_clock()
+            self._initial_clock = copy.deepcopy(self.clock)
+        return self.clock
+
+    def _replay_clock(self, clock, types, stop):
+        '''pass the messages of the given type IDs up to and including the
+        one at offset stop to a clock, in log order'''
+        streams = []
+        for mtype in types:
+            offsets = self.offsets[mtype][:self.counts[mtype]]
+            streams.append(offsets[:bisect.bisect_right(offsets, stop)])
+        for ofs in heapq.merge(*streams):
+            m = self._message_at(ofs)
+            if m is None:
+                break
+            clock.message_arrived(m)
+
+    def init_clock(self):
+        '''work out time basis for the log.
+
+        This makes the same choice as DFReader.init_clock, but instead of
+        reading the log from the start it uses the offset index to go
+        straight to the messages which can decide the clock: GPS, GPS2 and
+        TIME messages and the first message with each of TimeUS and TimeMS
+        '''
+        if getattr(self, '_first_modern_gps', None) is None:
+            self._find_gps_week()
+        (first_modern_gps_message, gps_week_stop) = self._first_modern_gps
+
+        # speculatively create a gps clock in case we don't find anything
+        # better
+        gps_clock = DFReaderClock_gps_interpolated()
+        self.clock = gps_clock
+
+        px4_msg_time = None
+        px4_msg_gps = None
+        gps_interp_msg_gps1 = None
+        first_us_stamp = None
+        first_ms_stamp = None
+
+        have_good_clock = False
+
+        streams = [self._type_offsets('GPS'),
+                   self._type_offsets('GPS2'),
+                   self._type_offsets('TIME')]
+        first_stamps = []
+        for (mtype, fmt) in self.formats.items():
+            if self.counts[mtype] > 0 and \
+               ('TimeUS' in fmt.colhash or 'TimeMS' in fmt.colhash):
+                first_stamps.append(self.offsets[mtype][0])
+        streams.append(sorted(first_stamps))
+
+        last_ofs = None
+        for ofs in heapq.merge(*streams):
+            if ofs == last_ofs:
+                continue
+            last_ofs = ofs
+            m = self._message_at(ofs)
+            if m is None:
+                break
+
+            type = m.get_type()
+
+            if first_us_stamp is None:
+                first_us_stamp = getattr(m, "TimeUS", None)
+                if first_modern_gps_message is not None and first_us_stamp is not None:
+                    # If we never got a valid time out of that message, then
+                    # we don't have a good clock
+                    if first_modern_gps_message.GWk <= 0:
+                        break
+                    # we have a valid GPS time and a valid TimeUS
+                    self.init_clock_usec()
+                    if not self._zero_time_base:
+                        self.clock.find_time_base(first_modern_gps_message, first_us_stamp)
+                    have_good_clock = True
+                    break
+
+            if first_ms_stamp is None and (type != 'GPS' and type != 'GPS2'):
+                # Older GPS messages use TimeMS for msecs past start
+                # of gps week
+                first_ms_stamp = getattr(m, "TimeMS", None)
+
+            if type == 'GPS' or type == 'GPS2':
+                if getattr(m, "TimeUS", 0) != 0 and \
+                   getattr(m, "GWk", 0) != 0:  # everything-usec-timestamped
+                    self.init_clock_usec()
+                    if not self._zero_time_base:
+                        self.clock.find_time_base(m, first_us_stamp)
+                    have_good_clock = True
+                    break
+                if getattr(m, "T", 0) != 0 and \
+                   getattr(m, "Week", 0) != 0:  # GPS is msec-timestamped
+                    if first_ms_stamp is None:
+                        first_ms_stamp = m.T
+                    self.init_clock_msec()
+                    if not self._zero_time_base:
+                        self.clock.find_time_base(m, first_ms_stamp)
+                    have_good_clock = True
+                    break
+                if getattr(m, "GPSTime", 0) != 0:  # px4-style-only
+                    px4_msg_gps = m
+                if getattr(m, "Week", 0) != 0:
+                    if (gps_interp_msg_gps1 is not None and
+                        (gps_interp_msg_gps1.TimeMS != m.TimeMS or
+                         gps_interp_msg_gps1.Week != m.Week)):
+                        # we've received two distinct, non-zero GPS
+                        # packets without finding a decent clock to
+                        # use; fall back to interpolation. The
+                        # interpolating clock learns message rates from
+                        # everything read so far, so show it the
+                        # messages a full read would have
+                        self._replay_clock(gps_clock,
+                                           [self.name_to_id[n] for n in ['GPS', 'PARM'] if n in self.name_to_id],
+                                           gps_week_stop)
+                        gps_clock.rewind_event()
+                        self._replay_clock(gps_clock, range(256), ofs)
+                        self.init_clock_gps_interpolated(gps_clock)
+                        have_good_clock = True
+                        break
+                    gps_interp_msg_gps1 = m
+
+            elif type == 'TIME':
+                '''only px4-style logs use TIME'''
+                if getattr(m, "StartTime", None) is not None:
+                    px4_msg_time = m
+
+            if px4_msg_time is not None and px4_msg_gps is not None:
+                self.init_clock_px4(px4_msg_time, px4_msg_gps)
+                have_good_clock = True
+                break
+
+        if not have_good_clock:
+            # we failed to find any GPS messages to set a time
+            # base for usec and msec clocks.  Also, not a
+            # PX4-style log
+            if first_us_stamp is not None:
+                self.init_clock_usec()
+            elif first_ms_stamp is not None:
+                self.init_clock_msec()
+
+        self.clock.rewind_event()
+
     def init_arrays(self, progress_callback=None):
         '''initialise arrays for fast recv_match()'''
         offsets = []
@@ -1154,9 +1855,10 @@ class DFReader_binary(DFReader):
         self._count = 0
         self.name_to_id = {}
         self.id_to_name = {}
+        self._seed_offsets = []
         type_instances = {}
         for i in range(256):
-            offsets.append([])
+            offsets.append(array.array('Q'))
             counts.append(0)
         fmt_type = 0x80
         fmtu_type = None
@@ -1190,6 +1892,7 @@ class DFReader_binary(DFReader):
                     break
                 self.offset = ofs
                 self._parse_next()
+                self._seed_offsets.append(ofs)
                 fmt = formats[mtype]
                 lengths[mtype] = fmt.len
             elif formats[mtype].instance_field is not None:
@@ -1203,6 +1906,7 @@ class DFReader_binary(DFReader):
                     type_instances[mtype].add(idata)
                     self.offset = ofs
                     self._parse_next()
+                    self._seed_offsets.append(ofs)
 
             counts[mtype] += 1
             mlen = lengths[mtype]
@@ -1278,17 +1982,21 @@ class DFReader_binary(DFReader):
 
         self.offsets = offsets
         self.counts = counts
+        self._type_cursors = {}
         self.formats = formats
         for i in range(256):
             self._count += counts[i]
         self.offset = 0
 
-    def init_arrays_fast(self, progress_callback=None):
-        '''initialise arrays for fast recv_match(), but with Cython'''
+    def init_arrays_fast(self, progress_callback=None, index_threads=1):
+        '''initialise arrays for fast recv_match(), but with Cython, or a
+        pure Python scan if dfindexer isn't compiled. With index_threads > 1
+        large logs are scanned in parallel'''
 
         self._count = 0
         self.name_to_id = {}
         self.id_to_name = {}
+        self._seed_offsets = []
         type_instances = {}
 
         data = memoryview(self.data_map)
@@ -1311,16 +2019,45 @@ class DFReader_binary(DFReader):
                 assert col_len == 1, "Unexpected format for FMT.Length"
             offset += col_len
 
-        offsets = dfindexer.build_offsets(
-            data,
-            fmt_type,
-            fmt_fmt.len,
-            type_offset,
-            size_offset,
-            self.HEAD1,
-            self.HEAD2,
-            progress_callback=progress_callback
-        )
+        if not dfindexer.available:
+            offsets = dfindexer.build_offsets_python(
+                self.data_map,
+                fmt_type,
+                fmt_fmt.len,
+                type_offset,
+                size_offset,
+                self.HEAD1,
+                self.HEAD2,
+                progress_callback=progress_callback
+            )
+            if offsets is None:
+                # the log needs the legacy indexer to follow it
+                del data
+                self.init_arrays(progress_callback=progress_callback)
+                return
+        elif index_threads > 1:
+            offsets = dfindexer.build_offsets_parallel(
+                self.data_map,
+                fmt_type,
+                fmt_fmt.len,
+                type_offset,
+                size_offset,
+                self.HEAD1,
+                self.HEAD2,
+                index_threads,
+                progress_callback=progress_callback
+            )
+        else:
+            offsets = dfindexer.build_offsets(
+                data,
+                fmt_type,
+                fmt_fmt.len,
+                type_offset,
+                size_offset,
+                self.HEAD1,
+                self.HEAD2,
+                progress_callback=progress_callback
+            )
 
         # Parse the FMT messages
         for ofs in offsets[fmt_type]:
@@ -1410,6 +2147,7 @@ class DFReader_binary(DFReader):
                 if fmt.name not in self.messages:
                     self.offset = ofs
                     self._parse_next()
+                    self._seed_offsets.append(ofs)
                 if fmt.instance_field is not None:
                     # see if we've had this instance value before
                     idata = data[ofs+3+fmt.instance_ofs:ofs+3+fmt.instance_ofs+fmt.instance_len]
@@ -1418,12 +2156,189 @@ class DFReader_binary(DFReader):
                         type_instances[mtype].add(idata)
                         self.offset = ofs
                         self._parse_next()
+                        self._seed_offsets.append(ofs)
 
         self.offsets = offsets
         self.counts = [len(offsets[i]) for i in range(256)]
+        self._type_cursors = {}
         self._count = sum(self.counts)
         self.offset = 0
 
+    def to_arrays(self, type, fields=None, chunk_size=65536):
+        '''return all messages of one type as a numpy structured array.
+
+        fields is a list of column names to extract, defaulting to all
+        columns. Multipliers are applied as for DFMessage, array fields
+        ('a') become int16[32] and string fields are returned as fixed
+        width bytes. A 'timestamp' field is added with the same value
+        recv_match() would give the message; for logs where that can't be
+        derived from the message itself the log is read in order to find
+        the timestamps, which rewinds it.
+
+        Messages are decoded straight from the offset index, chunk_size
+        messages at a time, without changing the reader position.
+        '''
+        import numpy as np
+        if type not in self.name_to_id:
+            raise KeyError("No messages of type %s in log" % type)
+        mtype = self.name_to_id[type]
+        fmt = self.formats[mtype]
+        if fields is None:
+            fields = fmt.columns
+        for field in fields:
+            if field not in fmt.colhash:
+                raise KeyError("Message %s has no field %s" % (type, field))
+        wire_dtype = fmt.get_dtype()
+
+        out_dtype = []
+        for field in fields:
+            i = fmt.colhash[field]
+            if fmt.msg_mults[i] is not None:
+                out_dtype.append((field, '<f8'))
+            else:
+                out_dtype.append((field, wire_dtype.fields[field][0]))
+        out_dtype.append(('timestamp', '<f8'))
+
+        offsets = np.asarray(self.offsets[mtype][:self.counts[mtype]], dtype=np.int64)
+        # the last message may be truncated
+        offsets = offsets[offsets + fmt.len <= self.data_len]
+        count = len(offsets)
+        out = np.empty(count, dtype=out_dtype)
+        have_timestamps = True
+
+        data = np.frombuffer(self.data_map, dtype=np.uint8)
+        row = np.arange(fmt.len, dtype=np.int64)
+        for start in range(0, count, chunk_size):
+            end = min(start + chunk_size, count)
+            # gather the messages into a contiguous block and reinterpret
+            # it using the wire layout
+            block = data[offsets[start:end, None] + row]
+            values = block.view(wire_dtype).reshape(-1)
+            for field in fields:
+                i = fmt.colhash[field]
+                mul = fmt.msg_mults[i]
+                if mul is None:
+                    out[field][start:end] = values[field]
+                elif mul > 0.0 and mul < 1.0:
+                    # divide for consistency with DFMessage.__getattr__
+                    out[field][start:end] = values[field] / (1/mul)
+                else:
+                    out[field][start:end] = values[field] * mul
+            timestamps = None
+            if self.clock is not None:
+                timestamps = self.clock.timestamps(fmt, values)
+            if timestamps is None:
+                have_timestamps = False
+            else:
+                out['timestamp'][start:end] = timestamps
+        del data
+
+        if count > 0 and not have_timestamps:
+            # fall back to the clock's view of the log as it is read
+            self._rewind(keep_messages=True)
+            i = 0
+            while i < count:
+                m = self.recv_match(type=type, strict=True)
+                if m is None:
+                    break
+                out['timestamp'][i] = m._timestamp
+                i += 1
+            self._rewind(keep_messages=True)
+        return out
+
+    def _index_key(self):
+        '''key used to validate a sidecar index against this log'''
+        return logindex.file_key(self.filename, self.data_map,
+                                 kind='dataflash',
+                                 zero_time_base=bool(self._zero_time_base))
+
+    def save_index(self):
+        '''save the offset index, format table and clock to a sidecar file'''
+        formats = []
+        for fmt in self.formats.values():
+            formats.append([fmt.type, fmt.name, fmt.len, fmt.format,
+                            ','.join(fmt.columns), fmt.units, fmt.instance_field])
+        clock = None
+        if self.clock is not None:
+            self.resolve_clock()
+            clock = [self._initial_clock.__class__.__name__, self._initial_clock.__dict__]
+        meta = {
+            'formats': formats,
+            'name_to_id': self.name_to_id,
+            'unit_lookup': self.unit_lookup,
+            'mult_lookup': self.mult_lookup,
+            'clock': clock,
+            'params': self.params,
+            'param_defaults': getattr(self, 'param_defaults', None),
+            'mav_type': self.mav_type,
+        }
+        arrays = {
+            'counts': self.counts,
+            'seeds': sorted(self._seed_offsets),
+        }
+        for i in range(256):
+            if len(self.offsets[i]) > 0:
+                arrays['offsets.%u' % i] = self.offsets[i]
+        try:
+            return logindex.save(self.filename, self._index_key(), meta, arrays)
+        except (TypeError, ValueError):
+            # something in the metadata is not serialisable
+            return False
+
+    def load_index(self):
+        '''load the offset index, format table and clock from a sidecar
+        file. Returns False if there is no valid index for this log'''
+        try:
+            loaded = logindex.load(self.filename, self._index_key())
+        except (KeyError, TypeError, ValueError):
+            loaded = None
+        if loaded is None:
+            return False
+        (meta, arrays) = loaded
+        clock_classes = {
+            'DFReaderClock_usec': DFReaderClock_usec,
+            'DFReaderClock_msec': DFReaderClock_msec,
+            'DFReaderClock_px4': DFReaderClock_px4,
+            'DFReaderClock_gps_interpolated': DFReaderClock_gps_interpolated,
+        }
+
+        for (ftype, name, flen, format, columns, units, instance_field) in meta['formats']:
+            fmt = DFFormat(ftype, name, flen, format, columns)
+            fmt.units = units
+            if instance_field is not None:
+                fmt.set_instance_field(fmt.colhash[instance_field])
+            self.formats[ftype] = fmt
+        self.name_to_id = meta['name_to_id']
+        self.id_to_name = {}
+        for (name, mtype) in self.name_to_id.items():
+            self.id_to_name[mtype] = name
+        self.unit_lookup = meta['unit_lookup']
+        self.mult_lookup = meta['mult_lookup']
+        empty = array.array('Q')
+        self.offsets = [arrays.get('offsets.%u' % i, empty) for i in range(256)]
+        self.counts = list(arrays['counts'])
+        self._type_cursors = {}
+        self._count = sum(self.counts)
+        self._seed_offsets = list(arrays['seeds'])
+
+        # re-parse the messages the scan would have parsed, so that
+        # self.messages has an entry for each type and instance
+        for ofs in self._seed_offsets:
+            self.offset = ofs
+            self._parse_next()
+        self.offset = 0
+
+        if meta['clock'] is not None:
+            (clock_name, clock_state) = meta['clock']
+            self.clock = clock_classes[clock_name]()
+            self.clock.__dict__.update(clock_state)
+            self._initial_clock = copy.deepcopy(self.clock)
+        self.params = meta['params']
+        if meta['param_defaults'] is not None:
+            self.param_defaults = meta['param_defaults']
+        self.mav_type = meta['mav_type']
+        return True
+
     def last_timestamp(self):
         '''get the last timestamp in the log'''
         highest_offset = 0
@@ -1454,29 +2369,22 @@ class DFReader_binary(DFReader):
             if not strict:
                 type = type.copy()
                 type.update(set(['MODE','MSG','PARM','STAT','ORGN','VER']))
-            self.indexes = []
-            self.type_nums = []
-            for t in type:
-                if not t in self.name_to_id:
-                    continue
-                self.type_nums.append(self.name_to_id[t])
-                self.indexes.append(0)
-        smallest_index = -1
-        smallest_offset = self.data_len
-        for i in range(len(self.type_nums)):
-            mtype = self.type_nums[i]
-            if self.indexes[i] >= self.counts[mtype]:
-                continue
-            ofs = self.offsets[mtype][self.indexes[i]]
-            if ofs < smallest_offset:
-                smallest_offset = ofs
-                smallest_index = i
-        if smallest_index >= 0:
-            self.indexes[smallest_index] += 1
-            self.offset = smallest_offset
-        if smallest_index == -1:
+            self.type_nums = sorted(set([self.name_to_id[t] for t in type if t in self.name_to_id]))
+            key = tuple(self.type_nums)
+            if key not in self._type_cursors:
+                self._type_cursors[key] = mavutil.TypeCursor(
+                    [self.offsets[t] for t in self.type_nums],
+                    [self.counts[t] for t in self.type_nums])
+            self._type_cursor = self._type_cursors[key]
+            # start from the current position, which may not be the
+            # start of the log after seek_time()
+            self._type_cursor.seek(self.offset)
+        ofs = self._type_cursor.next()
+        if ofs is None:
             # no more messages
             self.offset = self.data_len
+        else:
+            self.offset = ofs
 
     def _parse_next(self):
         '''read one message, returning it as an object'''
@@ -1571,7 +2479,7 @@ class DFReader_binary(DFReader):
 
         self.offset += fmt.len - 3
         self.remaining = self.data_len - self.offset
-        m = DFMessage(fmt, elements, True, self)
+        m = fmt.message_class(fmt, elements, True, self)
 
         if m.fmt.name == 'FMTU':
             # add to units information
@@ -1683,6 +2591,7 @@ class DFReader_text(DFReader):
         '''initialise arrays for fast recv_match()'''
         self.offsets = {}
         self.counts = {}
+        self._type_cursors = {}
         self._count = 0
         ofs = self.offset
         pct = 0
@@ -1729,26 +2638,17 @@ class DFReader_text(DFReader):
             self.type_list = type.copy()
             if not strict:
                 self.type_list.update(set(['MODE','MSG','PARM','STAT','ORGN','VER']))
-            self.type_list = list(self.type_list)
-            self.indexes = []
-            self.type_nums = []
-            for t in self.type_list:
-                self.indexes.append(0)
-        smallest_index = -1
-        smallest_offset = self.data_len
-        for i in range(len(self.type_list)):
-            mtype = self.type_list[i]
-            if not mtype in self.counts:
-                continue
-            if self.indexes[i] >= self.counts[mtype]:
-                continue
-            ofs = self.offsets[mtype][self.indexes[i]]
-            if ofs < smallest_offset:
-                smallest_offset = ofs
-                smallest_index = i
-        if smallest_index >= 0:
-            self.indexes[smallest_index] += 1
-            self.offset = smallest_offset
+            self.type_list = sorted([t for t in self.type_list if t in self.counts])
+            key = tuple(self.type_list)
+            if key not in self._type_cursors:
+                self._type_cursors[key] = mavutil.TypeCursor(
+                    [self.offsets[t] for t in self.type_list],
+                    [self.counts[t] for t in self.type_list])
+            self._type_cursor = self._type_cursors[key]
+            self._type_cursor.seek(0)
+        ofs = self._type_cursor.next()
+        if ofs is not None:
+            self.offset = ofs
 
     def _parse_next(self):
         '''read one message, returning it as an object'''
@@ -1813,7 +2713,7 @@ class DFReader_text(DFReader):
             self.name_to_id[fname] = ftype
 
         try:
-            m = DFMessage(fmt, elements, False, self)
+            m = fmt.message_class(fmt, elements, False, self)
         except ValueError:
             return self._parse_next()
 
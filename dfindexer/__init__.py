@@ -1,6 +1,110 @@
+import array
+
 try:
-    from .dfindexer_cy import build_offsets
+    from .dfindexer_cy import build_offsets, scan_range
     available = True
 except ImportError:
     build_offsets = None
+    scan_range = None
     available = False
+
+from .pyindexer import build_offsets as build_offsets_python
+
+# smallest piece of a log worth handing to a separate thread
+MIN_CHUNK_SIZE = 1 << 20
+
+
+def find_formats(data_map, fmt_type, fmt_length, type_offset, length_offset,
+                 head1, head2):
+    '''find the message lengths defined by the FMT messages in a log,
+    returning a 256 byte table of lengths, or None if a type is defined
+    with two different lengths, in which case only a serial scan can
+    follow the log'''
+    lengths = bytearray(256)
+    lengths[fmt_type] = fmt_length
+    pattern = bytes([head1, head2, fmt_type])
+    data_len = len(data_map)
+    ofs = data_map.find(pattern)
+    while ofs != -1:
+        if ofs + fmt_length > data_len:
+            break
+        nxt = ofs + fmt_length
+        # the same bytes can turn up in the body of a message, so only
+        # believe FMT messages which are followed by another header
+        if (nxt + 2 > data_len or
+                (data_map[nxt] == head1 and data_map[nxt+1] == head2)):
+            mtype = data_map[ofs+type_offset]
+            mlen = data_map[ofs+length_offset]
+            if mlen >= 3:
+                if lengths[mtype] not in (0, mlen):
+                    return None
+                lengths[mtype] = mlen
+        ofs = data_map.find(pattern, ofs+1)
+    return lengths
+
+
+def build_offsets_parallel(data_map, fmt_type, fmt_length, type_offset, length_offset,
+                           head1, head2, threads, progress_callback=None,
+                           chunk_size=None):
+    '''scan a dataflash log using several threads, returning the same
+    per-type offsets as build_offsets. The log is split into chunks which
+    are scanned without holding the GIL; each chunk after the first has to
+    find its own way into sync with the message stream, so the start of
+    each chunk is checked against where the previous one finished and
+    rescanned if they disagree. Falls back to build_offsets for small logs
+    and logs whose message lengths change part way through'''
+    import concurrent.futures
+
+    data = memoryview(data_map)
+    data_len = len(data)
+    if chunk_size is None:
+        chunk_size = max(MIN_CHUNK_SIZE, data_len // (threads * 4) + 1)
+    if threads < 2 or data_len <= chunk_size:
+        lengths = None
+    else:
+        lengths = find_formats(data_map, fmt_type, fmt_length, type_offset, length_offset,
+                               head1, head2)
+    if lengths is None:
+        return build_offsets(data, fmt_type, fmt_length, type_offset, length_offset,
+                             head1, head2, progress_callback=progress_callback)
+    lengths = bytes(lengths)
+
+    bounds = [(start, min(start+chunk_size, data_len))
+              for start in range(0, data_len, chunk_size)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(scan_range, data, start, end, lengths,
+                                   head1, head2, resync=(start != 0))
+                   for (start, end) in bounds]
+        chunks = []
+        expected = 0
+        for (i, future) in enumerate(futures):
+            result = future.result()
+            (start, end) = bounds[i]
+            if result is not None and result[1] != expected:
+                # resynchronised somewhere other than where the previous
+                # chunk left off; follow on from the previous chunk instead
+                if expected >= end:
+                    result = ([], expected, expected)
+                else:
+                    result = scan_range(data, expected, end, lengths, head1, head2)
+            if result is None:
+                for f in futures:
+                    f.cancel()
+                return build_offsets(data, fmt_type, fmt_length, type_offset, length_offset,
+                                     head1, head2, progress_callback=progress_callback)
+            chunks.append(result[0])
+            expected = result[2]
+            if progress_callback is not None:
+                progress_callback(int((i + 1) * 100 / len(bounds)))
+
+    offsets = []
+    for mtype in range(256):
+        parts = [c[mtype] for c in chunks if len(c) and len(c[mtype])]
+        if len(parts) == 1:
+            offsets.append(parts[0])
+            continue
+        merged = array.array('Q')
+        for p in parts:
+            merged.frombytes(memoryview(p).cast('B'))
+        offsets.append(merged)
+    return offsets
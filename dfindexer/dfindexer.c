@@ -126,6 +126,86 @@ OffsetArray* scan_offsets(const uint8_t *data, size_t len,
     return results;
 }
 
+// Number of consecutive valid message headers needed before a scan
+// which starts part way through a log trusts that it is in sync
+#define RESYNC_CHAIN 4
+
+static bool valid_chain(const uint8_t *data, size_t len, size_t i,
+                        const uint8_t *lengths, uint8_t head1, uint8_t head2) {
+    for (int n = 0; n < RESYNC_CHAIN; n++) {
+        if (i + 3 >= len) {
+            // ran into the end of the log; nothing contradicts this
+            return true;
+        }
+        if (data[i] != head1 || data[i + 1] != head2) {
+            return false;
+        }
+        uint8_t mlen = lengths[data[i + 2]];
+        if (mlen == 0) {
+            return false;
+        }
+        i += mlen;
+    }
+    return true;
+}
+
+// Scan the messages starting in [start, end) using a fixed table of
+// message lengths. This doesn't touch any Python state, so several
+// ranges of one log can be scanned at once without the GIL. If resync
+// is set the scan may have started inside a message, so it skips ahead
+// to the first run of valid headers. On return *first is the offset the
+// scan synchronised at and *next is the offset just past the last
+// message, where the following range should start.
+OffsetArray* scan_offsets_range(const uint8_t *data, size_t len,
+                                size_t start, size_t end,
+                                const uint8_t *lengths,
+                                uint8_t head1, uint8_t head2,
+                                bool resync,
+                                size_t *first, size_t *next,
+                                int *status) {
+    OffsetArray *results = calloc(NUM_TYPES, sizeof(OffsetArray));
+    if (!results) panic("Memory allocation failed");
+
+    size_t i = start;
+    if (resync) {
+        // we may have started in the middle of a message
+        while (i < end && i + 3 < len &&
+               !valid_chain(data, len, i, lengths, head1, head2)) {
+            i++;
+        }
+    }
+    *first = i;
+    *status = SCAN_OK;
+
+    while (i < end && i + 3 < len) {
+        if (data[i] != head1 || data[i + 1] != head2) {
+            if (len - i >= 528 || len < 528) {
+                fprintf(stderr, "bad header 0x%02x%02x at %zu\n", data[i], data[i + 1], i);
+            }
+            i++;
+            continue;
+        }
+
+        uint8_t mtype = data[i + 2];
+        uint8_t mlen = lengths[mtype];
+        if (mlen == 0) {
+            // no FMT for this type; let the caller fall back to a full scan
+            free_offsets(results);
+            *next = i;
+            *status = SCAN_UNKNOWN_TYPE;
+            return NULL;
+        }
+
+        OffsetArray *arr = &results[mtype];
+        ensure_capacity(arr);
+        arr->data[arr->len++] = i;
+        i += mlen;
+    }
+    *next = i;
+
+    return results;
+}
+
 void free_offsets(OffsetArray *offsets)
 {
     if (!offsets) return;
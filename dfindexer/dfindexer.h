@@ -3,6 +3,7 @@
 
 #include <stdint.h>
 #include <stddef.h>
+#include <stdbool.h>
 #include <Python.h>
 
 typedef struct OffsetArray {
@@ -17,6 +18,18 @@ OffsetArray* scan_offsets(const uint8_t *data, size_t len,
                           uint8_t head1, uint8_t head2,
                           PyObject *progress_callback);
 
+// status codes from scan_offsets_range
+#define SCAN_OK 0
+#define SCAN_UNKNOWN_TYPE 1
+
+OffsetArray* scan_offsets_range(const uint8_t *data, size_t len,
+                                size_t start, size_t end,
+                                const uint8_t *lengths,
+                                uint8_t head1, uint8_t head2,
+                                bool resync,
+                                size_t *first, size_t *next,
+                                int *status);
+
 void free_offsets(OffsetArray *offsets);
 
 #endif
@@ -1,4 +1,6 @@
 from cpython.ref cimport PyObject, Py_INCREF, Py_DECREF
+from cpython.buffer cimport PyBUF_WRITABLE
+from libc.stdlib cimport free, realloc
 
 cdef extern from "dfindexer.h":
     cdef struct OffsetArray:
@@ -12,15 +14,93 @@ cdef extern from "dfindexer.h":
                               unsigned char head1, unsigned char head2,
                               PyObject* progress_callback)
 
-    void free_offsets(OffsetArray* offsets)
+    OffsetArray* scan_offsets_range(const unsigned char* data, size_t len,
+                                    size_t start, size_t end,
+                                    const unsigned char* lengths,
+                                    unsigned char head1, unsigned char head2,
+                                    bint resync,
+                                    size_t* first, size_t* next,
+                                    int* status) nogil
+
+    void free_offsets(OffsetArray* offsets) nogil
+
+    cdef int SCAN_OK
+
+
+cdef class OffsetBuffer:
+    '''read-only buffer of uint64 offsets which owns the memory allocated
+    by scan_offsets, so the offsets can be handed to Python without
+    copying them'''
+    cdef unsigned long long* data
+    cdef unsigned long long empty
+    cdef Py_ssize_t length
+    cdef Py_ssize_t shape[1]
+    cdef Py_ssize_t strides[1]
+
+    def __cinit__(self):
+        self.data = NULL
+        self.empty = 0
+        self.length = 0
+
+    def __dealloc__(self):
+        free(self.data)
+
+    def __len__(self):
+        return self.length
+
+    def __getbuffer__(self, Py_buffer *buffer, int flags):
+        if flags & PyBUF_WRITABLE:
+            raise BufferError("offset buffers are read-only")
+        self.shape[0] = self.length
+        self.strides[0] = sizeof(unsigned long long)
+        if self.data != NULL:
+            buffer.buf = <void*>self.data
+        else:
+            buffer.buf = <void*>&self.empty
+        buffer.obj = self
+        buffer.len = self.length * sizeof(unsigned long long)
+        buffer.readonly = 1
+        buffer.itemsize = sizeof(unsigned long long)
+        buffer.format = b'Q'
+        buffer.ndim = 1
+        buffer.shape = self.shape
+        buffer.strides = self.strides
+        buffer.suboffsets = NULL
+        buffer.internal = NULL
+
+    def __releasebuffer__(self, Py_buffer *buffer):
+        pass
+
+
+cdef OffsetBuffer take_offsets(OffsetArray* entry):
+    '''move the data from an OffsetArray into a new OffsetBuffer'''
+    cdef OffsetBuffer buf = OffsetBuffer()
+    cdef unsigned long long* shrunk
+    if entry.len > 0 and entry.len < entry.cap:
+        # give back the unused capacity
+        shrunk = <unsigned long long*>realloc(entry.data, entry.len * sizeof(unsigned long long))
+        if shrunk != NULL:
+            entry.data = shrunk
+    if entry.len > 0:
+        buf.data = entry.data
+        buf.length = entry.len
+    else:
+        free(entry.data)
+    entry.data = NULL
+    entry.len = 0
+    entry.cap = 0
+    return buf
+
 
 def build_offsets(const unsigned char[:] data,
                   unsigned char fmt_type, unsigned char fmt_length,
                   unsigned char type_offset, unsigned char length_offset,
                   unsigned char head1, unsigned char head2,
                   progress_callback=None):
+    '''scan a dataflash log, returning a list of 256 read-only memoryviews
+    of uint64 offsets, one per message type'''
     cdef OffsetArray* results
-    cdef size_t i, j
+    cdef size_t i
     cdef list py_offsets = []
 
     cdef PyObject* cb = NULL
@@ -40,9 +120,51 @@ def build_offsets(const unsigned char[:] data,
     if results == NULL:
         raise MemoryError("scan_offsets returned NULL")
 
-    for i in range(256):
-        entry = results[i]
-        py_offsets.append([entry.data[j] for j in range(entry.len)])
-
-    free_offsets(results)
+    try:
+        for i in range(256):
+            py_offsets.append(memoryview(take_offsets(&results[i])))
+    finally:
+        free_offsets(results)
     return py_offsets
+
+
+def scan_range(const unsigned char[:] data, size_t start, size_t end,
+               const unsigned char[:] lengths,
+               unsigned char head1, unsigned char head2,
+               bint resync=False):
+    '''scan the messages starting in [start, end) of a dataflash log using
+    a 256 entry table of message lengths, releasing the GIL while
+    scanning. Returns a tuple of (offsets, first, next) where offsets is
+    a list of 256 memoryviews as for build_offsets, or None if a message
+    type with no known length is found'''
+    cdef OffsetArray* results
+    cdef size_t i
+    cdef size_t first = 0
+    cdef size_t next = 0
+    cdef int status = 0
+    cdef list py_offsets = []
+
+    if lengths.shape[0] != 256:
+        raise ValueError("lengths must have 256 entries")
+    if data.shape[0] == 0:
+        return ([memoryview(OffsetBuffer()) for i in range(256)], 0, 0)
+
+    with nogil:
+        results = scan_offsets_range(&data[0], data.shape[0],
+                                     start, end,
+                                     &lengths[0],
+                                     head1, head2,
+                                     resync,
+                                     &first, &next, &status)
+
+    if results == NULL:
+        if status != SCAN_OK:
+            return None
+        raise MemoryError("scan_offsets_range returned NULL")
+
+    try:
+        for i in range(256):
+            py_offsets.append(memoryview(take_offsets(&results[i])))
+    finally:
+        free_offsets(results)
+    return (py_offsets, first, next)
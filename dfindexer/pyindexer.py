@@ -0,0 +1,188 @@
+'''
+dataflash log indexer for installs without the compiled dfindexer
+
+This builds the same per-type offset tables as dfindexer.build_offsets.
+The message lengths are found up front from the FMT messages, then the
+log is walked either with NumPy, following the chain of message headers
+with vectorised operations, or with a plain Python loop which uses
+mmap.find() to jump over any corrupt data.
+'''
+
+import array
+import sys
+
+# number of bytes searched for headers at a time by the NumPy scanner
+SEARCH_CHUNK = 1 << 24
+
+
+def _report_gap(data_map, data_len, ofs):
+    '''report corrupt data found at ofs in the same way as the other
+    indexers, ignoring the padding at the end of block based logs'''
+    if data_len - ofs >= 528 or data_len < 528:
+        print("bad header 0x%02x 0x%02x at %d" % (data_map[ofs], data_map[ofs+1], ofs),
+              file=sys.stderr)
+
+
+def scan_python(data_map, lengths, head1, head2):
+    '''walk a log one message at a time, returning a list of 256 arrays
+    of offsets, or None if a message with no known length is found'''
+    offsets = [array.array('Q') for i in range(256)]
+    appenders = [o.append for o in offsets]
+    header = bytes([head1, head2])
+    data_len = len(data_map)
+    ofs = 0
+    while ofs + 3 < data_len:
+        if data_map[ofs] != head1 or data_map[ofs+1] != head2:
+            _report_gap(data_map, data_len, ofs)
+            ofs = data_map.find(header, ofs+1)
+            if ofs == -1:
+                break
+            continue
+        mtype = data_map[ofs+2]
+        mlen = lengths[mtype]
+        if mlen == 0:
+            return None
+        appenders[mtype](ofs)
+        ofs += mlen
+    return offsets
+
+
+def find_formats_numpy(data, cands, types, fmt_type, fmt_length, type_offset, length_offset,
+                       head1, head2):
+    '''vectorised version of dfindexer.find_formats, working from the
+    candidate headers found by scan_numpy'''
+    import numpy as np
+
+    data_len = len(data)
+    fmts = cands[(types == fmt_type) & (cands + fmt_length <= data_len)]
+    nxt = fmts + fmt_length
+    at_end = nxt + 2 > data_len
+    nxt[at_end] = 0
+    followed = (data[nxt] == head1) & (data[nxt+1] == head2)
+    fmts = fmts[at_end | followed]
+    ftypes = data[fmts + type_offset]
+    flens = data[fmts + length_offset]
+    keep = flens >= 3
+    pairs = ftypes[keep].astype(np.int64) * 256 + flens[keep]
+    pairs = np.unique(np.append(pairs, fmt_type * 256 + fmt_length))
+    if len(np.unique(pairs >> 8)) != len(pairs):
+        # a type defined with two different lengths
+        return None
+    lengths = np.zeros(256, dtype=np.uint8)
+    lengths[pairs >> 8] = pairs & 0xFF
+    return lengths
+
+
+def scan_numpy(data_map, fmt_type, fmt_length, type_offset, length_offset, head1, head2):
+    '''find the offsets of all messages in a log using NumPy, returning a
+    list of 256 arrays of offsets, or None if the log can't be indexed
+    with a fixed table of message lengths.
+
+    Every pair of header bytes in the log is a candidate message. Each
+    candidate is linked to the first candidate at or after its end, which
+    is where a serial scan would go next, and the chain of links starting
+    at the first candidate is then followed by pointer doubling, so the
+    work done in Python only grows with the log of the message count.
+    '''
+    import numpy as np
+
+    data = np.frombuffer(data_map, dtype=np.uint8)
+    data_len = len(data)
+    limit = max(data_len - 3, 0)
+    cands = []
+    for start in range(0, limit, SEARCH_CHUNK):
+        end = min(start + SEARCH_CHUNK, limit)
+        found = np.flatnonzero((data[start:end] == head1) & (data[start+1:end+1] == head2))
+        cands.append(found + start)
+    if len(cands) == 0 or sum(len(c) for c in cands) == 0:
+        del data
+        if limit > 0:
+            _report_gap(data_map, data_len, 0)
+        return [array.array('Q') for i in range(256)]
+    cands = np.concatenate(cands)
+    ncands = len(cands)
+
+    types = data[cands + 2]
+    lengths = find_formats_numpy(data, cands, types, fmt_type, fmt_length,
+                                 type_offset, length_offset, head1, head2)
+    del data
+    if lengths is None:
+        return None
+    mlens = lengths[types].astype(np.int64)
+
+    # link each candidate to the next one a serial scan would visit.
+    # Candidates of unknown length are linked to the terminal node at
+    # ncands, and the walk fails below if it reaches one
+    jump = np.empty(ncands + 1, dtype=np.intp)
+    jump[:ncands] = np.searchsorted(cands, cands + mlens)
+    jump[:ncands][mlens == 0] = ncands
+    jump[ncands] = ncands
+
+    # chain[i] is the i'th message visited; each pass doubles the length
+    # of the chain and squares the jump table
+    chain = np.zeros(1, dtype=np.intp)
+    while chain[-1] != ncands:
+        chain = np.concatenate((chain, jump[chain]))
+        jump = jump[jump]
+    chain = chain[:np.searchsorted(chain, ncands)]
+    if np.any(mlens[chain] == 0):
+        return None
+
+    positions = cands[chain]
+    types = types[chain]
+    # corrupt data shows up as a gap between one message and the next
+    ends = positions + mlens[chain]
+    gaps = np.flatnonzero(ends[:-1] != positions[1:])
+    if positions[0] != 0:
+        _report_gap(data_map, data_len, 0)
+    for i in gaps:
+        _report_gap(data_map, data_len, int(ends[i]))
+    if ends[-1] < limit:
+        _report_gap(data_map, data_len, int(ends[-1]))
+
+    order = np.argsort(types, kind='stable')
+    counts = np.bincount(types, minlength=256)
+    sorted_positions = positions[order].astype('<u8')
+    offsets = []
+    start = 0
+    for mtype in range(256):
+        a = array.array('Q')
+        count = int(counts[mtype])
+        if count > 0:
+            a.frombytes(sorted_positions[start:start+count].tobytes())
+            if sys.byteorder != 'little':
+                a.byteswap()
+            start += count
+        offsets.append(a)
+    return offsets
+
+
+def build_offsets(data_map, fmt_type, fmt_length, type_offset, length_offset,
+                  head1, head2, progress_callback=None, use_numpy=None):
+    '''scan a dataflash log, returning a list of 256 arrays of offsets,
+    one per message type, or None if the log needs the full legacy
+    indexer because its message lengths change part way through or it
+    contains messages with no FMT. NumPy is used if it is available
+    unless use_numpy is False'''
+    from . import find_formats
+
+    if use_numpy is not False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is None and use_numpy:
+            raise ImportError("numpy is not available")
+        use_numpy = numpy is not None
+    if use_numpy:
+        offsets = scan_numpy(data_map, fmt_type, fmt_length, type_offset, length_offset,
+                             head1, head2)
+    else:
+        lengths = find_formats(data_map, fmt_type, fmt_length, type_offset, length_offset,
+                               head1, head2)
+        if lengths is None:
+            return None
+        offsets = scan_python(data_map, bytes(lengths), head1, head2)
+    if offsets is not None and progress_callback is not None:
+        progress_callback(100)
+    return offsets
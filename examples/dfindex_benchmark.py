@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+'''
+benchmark the dataflash log indexers
+
+Builds a large log by repeating a small one, then times the legacy
+indexer, the pure Python and NumPy indexers used when dfindexer isn't
+compiled, and the compiled dfindexer, checking they all agree.
+'''
+import os
+import sys
+import tempfile
+import time
+
+from pymavlink import DFReader
+from pymavlink import dfindexer
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+
+parser.add_argument("--scale", type=int, default=300,
+                    help="number of copies of the log to index")
+parser.add_argument("--repeat", type=int, default=3,
+                    help="number of runs of each indexer, the best is reported")
+parser.add_argument("--skip-legacy", action='store_true',
+                    help="don't time the (slow) legacy indexer")
+parser.add_argument("log", nargs='?', default=None,
+                    help="log to scale up, defaults to tests/test.BIN")
+args = parser.parse_args()
+
+if args.log is None:
+    args.log = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'test.BIN')
+
+with open(args.log, 'rb') as f:
+    data = f.read()
+tmp = tempfile.NamedTemporaryFile(suffix='.BIN', delete=False)
+for i in range(args.scale):
+    tmp.write(data)
+tmp.close()
+
+# the indexers report corrupt data, which is expected where the copies
+# join; the compiled indexer writes straight to file descriptor 2
+devnull = os.open(os.devnull, os.O_WRONLY)
+stderr_fd = os.dup(2)
+
+
+def quietly(func):
+    '''call func with stderr discarded, returning its result and run time'''
+    sys.stderr.flush()
+    os.dup2(devnull, 2)
+    try:
+        t0 = time.time()
+        ret = func()
+        return (ret, time.time() - t0)
+    finally:
+        sys.stderr.flush()
+        os.dup2(stderr_fd, 2)
+
+
+(log, dt) = quietly(lambda: DFReader.DFReader_binary(tmp.name, cache_index=False))
+fmt = log.formats[log.name_to_id['FMT']]
+expected = [list(o) for o in log.offsets]
+nmsgs = sum(len(o) for o in expected)
+print("%s x%u: %.1f MB, %u messages" % (args.log, args.scale, len(log.data_map) / 1.0e6, nmsgs))
+
+
+def python_indexer(use_numpy):
+    def run():
+        return dfindexer.build_offsets_python(log.data_map, fmt.type, fmt.len, 3, 4,
+                                              log.HEAD1, log.HEAD2, use_numpy=use_numpy)
+    return run
+
+
+def compiled_indexer():
+    return dfindexer.build_offsets(memoryview(log.data_map), fmt.type, fmt.len, 3, 4,
+                                   log.HEAD1, log.HEAD2)
+
+
+def legacy_indexer():
+    log.init_arrays()
+    return log.offsets
+
+
+indexers = []
+if not args.skip_legacy:
+    indexers.append(('legacy init_arrays', legacy_indexer))
+indexers.append(('pure python', python_indexer(False)))
+try:
+    import numpy
+    indexers.append(('numpy', python_indexer(True)))
+except ImportError:
+    print("numpy not available")
+if dfindexer.available:
+    indexers.append(('dfindexer', compiled_indexer))
+else:
+    print("dfindexer not compiled")
+
+for (name, func) in indexers:
+    best = None
+    for i in range(args.repeat):
+        (offsets, dt) = quietly(func)
+        if best is None or dt < best:
+            best = dt
+    ok = [list(o) for o in offsets] == expected
+    print("%-20s %8.3fs %10.0f msgs/s %s" % (name, best, nmsgs / best, "OK" if ok else "MISMATCH"))
+
+log.close()
+os.unlink(tmp.name)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+'''
+benchmark reading fields of dataflash messages
+
+Reads every field of every message in a log, and formats every message
+as mavlogdump does, using both the per-format message classes and the
+generic DFMessage.__getattr__ path.
+'''
+import os
+import time
+
+from pymavlink import DFReader
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+
+parser.add_argument("--repeat", type=int, default=20,
+                    help="number of passes over the messages")
+parser.add_argument("log", nargs='?', default=None,
+                    help="log to read, defaults to tests/test.BIN")
+args = parser.parse_args()
+
+if args.log is None:
+    args.log = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'test.BIN')
+
+log = DFReader.DFReader_binary(args.log)
+msgs = []
+while True:
+    m = log.recv_msg()
+    if m is None:
+        break
+    msgs.append(m)
+
+# the same messages without the per-format classes
+generic = []
+for m in msgs:
+    g = DFReader.DFMessage(m.fmt, m._elements, m._apply_multiplier, log)
+    g._timestamp = m._timestamp
+    generic.append(g)
+nfields = sum(len(m._fieldnames) for m in msgs)
+print("%u messages, %u fields" % (len(msgs), nfields))
+
+
+def read_fields(msgs):
+    for m in msgs:
+        for f in m._fieldnames:
+            getattr(m, f)
+
+
+def format_messages(msgs):
+    for m in msgs:
+        str(m)
+
+
+for (name, func) in [('field reads', read_fields), ('str()', format_messages)]:
+    times = []
+    for msg_list in [generic, msgs]:
+        t0 = time.time()
+        for i in range(args.repeat):
+            func(msg_list)
+        times.append(time.time() - t0)
+    print("%-12s generic %.3fs  per-format %.3fs  speedup %.2fx" % (
+        name, times[0], times[1], times[0] / times[1]))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+'''
+benchmark processing a log in parallel shards
+
+Builds a large tlog by repeating a small one, or a synthetic one if no
+log is given, then times reading every message and checking a condition
+on it, as mavsearch does, with logshard.map_log() and different numbers
+of worker processes, checking they all agree.
+'''
+import os
+import struct
+import tempfile
+import time
+
+os.environ.setdefault('MAVLINK20', '1')
+
+from pymavlink import mavutil
+from pymavlink import logshard
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+
+parser.add_argument("--scale", type=int, default=20,
+                    help="number of copies of the log to process")
+parser.add_argument("--count", type=int, default=50000,
+                    help="number of messages in the synthetic log")
+parser.add_argument("--jobs", default="1,2,4",
+                    help="numbers of worker processes to try (comma separated)")
+parser.add_argument("--condition", default="ATTITUDE.roll>0",
+                    help="condition to check on each message")
+parser.add_argument("log", nargs='?', default=None,
+                    help="tlog to scale up")
+
+
+def synthetic_log(count):
+    '''a tlog with a mix of message types from a vehicle and a GCS'''
+    vehicle = mavutil.mavlink.MAVLink(None, 1, 1)
+    gcs = mavutil.mavlink.MAVLink(None, 255, 190)
+    msgs = [
+        (vehicle, mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3)),
+        (gcs, mavutil.mavlink.MAVLink_heartbeat_message(6, 8, 0, 0, 0, 3)),
+        (vehicle, mavutil.mavlink.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0, 0, 0)),
+        (vehicle, mavutil.mavlink.MAVLink_gps_raw_int_message(1000, 3, 0, 0, 0, 0, 0, 0, 0, 5)),
+        (vehicle, mavutil.mavlink.MAVLink_param_value_message(b"PARAM", 1.5, 9, 100, 3)),
+    ]
+    data = bytearray()
+    for i in range(count):
+        (mav, msg) = msgs[i % len(msgs)]
+        data += struct.pack('>Q', 1700000000000000 + i * 1000)
+        data += msg.pack(mav)
+    return bytes(data)
+
+
+def search(mlog, condition):
+    '''count the messages and those meeting condition in a shard'''
+    count = 0
+    found = 0
+    while True:
+        m = mlog.recv_match()
+        if m is None:
+            break
+        count += 1
+        if mlog.check_condition(condition):
+            found += 1
+    return (count, found)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.log is None:
+        data = synthetic_log(args.count)
+        name = "synthetic"
+    else:
+        with open(args.log, 'rb') as f:
+            data = f.read()
+        name = args.log
+    tmp = tempfile.NamedTemporaryFile(suffix='.tlog', delete=False)
+    for i in range(args.scale):
+        tmp.write(data)
+    tmp.close()
+
+    print("%s x%u: %.1f MB, %u CPUs" % (name, args.scale, os.path.getsize(tmp.name) / 1.0e6,
+                                        os.cpu_count() or 1))
+    expected = None
+    for jobs in [int(j) for j in args.jobs.split(',')]:
+        t0 = time.time()
+        results = logshard.map_log(tmp.name, search, (args.condition,), jobs=jobs)
+        dt = time.time() - t0
+        total = (sum(r[0] for r in results), sum(r[1] for r in results))
+        if expected is None:
+            expected = total
+        print("%2u jobs %8.3fs %8u msgs %10.0f msgs/s %s" % (jobs, dt, total[0], total[0] / dt,
+                                                          "OK" if total == expected else "MISMATCH"))
+
+    os.unlink(tmp.name)
+    if os.path.exists(tmp.name + '.pmidx'):
+        os.unlink(tmp.name + '.pmidx')
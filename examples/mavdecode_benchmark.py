@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+'''
+benchmark unpacking the fields of MAVLink messages with arrays
+
+Times the field unpacking done when a message is decoded, using the
+field positions worked out by mavgen, against the old way of finding the
+position of each field in the unpacked payload for every message.
+'''
+import random
+import time
+
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+
+parser.add_argument("--count", type=int, default=100000,
+                    help="number of messages of each type to unpack")
+parser.add_argument("--types", default="GPS_RTCM_DATA,ESC_TELEMETRY_1_TO_4,OBSTACLE_DISTANCE,ATTITUDE",
+                    help="comma separated list of message types")
+args = parser.parse_args()
+
+
+def legacy_decode_fields(msgtype, payload):
+    '''field unpacking as it was done before mavgen worked out the positions'''
+    order_map = msgtype.orders
+    len_map = msgtype.lengths
+    t = msgtype.unpacker.unpack_from(payload)
+    tlist = list(t)
+    if sum(len_map) == len(len_map):
+        for i in range(0, len(tlist)):
+            tlist[i] = t[order_map[i]]
+    else:
+        tlist = []
+        for i in range(0, len(order_map)):
+            order = order_map[i]
+            L = len_map[order]
+            tip = sum(len_map[:order])
+            field = t[tip]
+            if L == 1 or isinstance(field, bytes):
+                tlist.append(field)
+            else:
+                tlist.append(list(t[tip:(tip + L)]))
+    for i, elem in enumerate(tlist):
+        if isinstance(elem, bytes):
+            tlist[i] = elem.rstrip(b"\x00")
+    return tlist
+
+
+for name in args.types.split(","):
+    msgid = getattr(mavlink, "MAVLINK_MSG_ID_" + name, None)
+    if msgid is None:
+        print("%-22s not in this dialect" % name)
+        continue
+    msgtype = mavlink.mavlink_map[msgid]
+    payload = bytes([random.randint(0, 255) for i in range(msgtype.unpacker.size)])
+    if repr(mavlink._decode_fields(msgtype, payload)) != repr(legacy_decode_fields(msgtype, payload)):
+        raise RuntimeError("%s unpacked differently" % name)
+
+    times = []
+    for decode in [legacy_decode_fields, mavlink._decode_fields]:
+        t0 = time.time()
+        for i in range(args.count):
+            decode(msgtype, payload)
+        times.append(time.time() - t0)
+    print("%-22s legacy %.0f msgs/sec, precomputed %.0f msgs/sec, speedup %.2fx" % (
+        name, args.count / times[0], args.count / times[1], times[0] / times[1]))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+'''
+benchmark waiting for messages on many UDP links
+
+A thread sends SYSTEM_TIME messages stamped with the time they were sent
+to each of a number of UDP links. They are received first by polling
+each link in turn, waiting on one link with select() when none of them
+had a message, then with a mavhub. The latency of each message and the
+CPU time used by the receiving thread are measured for each.
+'''
+import socket
+import threading
+import time
+
+from pymavlink import mavutil
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+
+parser.add_argument("--links", type=int, default=50,
+                    help="number of UDP links")
+parser.add_argument("--rate", type=float, default=10,
+                    help="messages per second sent to each link")
+parser.add_argument("--duration", type=float, default=5,
+                    help="seconds to run for with each receiver")
+args = parser.parse_args()
+
+
+def sender(ports, stop):
+    '''send timestamped messages to each port in turn'''
+    mav = mavutil.mavlink.MAVLink(None, 1, 1)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    interval = 1.0 / (args.rate * len(ports))
+    next_send = time.time()
+    i = 0
+    while not stop.is_set():
+        now = time.time()
+        if now < next_send:
+            time.sleep(next_send - now)
+            continue
+        msg = mavutil.mavlink.MAVLink_system_time_message(int(time.time() * 1.0e6), 0)
+        sock.sendto(msg.pack(mav), ports[i % len(ports)])
+        i += 1
+        next_send += interval
+    sock.close()
+
+
+def poll_receive(links, received, end):
+    '''check each link in turn, waiting on one of them when none had a message'''
+    i = 0
+    while time.time() < end:
+        count = 0
+        for link in links:
+            while True:
+                m = link.recv_msg()
+                if m is None:
+                    break
+                received(link, m)
+                count += 1
+        if count == 0:
+            links[i % len(links)].select(0.05)
+            i += 1
+
+
+def hub_receive(links, received, end):
+    '''wait for messages on all the links at once'''
+    hub = mavutil.mavhub()
+    for link in links:
+        hub.add(link, received)
+    hub.run(end - time.time())
+    hub.close()
+
+
+def benchmark(receive):
+    links = [mavutil.mavudp("127.0.0.1:0", input=True) for i in range(args.links)]
+    ports = [link.port.getsockname() for link in links]
+    latency = []
+
+    def received(link, m):
+        if m.get_type() == 'SYSTEM_TIME':
+            latency.append(time.time() - m.time_unix_usec * 1.0e-6)
+
+    stop = threading.Event()
+    thread = threading.Thread(target=sender, args=(ports, stop))
+    thread.start()
+    cpu = time.thread_time()
+    receive(links, received, time.time() + args.duration)
+    cpu = time.thread_time() - cpu
+    stop.set()
+    thread.join()
+    for link in links:
+        link.close()
+    latency.sort()
+    return (len(latency), cpu, latency[len(latency) // 2], latency[int(len(latency) * 0.99)], latency[-1])
+
+
+print("%u links, %.0f messages/sec each, %.0fs each" % (args.links, args.rate, args.duration))
+for (name, receive) in [("polling", poll_receive), ("mavhub", hub_receive)]:
+    (count, cpu, median, p99, worst) = benchmark(receive)
+    print("%-8s %u messages, CPU %.2fs, latency median %.2fms 99%% %.2fms max %.2fms" % (
+        name, count, cpu, median * 1000, p99 * 1000, worst * 1000))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+'''
+benchmark MAVLink message classes with and without __slots__
+
+Generates a dialect twice, once as normal and once with --python-slots,
+then times packing and parsing a stream of common telemetry messages
+with each and measures the memory used by each decoded message.
+'''
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from pymavlink.dialects.v20 import ardupilotmega
+from pymavlink.generator import mavgen
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+
+parser.add_argument("--xml", default=os.path.join(os.path.dirname(ardupilotmega.__file__), "ardupilotmega.xml"),
+                    help="message definitions to generate the dialects from")
+parser.add_argument("--count", type=int, default=100000,
+                    help="number of messages to pack and parse")
+args = parser.parse_args()
+
+
+def generate(tmpdir, slots):
+    '''generate and import the dialect'''
+    name = "bench_slots" if slots else "bench_dict"
+    output = os.path.join(tmpdir, name + ".py")
+    opts = mavgen.Opts(output, wire_protocol="2.0", language="Python3", validate=False, python_slots=slots)
+    with contextlib.redirect_stdout(io.StringIO()):
+        ok = mavgen.mavgen(opts, [args.xml])
+    if not ok:
+        raise RuntimeError("failed to generate %s" % args.xml)
+    spec = importlib.util.spec_from_file_location(name, output)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def benchmark(mavlink):
+    mav = mavlink.MAVLink(None, 1, 1)
+    msgs = [
+        mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3),
+        mavlink.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0.01, 0.02, 0.03),
+        mavlink.MAVLink_sys_status_message(0, 0, 0, 500, 12000, 100, 80, 0, 0, 0, 0, 0, 0),
+        mavlink.MAVLink_statustext_message(6, b"benchmark"),
+    ]
+    t0 = time.time()
+    stream = b"".join([msgs[i % len(msgs)].pack(mav) for i in range(args.count)])
+    pack_time = time.time() - t0
+
+    times = []
+    for lazy in [False, True]:
+        mav = mavlink.MAVLink(None)
+        mav.lazy_decode = lazy
+        t0 = time.time()
+        mav.parse_buffer(stream)
+        times.append(time.time() - t0)
+
+    mav = mavlink.MAVLink(None)
+    tracemalloc.start()
+    received = mav.parse_buffer(stream)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the frames are kept by the messages, so leave them out
+    size -= sum(len(m.get_msgbuf()) + len(m.get_payload()) for m in received)
+    return (pack_time, times[0], times[1], size / len(received))
+
+
+tmpdir = tempfile.mkdtemp()
+try:
+    dialects = [generate(tmpdir, False), generate(tmpdir, True)]
+finally:
+    shutil.rmtree(tmpdir)
+
+print("%u messages" % args.count)
+for (name, dialect) in zip(["__dict__", "__slots__"], dialects):
+    (pack_time, parse_time, lazy_time, size) = benchmark(dialect)
+    print("%-9s pack %.0f msgs/sec, parse %.0f msgs/sec, lazy parse %.0f msgs/sec, %.0f bytes/msg" % (
+        name, args.count / pack_time, args.count / parse_time, args.count / lazy_time, size))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+'''
+benchmark parsing a MAVLink stream
+
+Builds a stream of common telemetry messages, some of them signed, and
+parses it in small chunks as a serial or UDP link would deliver it, with
+the compiled frame parser and with the pure Python one.
+'''
+import time
+
+from pymavlink import mavparser
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+
+parser.add_argument("--count", type=int, default=100000,
+                    help="number of messages in the stream")
+parser.add_argument("--chunk", type=int, default=64,
+                    help="bytes passed to parse_buffer() at a time")
+parser.add_argument("--signed", action='store_true',
+                    help="sign every message")
+args = parser.parse_args()
+
+secret_key = bytes(range(32))
+
+mav = mavlink.MAVLink(None, 1, 1)
+if args.signed:
+    mav.signing.secret_key = secret_key
+    mav.signing.sign_outgoing = True
+msgs = [
+    mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3),
+    mavlink.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0.01, 0.02, 0.03),
+    mavlink.MAVLink_sys_status_message(0, 0, 0, 500, 12000, 100, 80, 0, 0, 0, 0, 0, 0),
+    mavlink.MAVLink_statustext_message(6, b"benchmark"),
+]
+stream = bytearray()
+for i in range(args.count):
+    stream += msgs[i % len(msgs)].pack(mav)
+stream = bytes(stream)
+print("%u messages, %u bytes" % (args.count, len(stream)))
+
+
+def parse(fast):
+    mav = mavlink.MAVLink(None)
+    mav.use_fast_parser = fast
+    if args.signed:
+        mav.signing.secret_key = secret_key
+    count = 0
+    t0 = time.time()
+    for ofs in range(0, len(stream), args.chunk):
+        ret = mav.parse_buffer(stream[ofs:ofs+args.chunk])
+        if ret is not None:
+            count += len(ret)
+    return (count, time.time() - t0)
+
+
+(count, python_time) = parse(False)
+print("python   %u messages in %.3fs, %.0f msgs/sec" % (count, python_time, count / python_time))
+if not mavparser.available:
+    print("compiled parser not built")
+else:
+    (count, fast_time) = parse(True)
+    print("compiled %u messages in %.3fs, %.0f msgs/sec, speedup %.2fx" % (
+        count, fast_time, count / fast_time, python_time / fast_time))
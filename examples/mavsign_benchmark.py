@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+'''
+benchmark MAVLink2 signing
+
+Times packing and parsing a stream of common telemetry messages with and
+without signing, and hashing the signed frames starting from a new hash
+for each frame against a copy of the cached hash of the secret key.
+'''
+import hashlib
+import time
+
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+
+parser.add_argument("--count", type=int, default=100000,
+                    help="number of messages to pack and parse")
+args = parser.parse_args()
+
+secret_key = bytes(range(32))
+
+msgs = [
+    mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3),
+    mavlink.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0.01, 0.02, 0.03),
+    mavlink.MAVLink_sys_status_message(0, 0, 0, 500, 12000, 100, 80, 0, 0, 0, 0, 0, 0),
+    mavlink.MAVLink_statustext_message(6, b"benchmark"),
+]
+
+
+def legacy_check_signature(msgbuf):
+    '''hash the secret key and frame for every frame, as was done before the key hash was cached'''
+    h = hashlib.new("sha256")
+    h.update(secret_key)
+    h.update(msgbuf[:-6])
+    return h.digest()[:6] == msgbuf[-6:]
+
+
+def benchmark(signed):
+    mav = mavlink.MAVLink(None, 1, 1)
+    if signed:
+        mav.signing.secret_key = secret_key
+        mav.signing.sign_outgoing = True
+    t0 = time.time()
+    frames = [msgs[i % len(msgs)].pack(mav) for i in range(args.count)]
+    pack_time = time.time() - t0
+
+    mav = mavlink.MAVLink(None)
+    if signed:
+        mav.signing.secret_key = secret_key
+    t0 = time.time()
+    received = mav.parse_many(b"".join(frames))
+    parse_time = time.time() - t0
+    if len(received) != args.count:
+        raise RuntimeError("parsed %u of %u messages" % (len(received), args.count))
+    return (frames, pack_time, parse_time)
+
+
+print("%u messages" % args.count)
+times = []
+for signed in [False, True]:
+    (frames, pack_time, parse_time) = benchmark(signed)
+    times.append((pack_time, parse_time))
+    print("%-8s pack %.0f msgs/sec, parse %.0f msgs/sec" % (
+        "signed" if signed else "unsigned", args.count / pack_time, args.count / parse_time))
+print("signing overhead pack %.2fx, parse %.2fx" % (times[1][0] / times[0][0], times[1][1] / times[0][1]))
+
+key_hash = hashlib.sha256(secret_key)
+
+
+def cached_check_signature(msgbuf):
+    '''copy the hash of the secret key for every frame, as MAVLinkSigning.keyed_hash() does'''
+    h = key_hash.copy()
+    h.update(msgbuf[:-6])
+    return h.digest()[:6] == msgbuf[-6:]
+
+
+hash_times = []
+for check in [legacy_check_signature, cached_check_signature]:
+    t0 = time.time()
+    for msgbuf in frames:
+        if not check(msgbuf):
+            raise RuntimeError("bad signature")
+    hash_times.append(time.time() - t0)
+print("hash signatures legacy %.0f msgs/sec, cached key %.0f msgs/sec, speedup %.2fx" % (
+    args.count / hash_times[0], args.count / hash_times[1], hash_times[0] / hash_times[1]))
+
+mav = mavlink.MAVLink(None)
+mav.signing.secret_key = secret_key
+t0 = time.time()
+ok = mav.check_signatures(frames)
+batch_time = time.time() - t0
+if not all(ok):
+    raise RuntimeError("bad signature")
+print("check_signatures() with timestamps %.0f msgs/sec" % (args.count / batch_time))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+'''
+benchmark the telemetry log indexers
+
+Builds a large tlog by repeating a small one, or a synthetic one if no
+log is given, then times building the mavmmaplog index with the Python
+loop and with the compiled scanner in mavparser, and loading it from a
+sidecar index file, checking they all agree.
+'''
+import os
+import struct
+import tempfile
+import time
+
+os.environ.setdefault('MAVLINK20', '1')
+
+from pymavlink import mavutil
+from pymavlink import mavparser
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+
+parser.add_argument("--scale", type=int, default=20,
+                    help="number of copies of the log to index")
+parser.add_argument("--count", type=int, default=50000,
+                    help="number of messages in the synthetic log")
+parser.add_argument("--repeat", type=int, default=3,
+                    help="number of runs of each indexer, the best is reported")
+parser.add_argument("log", nargs='?', default=None,
+                    help="tlog to scale up")
+args = parser.parse_args()
+
+
+def synthetic_log():
+    '''a tlog with a mix of message types, some of them MAVLink1'''
+    mav = mavutil.mavlink.MAVLink(None, 1, 1)
+    msgs = [
+        mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3),
+        mavutil.mavlink.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0, 0, 0),
+        mavutil.mavlink.MAVLink_gps_raw_int_message(1000, 3, 0, 0, 0, 0, 0, 0, 0, 5),
+        mavutil.mavlink.MAVLink_statustext_message(6, b"hello"),
+        mavutil.mavlink.MAVLink_param_value_message(b"PARAM", 1.5, 9, 100, 3),
+    ]
+    data = bytearray()
+    for i in range(args.count):
+        data += struct.pack('>Q', i * 1000)
+        data += msgs[i % len(msgs)].pack(mav, force_mavlink1=(i % 10 == 0))
+    return bytes(data)
+
+
+if args.log is None:
+    data = synthetic_log()
+    name = "synthetic"
+else:
+    with open(args.log, 'rb') as f:
+        data = f.read()
+    name = args.log
+tmp = tempfile.NamedTemporaryFile(suffix='.tlog', delete=False)
+for i in range(args.scale):
+    tmp.write(data)
+tmp.close()
+
+
+def index(fast, cache_index=False):
+    '''index the log, returning the offsets of each type'''
+    os.environ['PYMAVLINK_FAST_INDEX'] = '1' if fast else '0'
+    log = mavutil.mavmmaplog(tmp.name, cache_index=cache_index)
+    offsets = {k: list(v) for k, v in log.offsets.items()}
+    log.close()
+    return offsets
+
+
+indexers = [('python loop', lambda: index(False))]
+if mavparser.available:
+    indexers.append(('mavparser', lambda: index(True)))
+else:
+    print("mavparser not compiled")
+# the first open writes the sidecar, which the timed ones load
+index(mavparser.available, cache_index=True)
+indexers.append(('sidecar', lambda: index(mavparser.available, cache_index=True)))
+
+print("%s x%u: %.1f MB" % (name, args.scale, os.path.getsize(tmp.name) / 1.0e6))
+results = {}
+for (label, func) in indexers:
+    best = None
+    for i in range(args.repeat):
+        t0 = time.time()
+        offsets = func()
+        dt = time.time() - t0
+        if best is None or dt < best:
+            best = dt
+    results[label] = offsets
+    nmsgs = sum(len(o) for o in offsets.values())
+    ok = offsets == results['python loop']
+    print("%-12s %8.3fs %8u msgs %10.0f msgs/s %s" % (label, best, nmsgs, nmsgs / best, "OK" if ok else "MISMATCH"))
+
+os.unlink(tmp.name)
+os.unlink(tmp.name + '.pmidx')
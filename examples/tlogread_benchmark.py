@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+'''
+benchmark streaming a telemetry log with mavlogfile
+
+Builds a large tlog by repeating a small one, or a synthetic one if no
+log is given, optionally with runs of junk in it to make the reader
+resync, then times reading every message with mavlogfile a frame at a
+time and with a read ahead buffer, checking they agree.
+'''
+import os
+import random
+import struct
+import tempfile
+import time
+
+os.environ.setdefault('MAVLINK20', '1')
+
+from pymavlink import mavutil
+
+from argparse import ArgumentParser
+parser = ArgumentParser(description=__doc__)
+
+parser.add_argument("--size", type=float, default=100,
+                    help="size in MB of the log to read")
+parser.add_argument("--count", type=int, default=50000,
+                    help="number of messages in the synthetic log")
+parser.add_argument("--junk", type=int, default=0,
+                    help="bytes of junk to put after every 1000th message")
+parser.add_argument("--read-ahead", type=int, default=mavutil.LOG_READ_AHEAD,
+                    help="read ahead buffer size")
+parser.add_argument("log", nargs='?', default=None,
+                    help="tlog to scale up")
+args = parser.parse_args()
+
+
+def synthetic_log():
+    '''a tlog with a mix of message types, some of them MAVLink1'''
+    mav = mavutil.mavlink.MAVLink(None, 1, 1)
+    msgs = [
+        mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3),
+        mavutil.mavlink.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0, 0, 0),
+        mavutil.mavlink.MAVLink_gps_raw_int_message(1000, 3, 0, 0, 0, 0, 0, 0, 0, 5),
+        mavutil.mavlink.MAVLink_statustext_message(6, b"hello"),
+        mavutil.mavlink.MAVLink_param_value_message(b"PARAM", 1.5, 9, 100, 3),
+    ]
+    random.seed(1)
+    data = bytearray()
+    for i in range(args.count):
+        data += struct.pack('>Q', 1700000000000000 + i * 1000)
+        data += msgs[i % len(msgs)].pack(mav, force_mavlink1=(i % 10 == 0))
+        if args.junk and i % 1000 == 999:
+            data += bytes(random.randrange(256) for j in range(args.junk))
+    return bytes(data)
+
+
+if args.log is None:
+    data = synthetic_log()
+    name = "synthetic"
+else:
+    with open(args.log, 'rb') as f:
+        data = f.read()
+    name = args.log
+tmp = tempfile.NamedTemporaryFile(suffix='.tlog', delete=False)
+scale = max(1, int(args.size * 1.0e6 / len(data)))
+for i in range(scale):
+    tmp.write(data)
+tmp.close()
+
+
+def read(read_ahead):
+    '''read every message, returning the count and the last timestamp'''
+    log = mavutil.mavlogfile(tmp.name, read_ahead=read_ahead)
+    count = 0
+    last = None
+    while True:
+        m = log.recv_msg()
+        if m is None:
+            break
+        count += 1
+        last = m._timestamp
+    log.close()
+    return (count, last)
+
+
+print("%s x%u: %.1f MB" % (name, scale, os.path.getsize(tmp.name) / 1.0e6))
+results = {}
+for (label, read_ahead) in [('frame', 0), ('read ahead', args.read_ahead)]:
+    t0 = time.time()
+    results[label] = read(read_ahead)
+    dt = time.time() - t0
+    (count, last) = results[label]
+    ok = results[label] == results['frame']
+    print("%-12s %8.3fs %8u msgs %10.0f msgs/s %s" % (label, dt, count, count / dt, "OK" if ok else "MISMATCH"))
+
+os.unlink(tmp.name)
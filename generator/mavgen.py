@@ -35,6 +35,7 @@ DEFAULT_WIRE_PROTOCOL = mavparse.PROTOCOL_1_0
 DEFAULT_LANGUAGE = 'Python'
 DEFAULT_VALIDATE = True
 DEFAULT_STRICT_UNITS = False
+DEFAULT_PYTHON_SLOTS = False
 
 MAXIMUM_INCLUDE_FILE_NESTING = 5
 
@@ -246,7 +247,7 @@ def mavgen(opts, args):
     opts.language = opts.language.lower()
     if opts.language == 'python3' or opts.language == 'python':
         from . import mavgen_python
-        mavgen_python.generate(opts.output, xml)
+        mavgen_python.generate(opts.output, xml, slots=getattr(opts, "python_slots", DEFAULT_PYTHON_SLOTS))
     elif opts.language == 'c':
         from . import mavgen_c
         mavgen_c.generate(opts.output, xml)
@@ -297,12 +298,13 @@ def mavgen(opts, args):
 
 # build all the dialects in the dialects subpackage
 class Opts(object):
-    def __init__(self, output, wire_protocol=DEFAULT_WIRE_PROTOCOL, language=DEFAULT_LANGUAGE, validate=DEFAULT_VALIDATE, strict_units=DEFAULT_STRICT_UNITS):
+    def __init__(self, output, wire_protocol=DEFAULT_WIRE_PROTOCOL, language=DEFAULT_LANGUAGE, validate=DEFAULT_VALIDATE, strict_units=DEFAULT_STRICT_UNITS, python_slots=DEFAULT_PYTHON_SLOTS):
         self.wire_protocol = wire_protocol
         self.language = language
         self.output = output
         self.validate = validate
         self.strict_units = strict_units
+        self.python_slots = python_slots
 
 
 def mavgen_python_dialect(dialect, wire_protocol):
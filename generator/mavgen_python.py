@@ -14,12 +14,48 @@ from . import mavtemplate
 t = mavtemplate.MAVTemplate()
 
 
-def generate_preamble(outf, msgs, basename, args, xml):
+def generate_preamble(outf, msgs, basename, args, xml, slots=False):
     print("Generating preamble")
 
     params = dict(xml)
     params["FILELIST"] = (",".join(args),)
     params["DIALECT"] = os.path.splitext(os.path.basename(basename))[0]
+    params["message_slots"] = ""
+    params["header_slots"] = ""
+    params["mavlink2"] = float(xml["wire_protocol_version"]) == 2.0
+    if params["mavlink2"]:
+        params["pack_mavlink2"] = "not force_mavlink1"
+    else:
+        params["pack_mavlink2"] = "False"
+    if xml["crc_extra"]:
+        params["pack_crc"] = """# we are using CRC extra, which goes where the CRC will be
+        msgbuf[end] = self.crc_extra
+        self._crc = x25crc(msgbuf[1 : end + 1]).crc"""
+    else:
+        params["pack_crc"] = "self._crc = x25crc(msgbuf[1:end]).crc"
+    if slots:
+        params["header_slots"] = '\n\n    __slots__ = ("mlen", "seq", "srcSystem", "srcComponent", "msgId", "incompat_flags", "compat_flags")'
+        # attributes set on received messages, including those added by mavutil
+        params["message_slots"] = "\n\n    __slots__ = (%s)" % ", ".join(
+            '"%s"' % a
+            for a in [
+                "_header",
+                "_payload",
+                "_msgbuf",
+                "_crc",
+                "_fieldnames",
+                "_type",
+                "_signed",
+                "_link_id",
+                "_instances",
+                "_instance_field",
+                "_instance_offset",
+                "_lazy_payload",
+                "_posted",
+                "_timestamp",
+                "_link",
+            ]
+        )
 
     t.write(
         outf,
@@ -39,7 +75,7 @@ import struct
 import sys
 import time
 from builtins import object, range
-from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Type, Union
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Type, Union
 
 WIRE_PROTOCOL_VERSION = "${wire_protocol_version}"
 DIALECT = "${DIALECT}"
@@ -53,6 +89,10 @@ MAVLINK_SIGNATURE_BLOCK_LEN = 13
 
 MAVLINK_IFLAG_SIGNED = 0x01
 
+_header_v1_packer = struct.Struct("<BBBBBB")
+_header_v2_packer = struct.Struct("<BBBBBBBHB")
+_crc_packer = struct.Struct("<H")
+
 logger = logging.getLogger(__name__)
 
 # allow MAV_IGNORE_CRC=1 to ignore CRC, allowing some
@@ -72,13 +112,25 @@ MAVLINK_TYPE_INT64_T = 8
 MAVLINK_TYPE_FLOAT = 9
 MAVLINK_TYPE_DOUBLE = 10
 
-# CRC calculation using fastcrc, falling back to a pure Python implementation
-# if fastcrc is not available
+# CRC calculation using fastcrc, falling back to the compiled pymavlink
+# parser and then to a pure Python implementation if neither is available
 try:
     import fastcrc
     mcrf4xx = fastcrc.crc16.mcrf4xx
 except Exception:
-    mcrf4xx = None  # type: ignore
+    try:
+        from pymavlink.mavparser import x25crc as mcrf4xx
+    except ImportError:
+        mcrf4xx = None  # type: ignore
+
+# compiled MAVLink framing from pymavlink, if it has been built. Set
+# PYMAVLINK_FAST_PARSER=0 to always use the pure Python parser
+try:
+    from pymavlink.mavparser import parse_frame as _parse_frame
+except ImportError:
+    _parse_frame = None
+if os.environ.get("PYMAVLINK_FAST_PARSER", "1") == "0":
+    _parse_frame = None
 
 
 BytesLike = Union[List[int], Tuple[int], bytes, bytearray, str]
@@ -130,7 +182,7 @@ x25crc = _x25crc_fast if mcrf4xx is not None else _x25crc_slow
 
 
 class MAVLink_header(object):
-    """MAVLink message header"""
+    """MAVLink message header"""${header_slots}
 
     def __init__(self, msgId: int, incompat_flags: int = 0, compat_flags: int = 0, mlen: int = 0, seq: int = 0, srcSystem: int = 0, srcComponent: int = 0) -> None:
         self.mlen = mlen
@@ -167,7 +219,7 @@ class MAVLink_header(object):
 
 
 class MAVLink_message(object):
-    """base MAVLink message class"""
+    """base MAVLink message class"""${message_slots}
 
     id = 0
     msgname = ""
@@ -181,10 +233,15 @@ class MAVLink_message(object):
     orders: List[int] = []
     lengths: List[int] = []
     array_lengths: List[int] = []
+    unpack_order: List[int] = []
+    unpack_arrays: List[Tuple[int, int, int]] = []
+    unpack_strings: List[int] = []
     crc_extra = 0
     unpacker = struct.Struct("")
     instance_field: Optional[str] = None
     instance_offset = -1
+    # only set on messages decoded with MAVLink.lazy_decode
+    _lazy_payload: Optional[bytes]
 
     def __init__(self, msgId: int, name: str) -> None:
         self._header = MAVLink_header(msgId)
@@ -293,9 +350,8 @@ class MAVLink_message(object):
     def sign_packet(self, mav: "MAVLink") -> None:
         assert mav.signing.secret_key is not None
 
-        h = hashlib.new("sha256")
+        h = mav.signing.keyed_hash()
         self._msgbuf += struct.pack("<BQ", mav.signing.link_id, mav.signing.timestamp)[:7]
-        h.update(mav.signing.secret_key)
         h.update(self._msgbuf)
         sig = h.digest()[:6]
         self._msgbuf += sig
@@ -334,6 +390,38 @@ class MAVLink_message(object):
             self.sign_packet(mav)
         return bytes(self._msgbuf)
 
+    def _pack_fields(self, mav: "MAVLink", force_mavlink1: bool, *fields: Any) -> bytes:
+        """pack the fields of a message and its header and CRC into a single buffer"""
+        unpacker = self.unpacker
+        mavlink2 = ${pack_mavlink2}
+        header_len = HEADER_LEN_V2 if mavlink2 else HEADER_LEN_V1
+        msgbuf = bytearray(header_len + unpacker.size + 2)
+        unpacker.pack_into(msgbuf, header_len, *fields)
+        if mavlink2:
+            # in MAVLink2 we can strip trailing zeros off payloads. The
+            # header hasn't been packed yet, so it can't be stripped
+            plen = max(len(msgbuf.rstrip(b"\\x00")) - header_len, 1)
+        else:
+            plen = unpacker.size
+        incompat_flags = 0
+        if mav.signing.sign_outgoing:
+            incompat_flags |= MAVLINK_IFLAG_SIGNED
+        msgId = self._header.msgId
+        if mavlink2:
+            _header_v2_packer.pack_into(msgbuf, 0, ${protocol_marker}, plen, incompat_flags, 0, mav.seq, mav.srcSystem, mav.srcComponent, msgId & 0xFFFF, msgId >> 16)
+        else:
+            _header_v1_packer.pack_into(msgbuf, 0, PROTOCOL_MARKER_V1, plen, mav.seq, mav.srcSystem, mav.srcComponent, msgId)
+        end = header_len + plen
+        ${pack_crc}
+        _crc_packer.pack_into(msgbuf, end, self._crc)
+        del msgbuf[end + 2 :]
+        self._header = MAVLink_header(msgId, incompat_flags, 0, plen, mav.seq, mav.srcSystem, mav.srcComponent)
+        self._payload = bytes(msgbuf[header_len:end])
+        self._msgbuf = msgbuf
+        if mav.signing.sign_outgoing and not force_mavlink1:
+            self.sign_packet(mav)
+        return bytes(self._msgbuf)
+
     def pack(self, mav: "MAVLink", force_mavlink1: bool = False) -> bytes:
         raise NotImplementedError("MAVLink_message cannot be serialized directly")
 
@@ -345,6 +433,53 @@ class MAVLink_message(object):
             raise IndexError()
         return self._instances[key]
 
+    def _unpack_lazy(self, payload: bytes) -> None:
+        """unpack the fields of a message decoded with MAVLink.lazy_decode"""
+        del self._lazy_payload
+        msgtype = type(self)
+        tlist = _decode_fields(msgtype, payload)
+        try:
+            m = msgtype(*tlist)
+        except Exception as emsg:
+            raise MAVError("Unable to instantiate MAVLink message of type %s : %s" % (msgtype, emsg))
+        # copy the fields over, keeping the header and any fields which have
+        # been set since the message was received. Whether a field is set
+        # is looked up in the instance's own storage, as a field can share
+        # its name with a class attribute, and with __slots__ such fields
+        # are kept in __dict__
+        try:
+            stored = vars(self)
+        except TypeError:
+            # __slots__ without a __dict__
+            stored = {}
+        slots = getattr(msgtype, "__slots__", ())
+        for (fname, ftype) in zip(msgtype.fieldnames, msgtype.fieldtypes):
+            names = [fname, "_%s_raw" % fname] if ftype == "char" else [fname]
+            for name in names:
+                if name in stored:
+                    continue
+                if name in slots:
+                    try:
+                        object.__getattribute__(self, name)
+                        continue
+                    except AttributeError:
+                        pass
+                setattr(self, name, getattr(m, name))
+
+
+def _message_getattr(self: MAVLink_message, name: str) -> Any:
+    """unpack the fields of a lazily decoded message the first time one of them is read"""
+    if name in self.fieldnames or (name.endswith("_raw") and name[1:-4] in self.fieldnames):
+        payload = getattr(self, "_lazy_payload", None)
+        if payload is not None:
+            self._unpack_lazy(payload)
+            return getattr(self, name)
+    raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+
+# Done with setattr so that mypy still checks attribute names on messages.
+setattr(MAVLink_message, "__getattr__", _message_getattr)
+
 
 class mavlink_msg_deprecated_name_property(object):
     """
@@ -454,7 +589,35 @@ def byname_hash_from_field_attribute(m, attribute):
     return ", ".join(strings)
 
 
-def generate_classes(outf, msgs, enums):
+# class attributes of the generated message classes, which fields can't
+# have slots for
+message_class_attributes = set(
+    [
+        "id",
+        "msgname",
+        "name",
+        "fieldnames",
+        "ordered_fieldnames",
+        "fieldtypes",
+        "fielddisplays_by_name",
+        "fieldenums_by_name",
+        "fieldunits_by_name",
+        "native_format",
+        "orders",
+        "lengths",
+        "array_lengths",
+        "unpack_order",
+        "unpack_arrays",
+        "unpack_strings",
+        "crc_extra",
+        "unpacker",
+        "instance_field",
+        "instance_offset",
+    ]
+)
+
+
+def generate_classes(outf, msgs, enums, slots=False):
     print("Generating class definitions")
     wrapper = textwrap.TextWrapper(initial_indent="    ", subsequent_indent="    ")
     for m in msgs:
@@ -516,6 +679,24 @@ def generate_classes(outf, msgs, enums):
             else:
                 init_fields.append("self.%s = %s" % (f.name, f.name))
 
+        slots_str = ""
+        if slots:
+            slot_names = []
+            for f in m.fields:
+                if f.name in message_class_attributes:
+                    # a slot can't share a name with a class attribute, so
+                    # these messages keep a __dict__ for the field
+                    if '"__dict__"' not in slot_names:
+                        slot_names.append('"__dict__"')
+                else:
+                    slot_names.append('"%s"' % f.name)
+                if f.type == "char":
+                    slot_names.append('"_%s_raw"' % f.name)
+            if len(slot_names) == 1:
+                slots_str = "\n    __slots__ = (%s,)" % slot_names[0]
+            else:
+                slots_str = "\n    __slots__ = (%s)" % ", ".join(slot_names)
+
         pack_fields = []
         for field in m.ordered_fields:
             if field.type == "char":
@@ -548,10 +729,13 @@ ${docstring}
     orders = ${orders}
     lengths = ${lengths}
     array_lengths = ${array_lengths}
+    unpack_order = ${unpack_order}
+    unpack_arrays = ${unpack_arrays}
+    unpack_strings = ${unpack_strings}
     crc_extra = ${crc_extra}
     unpacker = struct.Struct("${fmtstr}")
     instance_field = ${instance_field}
-    instance_offset = ${instance_offset}
+    instance_offset = ${instance_offset}${slots}
 
     def __init__(self, ${arg_fields}):
         MAVLink_message.__init__(self, ${classname}.id, ${classname}.msgname)
@@ -561,7 +745,7 @@ ${docstring}
         ${init_fields}
 
     def pack(self, mav: "MAVLink", force_mavlink1: bool = False) -> bytes:
-        return self._pack(mav, self.crc_extra, self.unpacker.pack(${pack_fields}), force_mavlink1=force_mavlink1)
+        return self._pack_fields(mav, force_mavlink1, ${pack_fields})
 
 
 # Define name on the class for backwards compatibility (it is now msgname).
@@ -583,12 +767,16 @@ setattr(${classname}, "name", mavlink_msg_deprecated_name_property())
                     "orders": m.order_map,
                     "lengths": m.len_map,
                     "array_lengths": m.array_len_map,
+                    "unpack_order": m.unpack_order,
+                    "unpack_arrays": m.unpack_arrays,
+                    "unpack_strings": m.unpack_strings,
                     "crc_extra": m.crc_extra,
                     "instance_field": instance_field,
                     "instance_offset": instance_offset,
                     "arg_fields": ", ".join(arg_fields),
                     "init_fields": "\n        ".join(init_fields),
                     "pack_fields": ", ".join(pack_fields),
+                    "slots": slots_str,
                 },
         )
 
@@ -688,6 +876,30 @@ mavlink_map: Dict[int, Type[MAVLink_message]] = {
         )
     outf.write("}\n\n")
 
+    # CRC extra bytes for the compiled parser, which checks CRCs itself
+    outf.write("mavlink_crc_extras: Dict[int, int] = {\n")
+    for m in msgs:
+        outf.write("    MAVLINK_MSG_ID_%s: %u,\n" % (m.name.upper(), m.crc_extra))
+    outf.write("}\n\n")
+
+    # reading a field named like a class attribute, such as id, finds the
+    # class attribute rather than calling __getattr__, so MAVLink.lazy_decode
+    # can't leave these messages packed
+    outf.write("_eager_decode_msgids: FrozenSet[int] = frozenset(\n    [\n")
+    for m in msgs:
+        if any(name in message_class_attributes for name in m.fieldnames):
+            outf.write("        MAVLINK_MSG_ID_%s,\n" % m.name.upper())
+    outf.write("    ]\n)\n\n")
+
+    params = dict(xml)
+    if xml["sort_fields"]:
+        params["decode_order"] = """# handle sorted fields, using the positions worked out by mavgen
+    tlist = [t[i] for i in msgtype.unpack_order]
+    for i, start, end in msgtype.unpack_arrays:
+        tlist[i] = list(t[start:end])"""
+    else:
+        params["decode_order"] = "tlist = list(t)"
+
     t.write(
         outf,
         '''
@@ -741,7 +953,8 @@ class MAVLinkSigning(object):
     """MAVLink signing state class"""
 
     def __init__(self) -> None:
-        self.secret_key: Optional[bytes] = None
+        self._secret_key: Optional[bytes] = None
+        self._key_hash: Optional["hashlib._Hash"] = None
         self.timestamp = 0
         self.link_id = 0
         self.sign_outgoing = False
@@ -753,6 +966,45 @@ class MAVLinkSigning(object):
         self.unsigned_count = 0
         self.reject_count = 0
 
+    @property
+    def secret_key(self) -> Optional[bytes]:
+        return self._secret_key
+
+    @secret_key.setter
+    def secret_key(self, secret_key: Optional[bytes]) -> None:
+        self._secret_key = secret_key
+        self._key_hash = None
+
+    def keyed_hash(self) -> "hashlib._Hash":
+        """return a SHA-256 hash that has already been given the secret key,
+        ready for the packet to be signed or checked. The key is only hashed
+        once, then the hash is copied for each packet"""
+        if self._key_hash is None:
+            assert self._secret_key is not None
+            self._key_hash = hashlib.sha256(self._secret_key)
+        return self._key_hash.copy()
+
+
+def _decode_fields(msgtype: Type[MAVLink_message], payload: Union[bytes, bytearray, memoryview]) -> List[Any]:
+    """unpack a message payload into the arguments for the message class"""
+    csize = msgtype.unpacker.size
+    if len(payload) < csize:
+        # zero pad to give right size
+        payload = bytearray(payload)
+        payload.extend([0] * (csize - len(payload)))
+    try:
+        t: Tuple[Union[bytes, int, float], ...] = msgtype.unpacker.unpack_from(payload)
+    except struct.error as emsg:
+        raise MAVError("Unable to unpack MAVLink payload type=%s payloadLength=%u: %s" % (msgtype, len(payload), emsg))
+
+    tlist: List[Union[bytes, float, int, Sequence[Union[bytes, float, int]]]]
+    ${decode_order}
+
+    # terminate any strings
+    for i in msgtype.unpack_strings:
+        tlist[i] = tlist[i].rstrip(b"\\x00")  # type: ignore
+    return tlist
+
 
 MAVLinkV1Header = Tuple[bytes, int, int, int, int, int]
 MAVLinkV2Header = Tuple[bytes, int, int, int, int, int, int, int, int]
@@ -785,6 +1037,7 @@ class MAVLink(object):
         self.total_packets_received = 0
         self.total_bytes_received = 0
         self.total_receive_errors = 0
+        self.total_packets_filtered = 0
         self.startup_time = time.time()
         self.signing = MAVLinkSigning()
         self.mav20_unpacker = struct.Struct("<cBBBBBBHB")
@@ -792,6 +1045,15 @@ class MAVLink(object):
         self.mav20_h3_unpacker = struct.Struct("BBB")
         self.mav_csum_unpacker = struct.Struct("<H")
         self.mav_sign_unpacker = struct.Struct("<IH")
+        # frame and CRC check incoming packets with the compiled parser
+        self.use_fast_parser = _parse_frame is not None
+        # leave the fields of incoming messages packed until they are read
+        self.lazy_decode = False
+        # message IDs to decode, see set_msgid_filter()
+        self._msgid_filter: Optional[FrozenSet[int]] = None
+        # called with (msgId, seq, srcSystem, srcComponent) for each frame dropped by the filter
+        self.filtered_callback: Optional[Callable[[int, int, int, int], None]] = None
+        self._crc_extras: Optional[Dict[int, int]] = mavlink_crc_extras if self.crc_extra else None
 
     def set_callback(self, callback: Callable[..., None], *args: Any, **kwargs: Any) -> None:
         self.callback = callback
@@ -803,6 +1065,13 @@ class MAVLink(object):
         self.send_callback_args = args
         self.send_callback_kwargs = kwargs
 
+    def set_msgid_filter(self, msgids: Optional[Iterable[int]]) -> None:
+        """only decode messages with the given IDs, or all messages if
+        msgids is None. Other frames are still CRC checked, but are then
+        counted in total_packets_filtered and passed to filtered_callback
+        instead of being decoded"""
+        self._msgid_filter = frozenset(msgids) if msgids is not None else None
+
     def send(self, mavmsg: MAVLink_message, force_mavlink1: bool = False) -> None:
         """send a MAVLink message"""
         buf = mavmsg.pack(self, force_mavlink1=force_mavlink1)
@@ -829,23 +1098,36 @@ class MAVLink(object):
         if self.callback is not None and self.callback_args is not None and self.callback_kwargs is not None:
             self.callback(msg, *self.callback_args, **self.callback_kwargs)
 
+    def __filtered(self, msgId: int, seq: int, srcSystem: int, srcComponent: int) -> None:
+        """count a frame dropped by the msgid filter"""
+        self.total_packets_filtered += 1
+        if self.filtered_callback is not None:
+            self.filtered_callback(msgId, seq, srcSystem, srcComponent)
+
     def parse_char(self, c: Sequence[int]) -> Optional[MAVLink_message]:
         """input some data bytes, possibly returning a new message"""
         self.buf.extend(c)
 
         self.total_bytes_received += len(c)
 
+        filtered = self.total_packets_filtered
         m = self.__parse_char_legacy()
+        while m is None and self.total_packets_filtered != filtered:
+            # a frame was dropped by the msgid filter, so try the next one
+            filtered = self.total_packets_filtered
+            m = self.__parse_char_legacy()
+
+        if self.buf_index != 0:
+            # drop the bytes which have been parsed, so the buffer only ever
+            # holds one partial frame plus whatever hasn't been parsed yet.
+            # Deleting from the front of a bytearray is cheap as the
+            # remaining bytes are only moved when it is resized
+            del self.buf[: self.buf_index]
+            self.buf_index = 0
 
         if m is not None:
             self.total_packets_received += 1
             self.__callbacks(m)
-        else:
-            # XXX The idea here is if we've read something and there's nothing left in
-            # the buffer, reset it to 0 which frees the memory
-            if self.buf_len() == 0 and self.buf_index != 0:
-                self.buf = bytearray()
-                self.buf_index = 0
 
         return m
 
@@ -873,9 +1155,10 @@ class MAVLink(object):
             self.total_receive_errors += 1
             raise MAVError("invalid MAVLink prefix '%s'" % magic)
         self.have_prefix_error = False
+        if self.use_fast_parser and self.buf_len() >= 3:
+            return self.__parse_frame_fast(header_len)
         if self.buf_len() >= 3:
-            sbuf = self.buf[self.buf_index : 3 + self.buf_index]
-            unpacked_h3: Tuple[int, int, int] = self.mav20_h3_unpacker.unpack(sbuf)
+            unpacked_h3: Tuple[int, int, int] = self.mav20_h3_unpacker.unpack_from(self.buf, self.buf_index)
             magic, self.expected_length, incompat_flags = unpacked_h3
             if magic == PROTOCOL_MARKER_V2 and (incompat_flags & MAVLINK_IFLAG_SIGNED):
                 self.expected_length += MAVLINK_SIGNATURE_BLOCK_LEN
@@ -888,17 +1171,41 @@ class MAVLink(object):
                 try:
                     if magic == PROTOCOL_MARKER_V2 and (incompat_flags & ~MAVLINK_IFLAG_SIGNED) != 0:
                         raise MAVError("invalid incompat_flags 0x%x 0x%x %u" % (incompat_flags, magic, self.expected_length))
-                    m = self.decode(mbuf)
+                    m = self.__decode(mbuf, self._msgid_filter)
                 except MAVError as reason:
                     m = MAVLink_bad_data(mbuf, reason.message)
                     self.total_receive_errors += 1
             else:
                 if magic == PROTOCOL_MARKER_V2 and (incompat_flags & ~MAVLINK_IFLAG_SIGNED) != 0:
                     raise MAVError("invalid incompat_flags 0x%x 0x%x %u" % (incompat_flags, magic, self.expected_length))
-                m = self.decode(mbuf)
+                m = self.__decode(mbuf, self._msgid_filter)
             return m
         return None
 
+    def __parse_frame_fast(self, header_len: int) -> Optional[MAVLink_message]:
+        """frame and decode the next message with the compiled parser"""
+        frame = _parse_frame(self.buf, self.buf_index, self._crc_extras)
+        if not isinstance(frame, tuple):
+            # incomplete, so frame is the number of bytes needed
+            self.expected_length = frame
+            return None
+        magic, mlen, incompat_flags = frame[2][:3]
+        mbuf = self.buf[self.buf_index : self.buf_index + frame[0]]
+        self.buf_index += frame[0]
+        self.expected_length = header_len + 2
+        try:
+            if magic == PROTOCOL_MARKER_V2 and (incompat_flags & ~MAVLINK_IFLAG_SIGNED) != 0:
+                raise MAVError("invalid incompat_flags 0x%x 0x%x %u" % (incompat_flags, magic, self.expected_length))
+            return self.__decode_frame(mbuf, frame, self._msgid_filter)
+        except MAVError as reason:
+            if not self.robust_parsing:
+                raise
+            self.total_receive_errors += 1
+            return MAVLink_bad_data(mbuf, reason.message)
+        finally:
+            # the payload is a view of self.buf, which can't grow until it is released
+            frame[3].release()
+
     def parse_buffer(self, s: Sequence[int]) -> Optional[List[MAVLink_message]]:
         """input some data bytes, possibly returning a list of new messages"""
         m = self.parse_char(s)
@@ -911,10 +1218,73 @@ class MAVLink(object):
                 return ret
             ret.append(m)
 
+    def __parse_next(self) -> Tuple[Optional[MAVLink_message], bool]:
+        """parse the next message in the buffer for parse_many() and
+        parse_iter(), returning it and whether any input was used. Bad data
+        is dropped and counted rather than raising MAVError"""
+        start = self.buf_index
+        errors = self.total_receive_errors
+        try:
+            m = self.__parse_char_legacy()
+        except MAVError:
+            if self.total_receive_errors == errors:
+                self.total_receive_errors += 1
+            return (None, True)
+        return (m, self.buf_index != start)
+
+    def parse_many(self, s: Sequence[int]) -> List[MAVLink_message]:
+        """input some data bytes, returning a list of all the messages in
+        them. The callback is called for each message once the whole buffer
+        has been parsed"""
+        self.buf.extend(s)
+        self.total_bytes_received += len(s)
+        ret = []
+        while True:
+            m, progress = self.__parse_next()
+            if m is not None:
+                ret.append(m)
+            elif not progress:
+                break
+        if self.buf_index != 0:
+            del self.buf[: self.buf_index]
+            self.buf_index = 0
+        self.total_packets_received += len(ret)
+        for m in ret:
+            self.__callbacks(m)
+        return ret
+
+    def parse_iter(self, s: Sequence[int]) -> Iterator[MAVLink_message]:
+        """input some data bytes, returning an iterator over the messages in
+        them, which are parsed as they are asked for"""
+        self.buf.extend(s)
+        self.total_bytes_received += len(s)
+        while True:
+            m, progress = self.__parse_next()
+            if m is not None:
+                self.total_packets_received += 1
+                self.__callbacks(m)
+                yield m
+            elif not progress:
+                break
+        if self.buf_index != 0:
+            del self.buf[: self.buf_index]
+            self.buf_index = 0
+
     def check_signature(self, msgbuf: bytearray, srcSystem: int, srcComponent: int) -> bool:
         """check signature on incoming message"""
         assert self.signing.secret_key is not None
+        return self.__check_signature(msgbuf, srcSystem, srcComponent, self.signing.keyed_hash())
 
+    def check_signatures(self, msgbufs: Iterable[bytearray]) -> List[bool]:
+        """check the signatures on a batch of signed MAVLink2 frames, in the
+        order they were received, returning whether each one is good"""
+        assert self.signing.secret_key is not None
+        h = self.signing.keyed_hash()
+        return [self.__check_signature(msgbuf, msgbuf[5], msgbuf[6], h.copy()) for msgbuf in msgbufs]
+
+    def __check_signature(self, msgbuf: bytearray, srcSystem: int, srcComponent: int, h: "hashlib._Hash") -> bool:
+        """check signature on incoming message, with h already given the
+        secret key"""
         timestamp_buf = msgbuf[-12:-6]
         link_id = msgbuf[-13]
         tbytes: Tuple[int, int] = self.mav_sign_unpacker.unpack(timestamp_buf)
@@ -939,8 +1309,6 @@ class MAVLink(object):
         # set the streams timestamp so we reject timestamps that go backwards
         self.signing.stream_timestamps[stream_key] = timestamp
 
-        h = hashlib.new("sha256")
-        h.update(self.signing.secret_key)
         h.update(msgbuf[:-6])
         sig1 = h.digest()[:6]
         sig2 = msgbuf[-6:]
@@ -955,11 +1323,28 @@ class MAVLink(object):
 
     def decode(self, msgbuf: bytearray) -> MAVLink_message:
         """decode a buffer as a MAVLink message"""
+        m = self.__decode(msgbuf, None)
+        assert m is not None
+        return m
+
+    def __decode(self, msgbuf: bytearray, msgid_filter: Optional[FrozenSet[int]]) -> Optional[MAVLink_message]:
+        """decode a buffer as a MAVLink message, returning None if its ID
+        isn't in msgid_filter"""
+        if self.use_fast_parser:
+            frame = _parse_frame(msgbuf, 0, self._crc_extras)
+            if isinstance(frame, tuple):
+                try:
+                    if frame[0] == len(msgbuf):
+                        return self.__decode_frame(msgbuf, frame, msgid_filter)
+                finally:
+                    frame[3].release()
+            # anything else goes through the Python parser to find the problem
+
         # decode the header
         if msgbuf[0] != PROTOCOL_MARKER_V1:
             headerlen = 10
             try:
-                header_v2: MAVLinkV2Header = self.mav20_unpacker.unpack(msgbuf[:headerlen])
+                header_v2: MAVLinkV2Header = self.mav20_unpacker.unpack_from(msgbuf)
             except struct.error as emsg:
                 raise MAVError("Unable to unpack MAVLink header: %s" % emsg)
             magic, mlen, incompat_flags, compat_flags, seq, srcSystem, srcComponent, msgIdlow, msgIdhigh = header_v2
@@ -967,7 +1352,7 @@ class MAVLink(object):
         else:
             headerlen = 6
             try:
-                header_v1: MAVLinkV1Header = self.mav10_unpacker.unpack(msgbuf[:headerlen])
+                header_v1: MAVLinkV1Header = self.mav10_unpacker.unpack_from(msgbuf)
             except struct.error as emsg:
                 raise MAVError("Unable to unpack MAVLink header: %s" % emsg)
             magic, mlen, seq, srcSystem, srcComponent, msgId = header_v1
@@ -985,17 +1370,18 @@ class MAVLink(object):
             raise MAVError("invalid MAVLink message length. Got %u expected %u, msgId=%u headerlen=%u" % (len(msgbuf) - (headerlen + 2 + signature_len), mlen, msgId, headerlen))
 
         if mapkey not in mavlink_map:
+            if msgid_filter is not None and msgId not in msgid_filter:
+                self.__filtered(msgId, seq, srcSystem, srcComponent)
+                return None
             return MAVLink_unknown(msgId, msgbuf)
 
         # decode the payload
         msgtype = mavlink_map[mapkey]
-        order_map = msgtype.orders
-        len_map = msgtype.lengths
         crc_extra = msgtype.crc_extra
 
         # decode the checksum
         try:
-            crc: int = self.mav_csum_unpacker.unpack(msgbuf[-(2 + signature_len) :][:2])[0]
+            crc: int = self.mav_csum_unpacker.unpack_from(msgbuf, len(msgbuf) - (2 + signature_len))[0]
         except struct.error as emsg:
             raise MAVError("Unable to unpack MAVLink CRC: %s" % emsg)
         crcbuf = msgbuf[1 : -(2 + signature_len)]
@@ -1006,6 +1392,68 @@ class MAVLink(object):
         if crc != crc2.crc and not MAVLINK_IGNORE_CRC:
             raise MAVError("invalid MAVLink CRC in msgID %u 0x%04x should be 0x%04x" % (msgId, crc, crc2.crc))
 
+        if msgid_filter is not None and msgId not in msgid_filter:
+            self.__filtered(msgId, seq, srcSystem, srcComponent)
+            return None
+
+        payload = memoryview(msgbuf)[headerlen : -(2 + signature_len)]
+        try:
+            return self.__decode_payload(msgbuf, msgtype, msgId, incompat_flags, compat_flags, mlen, seq, srcSystem, srcComponent, crc, signature_len, payload)
+        finally:
+            payload.release()
+
+    def __decode_frame(
+        self,
+        msgbuf: bytearray,
+        frame: Tuple[int, int, Tuple[int, int, int, int, int, int, int], memoryview, int, Optional[bool]],
+        msgid_filter: Optional[FrozenSet[int]],
+    ) -> Optional[MAVLink_message]:
+        """decode a message framed by the compiled parser"""
+        frame_len, msgId, header, payload, crc, crc_ok = frame
+        magic, mlen, incompat_flags, compat_flags, seq, srcSystem, srcComponent = header
+
+        if msgId not in mavlink_map:
+            if msgid_filter is not None and msgId not in msgid_filter:
+                self.__filtered(msgId, seq, srcSystem, srcComponent)
+                return None
+            return MAVLink_unknown(msgId, msgbuf)
+        msgtype = mavlink_map[msgId]
+        if (incompat_flags & MAVLINK_IFLAG_SIGNED) != 0:
+            signature_len = MAVLINK_SIGNATURE_BLOCK_LEN
+        else:
+            signature_len = 0
+
+        if not crc_ok:
+            # crc_ok is None for messages added to mavlink_map at runtime
+            crcbuf = msgbuf[1 : -(2 + signature_len)]
+            if ${crc_extra}:
+                crcbuf.append(msgtype.crc_extra)
+            crc2 = x25crc(crcbuf)
+            if crc != crc2.crc and not MAVLINK_IGNORE_CRC:
+                raise MAVError("invalid MAVLink CRC in msgID %u 0x%04x should be 0x%04x" % (msgId, crc, crc2.crc))
+
+        if msgid_filter is not None and msgId not in msgid_filter:
+            self.__filtered(msgId, seq, srcSystem, srcComponent)
+            return None
+
+        return self.__decode_payload(msgbuf, msgtype, msgId, incompat_flags, compat_flags, mlen, seq, srcSystem, srcComponent, crc, signature_len, payload)
+
+    def __decode_payload(
+        self,
+        msgbuf: bytearray,
+        msgtype: Type[MAVLink_message],
+        msgId: int,
+        incompat_flags: int,
+        compat_flags: int,
+        mlen: int,
+        seq: int,
+        srcSystem: int,
+        srcComponent: int,
+        crc: int,
+        signature_len: int,
+        payload: Union[bytearray, memoryview],
+    ) -> MAVLink_message:
+        """check the signature of a message with a good CRC and unpack its payload"""
         sig_ok = False
         if signature_len == MAVLINK_SIGNATURE_BLOCK_LEN:
             self.signing.sig_count += 1
@@ -1033,51 +1481,24 @@ class MAVLink(object):
             if not accept_signature:
                 raise MAVError("Invalid signature")
 
-        csize = msgtype.unpacker.size
-        mbuf = msgbuf[headerlen : -(2 + signature_len)]
-        if len(mbuf) < csize:
-            # zero pad to give right size
-            mbuf.extend([0] * (csize - len(mbuf)))
-        if len(mbuf) < csize:
-            raise MAVError("Bad message of type %s length %u needs %s" % (msgtype, len(mbuf), csize))
-        mbuf = mbuf[:csize]
-        try:
-            t: Tuple[Union[bytes, int, float], ...] = msgtype.unpacker.unpack(mbuf)
-        except struct.error as emsg:
-            raise MAVError("Unable to unpack MAVLink payload type=%s payloadLength=%u: %s" % (msgtype, len(mbuf), emsg))
-
-        tlist: List[Union[bytes, float, int, Sequence[Union[bytes, float, int]]]] = list(t)
-        # handle sorted fields
-        if ${sort_fields}:
-            if sum(len_map) == len(len_map):
-                # message has no arrays in it
-                for i in range(0, len(tlist)):
-                    tlist[i] = t[order_map[i]]
-            else:
-                # message has some arrays
-                tlist = []
-                for i in range(0, len(order_map)):
-                    order = order_map[i]
-                    L = len_map[order]
-                    tip = sum(len_map[:order])
-                    field = t[tip]
-                    if L == 1 or isinstance(field, bytes):
-                        tlist.append(field)
-                    else:
-                        tlist.append(list(t[tip : (tip + L)]))
-
-        # terminate any strings
-        for i, elem in enumerate(tlist):
-            if isinstance(elem, bytes):
-                tlist[i] = elem.rstrip(b"\\x00")
+        m: MAVLink_message
+        if self.lazy_decode and msgId not in _eager_decode_msgids:
+            # only the header is decoded now, the fields are unpacked when
+            # one of them is first read
+            m = msgtype.__new__(msgtype)
+            MAVLink_message.__init__(m, msgtype.id, msgtype.msgname)
+            m._fieldnames = msgtype.fieldnames
+            m._instance_field = msgtype.instance_field
+            m._instance_offset = msgtype.instance_offset  # type: ignore
+            m._lazy_payload = bytes(payload)
+        else:
+            tlist = _decode_fields(msgtype, payload)
 
-        # construct the message object
-        try:
-            # Note that initializers don't follow the Liskov Substitution Principle
-            # therefore it can't be typechecked
-            m = msgtype(*tlist)  # type: ignore
-        except Exception as emsg:
-            raise MAVError("Unable to instantiate MAVLink message of type %s : %s" % (msgtype, emsg))
+            # construct the message object
+            try:
+                m = msgtype(*tlist)
+            except Exception as emsg:
+                raise MAVError("Unable to instantiate MAVLink message of type %s : %s" % (msgtype, emsg))
         m._signed = sig_ok
         if m._signed:
             m._link_id = msgbuf[-13]
@@ -1087,7 +1508,7 @@ class MAVLink(object):
         m._header = MAVLink_header(msgId, incompat_flags, compat_flags, mlen, seq, srcSystem, srcComponent)
         return m
 ''',
-        xml,
+        params,
     )
 
 
@@ -1156,8 +1577,10 @@ def generate_methods(outf, msgs):
         )
 
 
-def generate(basename, xml):
-    """generate complete python implementation"""
+def generate(basename, xml, slots=False):
+    """generate complete python implementation. If slots is True the
+    message classes are generated with __slots__, which makes them smaller
+    but means no other attributes can be set on them"""
     if basename.endswith(".py"):
         filename = basename
     else:
@@ -1194,14 +1617,27 @@ def generate(basename, xml):
         for i in range(0, len(m.fieldnames)):
             n = m.order_map[i]
             m.len_map[n] = m.fieldlengths[i]
+        # where each field is in the unpacked payload, so decoding doesn't
+        # have to work it out for every message
+        m.unpack_order = []
+        m.unpack_arrays = []
+        m.unpack_strings = []
+        for i in range(0, len(m.fieldnames)):
+            n = m.order_map[i]
+            tip = sum(m.len_map[:n])
+            m.unpack_order.append(tip)
+            if m.len_map[n] > 1:
+                m.unpack_arrays.append((i, tip, tip + m.len_map[n]))
+            if m.fieldtypes[i] == "char":
+                m.unpack_strings.append(i if xml[0].sort_fields else tip)
 
     print("Generating %s" % filename)
     outf = open(filename, "w")
     xml = xml[0].__dict__
-    generate_preamble(outf, msgs, basename, filelist, xml)
+    generate_preamble(outf, msgs, basename, filelist, xml, slots)
     generate_enums(outf, enums)
     generate_message_ids(outf, msgs)
-    generate_classes(outf, msgs, enums)
+    generate_classes(outf, msgs, enums, slots)
     generate_mavlink_class(outf, msgs, xml)
     generate_methods(outf, msgs)
     outf.close()
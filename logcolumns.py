@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+'''
+write the messages of a log as typed columns
+
+Messages are collected per type and written out in batches, one file
+per message type, so a log of any size can be converted in one pass
+with a bounded amount of memory. Each file holds a column per field
+with the type it has in the message definition, plus a 'timestamp'
+column with the time recv_match() gave the message.
+
+Three formats are supported:
+
+ parquet  one .parquet file per type, needs pyarrow
+ arrow    one .arrow file per type in the Arrow IPC file format, needs pyarrow
+ npz      one .npz file per type holding a .npy array per column, as
+          numpy.load() reads, needs numpy
+
+columnar picks parquet if pyarrow is available, otherwise npz.
+
+For npz the columns are streamed into temporary files in the output
+directory and gathered into the .npz when the writer is closed.
+
+Released under GNU LGPL version 3 or later
+'''
+
+import os
+import operator
+import shutil
+import tempfile
+import zipfile
+
+FORMATS = ['columnar', 'parquet', 'arrow', 'npz']
+
+FORMAT_EXTENSIONS = {
+    'parquet': '.parquet',
+    'arrow': '.arrow',
+    'npz': '.npz',
+}
+
+# rows of one type to collect before writing them out
+BATCH_ROWS = 1 << 16
+
+# rows of all types to hold before writing them all out
+BUFFER_ROWS = 1 << 17
+
+# numpy types for MAVLink field types
+MAVLINK_TO_DTYPE = {
+    'int8_t': 'i1',
+    'uint8_t': 'u1',
+    'uint8_t_mavlink_version': 'u1',
+    'int16_t': '<i2',
+    'uint16_t': '<u2',
+    'int32_t': '<i4',
+    'uint32_t': '<u4',
+    'int64_t': '<i8',
+    'uint64_t': '<u8',
+    'float': '<f4',
+    'double': '<f8',
+}
+
+
+def have_pyarrow():
+    '''return True if pyarrow is available'''
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_format(format):
+    '''return the format to write for format, choosing one for columnar'''
+    if format not in FORMATS:
+        raise ValueError("Unknown columnar format %s" % format)
+    if format == 'columnar':
+        if have_pyarrow():
+            return 'parquet'
+        return 'npz'
+    return format
+
+
+def dataflash_layout(m):
+    '''return the column names, numpy types and a function giving the
+    values of a dataflash message'''
+    from pymavlink import DFReader
+    fmt = m.fmt
+    dtypes = []
+    for (i, c) in enumerate(fmt.msg_fmts):
+        if fmt.msg_mults[i] is not None:
+            dtypes.append('<f8')
+        elif c in 'nNZ' and not (c == 'Z' and fmt.name == 'FILE'):
+            # decoded into str, which is never longer than the bytes
+            dtypes.append('<U%u' % int(DFReader.FORMAT_TO_DTYPE[c][1:]))
+        elif c == 'g':
+            # half precision floats are not supported by parquet
+            dtypes.append('<f4')
+        else:
+            dtypes.append(DFReader.FORMAT_TO_DTYPE[c])
+    return (list(fmt.columns), dtypes, lambda m: m._values())
+
+
+def mavlink_layout(m):
+    '''return the column names, numpy types and a function giving the
+    values of a MAVLink message'''
+    names = list(m.fieldnames)
+    lengths = dict(zip(m.ordered_fieldnames, m.array_lengths))
+    dtypes = []
+    for (name, ftype) in zip(names, m.fieldtypes):
+        length = lengths.get(name, 0)
+        if ftype == 'char':
+            dtypes.append('<U%u' % max(length, 1))
+        elif length > 0:
+            dtypes.append((MAVLINK_TO_DTYPE[ftype], (length,)))
+        else:
+            dtypes.append(MAVLINK_TO_DTYPE[ftype])
+    if len(names) == 1:
+        get = lambda m: (getattr(m, names[0]),)
+    else:
+        get = operator.attrgetter(*names)
+    return (names, dtypes, get)
+
+
+def message_layout(m):
+    '''return the column names, numpy types and a function giving the
+    values of a message, or None if it has no fixed layout'''
+    if m.get_type() == 'BAD_DATA':
+        return None
+    if hasattr(m, 'fmt') and hasattr(m, '_values'):
+        return dataflash_layout(m)
+    if hasattr(m, 'fieldtypes') and hasattr(m, 'array_lengths'):
+        if len(m.fieldnames) == 0:
+            # messages the dialect doesn't know have no fields
+            return None
+        try:
+            return mavlink_layout(m)
+        except KeyError:
+            return None
+    return None
+
+
+def to_string(s):
+    '''convert bytes found in a string column to str'''
+    if isinstance(s, bytes):
+        return s.decode(errors="backslashreplace")
+    return s
+
+
+def _arrow_type(dtype):
+    '''return the arrow type of a column with numpy type dtype'''
+    import pyarrow as pa
+    if dtype.kind == 'U':
+        return pa.string()
+    if dtype.kind == 'S':
+        return pa.binary()
+    if dtype.shape:
+        return pa.list_(pa.from_numpy_dtype(dtype.base), dtype.shape[0])
+    return pa.from_numpy_dtype(dtype)
+
+
+def _arrow_array(a, type):
+    '''return an arrow array of type holding the numpy column a'''
+    import pyarrow as pa
+    if a.ndim > 1:
+        return pa.FixedSizeListArray.from_arrays(pa.array(a.reshape(-1)), a.shape[1])
+    if a.dtype.kind in 'US':
+        return pa.array(a.tolist(), type=type)
+    return pa.array(a)
+
+
+class ArrowTable(object):
+    '''a parquet or arrow IPC file of one message type'''
+    def __init__(self, filename, columns, format):
+        import pyarrow as pa
+        self.schema = pa.schema([pa.field(name, _arrow_type(dtype)) for (name, dtype) in columns])
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(filename, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(filename, self.schema)
+
+    def write(self, arrays):
+        '''write a batch of columns'''
+        import pyarrow as pa
+        table = pa.Table.from_arrays([_arrow_array(a, f.type) for (a, f) in zip(arrays, self.schema)],
+                                     schema=self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+class NpzTable(object):
+    '''a .npz file of one message type, written when closed'''
+    def __init__(self, filename, columns, compress=False):
+        self.filename = filename
+        self.columns = columns
+        self.compress = compress
+        self.count = 0
+        directory = os.path.dirname(os.path.abspath(filename))
+        self.files = [tempfile.TemporaryFile(dir=directory) for c in columns]
+
+    def write(self, arrays):
+        '''write a batch of columns'''
+        for (f, a) in zip(self.files, arrays):
+            f.write(a.tobytes())
+        self.count += len(arrays[0])
+
+    def close(self):
+        import numpy as np
+        compression = zipfile.ZIP_STORED
+        if self.compress:
+            compression = zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(self.filename, mode='w', compression=compression, allowZip64=True) as z:
+            for ((name, dtype), f) in zip(self.columns, self.files):
+                header = {'descr': np.lib.format.dtype_to_descr(dtype.base),
+                          'fortran_order': False,
+                          'shape': (self.count,) + dtype.shape}
+                with z.open(name + '.npy', mode='w', force_zip64=True) as out:
+                    np.lib.format.write_array_header_1_0(out, header)
+                    f.seek(0)
+                    shutil.copyfileobj(f, out)
+                f.close()
+
+
+class MessageColumns(object):
+    '''the rows of one message type waiting to be written'''
+    def __init__(self, names, dtypes, get, extra=[]):
+        import numpy as np
+        self.get = get
+        names = list(names)
+        dtypes = [np.dtype(d) for d in dtypes]
+        tsname = 'timestamp'
+        if tsname in names:
+            tsname = '_timestamp'
+        self.columns = [(tsname, np.dtype('<f8'))] + list(zip(names, dtypes))
+        self.columns += [(name, np.dtype(d)) for (name, d) in extra]
+        self.rows = []
+        self.table = None
+
+    def arrays(self):
+        '''return the waiting rows as numpy arrays, one per column'''
+        import numpy as np
+        ret = []
+        for ((name, dtype), values) in zip(self.columns, zip(*self.rows)):
+            if dtype.kind == 'U':
+                values = [to_string(v) for v in values]
+            ret.append(np.array(values, dtype=dtype.base))
+        return ret
+
+
+class ColumnWriter(object):
+    '''write messages to a directory as typed columns, one file per
+    message type'''
+    def __init__(self, directory, format='columnar', batch_rows=BATCH_ROWS,
+                 buffer_rows=BUFFER_ROWS, show_source=False, compress=False):
+        # fail now rather than at the first message if numpy is missing
+        import numpy
+        self.directory = directory
+        self.format = resolve_format(format)
+        if self.format in ['parquet', 'arrow'] and not have_pyarrow():
+            raise ImportError("pyarrow is needed to write %s files" % self.format)
+        self.batch_rows = batch_rows
+        self.buffer_rows = buffer_rows
+        self.show_source = show_source
+        self.compress = compress
+        self.types = {}
+        self.skipped = set()
+        self.buffered = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def filename(self, mtype):
+        '''return the file holding messages of type mtype'''
+        return os.path.join(self.directory, mtype + FORMAT_EXTENSIONS[self.format])
+
+    def add(self, m, timestamp):
+        '''add a message, returning False if it has no fixed layout and
+        was skipped'''
+        mtype = m.get_type()
+        t = self.types.get(mtype, None)
+        if t is None:
+            if mtype in self.skipped:
+                return False
+            layout = message_layout(m)
+            if layout is None:
+                self.skipped.add(mtype)
+                return False
+            extra = []
+            source = self.show_source and hasattr(m, 'fieldtypes')
+            if source:
+                extra = [('srcSystem', 'u1'), ('srcComponent', 'u1')]
+            t = MessageColumns(*layout, extra=extra)
+            t.source = source
+            self.types[mtype] = t
+        row = [timestamp]
+        row.extend(t.get(m))
+        if t.source:
+            row.append(m.get_srcSystem())
+            row.append(m.get_srcComponent())
+        t.rows.append(row)
+        self.buffered += 1
+        if len(t.rows) >= self.batch_rows:
+            self.write(mtype)
+        elif self.buffered >= self.buffer_rows:
+            self.flush()
+        return True
+
+    def write(self, mtype):
+        '''write out the waiting rows of one type'''
+        t = self.types[mtype]
+        if len(t.rows) == 0:
+            return
+        if t.table is None:
+            if self.format == 'npz':
+                t.table = NpzTable(self.filename(mtype), t.columns, compress=self.compress)
+            else:
+                t.table = ArrowTable(self.filename(mtype), t.columns, self.format)
+        t.table.write(t.arrays())
+        self.buffered -= len(t.rows)
+        t.rows = []
+
+    def flush(self):
+        '''write out the waiting rows of all types'''
+        for mtype in self.types:
+            self.write(mtype)
+
+    def close(self):
+        '''write out the remaining rows and finish the files'''
+        self.flush()
+        for t in self.types.values():
+            if t.table is not None:
+                t.table.close()
+                t.table = None
+
+    def filenames(self):
+        '''return the files written, by message type'''
+        return dict((mtype, self.filename(mtype)) for mtype in sorted(self.types))
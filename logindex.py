@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+'''
+persistent sidecar indexes for log files
+
+Opening a large log means scanning it to build per-type offset tables
+and the clock base. This module stores the result of that scan in a
+sidecar file next to the log so that later opens can skip the scan.
+
+A sidecar is only used if it was written for exactly the same log
+contents: the file size, modification time and a hash of the start
+and end of the file are recorded in the index and checked on load.
+
+Released under GNU LGPL version 3 or later
+'''
+
+import array
+import hashlib
+import json
+import os
+import struct
+import sys
+
+# bump this if the on-disk layout changes
+FORMAT_VERSION = 1
+
+MAGIC = b'PYMAVIDX'
+INDEX_SUFFIX = '.pmidx'
+
+# number of bytes at each end of the log included in the content hash
+HASH_LEN = 65536
+
+_header = struct.Struct('<8sII')
+
+
+def index_filename(filename):
+    '''return the sidecar filename for a log'''
+    return filename + INDEX_SUFFIX
+
+
+def file_key(filename, data_map=None, **extra):
+    '''return a key identifying the current contents of a log file.
+    Extra keyword arguments are included in the key, so that readers can
+    invalidate an index when options which affect its contents change'''
+    st = os.stat(filename)
+    size = st.st_size
+    h = hashlib.sha256()
+    if data_map is not None:
+        h.update(data_map[:HASH_LEN])
+        h.update(data_map[max(0, size-HASH_LEN):size])
+    else:
+        with open(filename, 'rb') as f:
+            h.update(f.read(HASH_LEN))
+            f.seek(max(0, size-HASH_LEN))
+            h.update(f.read(HASH_LEN))
+    key = {
+        'format_version': FORMAT_VERSION,
+        'size': size,
+        'mtime_ns': st.st_mtime_ns,
+        'digest': h.hexdigest(),
+    }
+    key.update(extra)
+    return key
+
+
+def save(filename, key, meta, arrays):
+    '''save an index for filename. meta must be JSON serialisable, arrays
+    is a dictionary of sequences of unsigned 64 bit integers. Returns True
+    on success; failure to write the index is not an error'''
+    path = index_filename(filename)
+    names = sorted(arrays.keys())
+    blobs = []
+    lengths = []
+    for name in names:
+        a = arrays[name]
+        try:
+            # offset arrays from the indexers support the buffer protocol
+            view = memoryview(a)
+            if view.format != 'Q':
+                raise TypeError
+        except TypeError:
+            view = memoryview(array.array('Q', a))
+        if sys.byteorder != 'little':
+            swapped = array.array('Q', view)
+            swapped.byteswap()
+            view = memoryview(swapped)
+        blobs.append(view.tobytes())
+        lengths.append(len(view))
+    header = json.dumps({'key': key,
+                         'meta': meta,
+                         'arrays': list(zip(names, lengths))}).encode('utf-8')
+    tmp_path = path + '.tmp%u' % os.getpid()
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_header.pack(MAGIC, FORMAT_VERSION, len(header)))
+            f.write(header)
+            for b in blobs:
+                f.write(b)
+        os.replace(tmp_path, path)
+    except (IOError, OSError):
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+
+def load(filename, key):
+    '''load the index for filename, returning a (meta, arrays) tuple, or
+    None if there is no usable index matching key'''
+    path = index_filename(filename)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    if len(data) < _header.size:
+        return None
+    (magic, version, header_len) = _header.unpack(data[:_header.size])
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    ofs = _header.size
+    try:
+        header = json.loads(data[ofs:ofs+header_len].decode('utf-8'))
+    except ValueError:
+        return None
+    if header.get('key') != key:
+        return None
+    ofs += header_len
+    arrays = {}
+    for (name, length) in header['arrays']:
+        nbytes = length * 8
+        if ofs + nbytes > len(data):
+            return None
+        a = array.array('Q')
+        a.frombytes(data[ofs:ofs+nbytes])
+        if sys.byteorder != 'little':
+            a.byteswap()
+        arrays[name] = a
+        ofs += nbytes
+    return (header['meta'], arrays)
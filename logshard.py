@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+'''
+process a log in parallel shards
+
+A log is split into shards at message boundaries taken from the offset
+index of its reader, and a function is run over each shard in a pool of
+worker processes, each of which opens the log itself and so has its own
+mmap of it. The results come back in log order, to be merged by the
+caller.
+
+Each worker sees the log through a reader positioned with seek_offset()
+at the start of its shard, with the latest message of each type before
+that point loaded, and stopping at the end of the shard as if the log
+ended there. Packet loss counting starts again at the start of each
+shard; first_seq and last_seq on the reader let the counts be joined.
+Bad data running up to the start of a shard can be reported differently
+from reading the whole log, as the parser stops at the end of a shard
+rather than running on into the next one.
+
+Only dataflash binary logs and telemetry logs opened with mavmmaplog can
+be split. Anything else is processed as one shard in the calling
+process.
+
+Released under GNU LGPL version 3 or later
+'''
+
+import os
+
+from pymavlink import mavutil
+
+# smallest part of a log worth handing to a separate process
+MIN_SHARD_SIZE = 1 << 20
+
+
+def default_jobs():
+    '''the number of worker processes to use if not given, from the
+    PYMAVLINK_LOG_JOBS environment variable, with 0 meaning one per CPU'''
+    jobs = int(os.getenv('PYMAVLINK_LOG_JOBS', '1'))
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    return jobs
+
+
+def shard_bounds(log, shards):
+    '''split an open log into up to shards (start, end) offset ranges of
+    about the same size, each starting at a message, the last ending with
+    None for the end of the log'''
+    if isinstance(log.offsets, dict):
+        types = list(log.offsets.keys())
+    else:
+        types = [t for t in range(len(log.counts)) if log.counts[t] > 0]
+    cursor = mavutil.TypeCursor([log.offsets[t] for t in types],
+                                [log.counts[t] for t in types])
+    starts = [0]
+    for i in range(1, shards):
+        cursor.seek(log.data_len * i // shards)
+        ofs = cursor.next()
+        if ofs is None:
+            break
+        if ofs > starts[-1]:
+            starts.append(ofs)
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def open_shard(filename, start, end, log=None, **opts):
+    '''open a log, or reuse log, positioned to read the shard from start
+    to end'''
+    if log is None:
+        log = mavutil.mavlink_connection(filename, **opts)
+    log.seek_offset(start, end)
+    if isinstance(log, mavutil.mavfile):
+        # count packet loss within the shard
+        log.reset_packet_loss()
+    return log
+
+
+def _run_shard(filename, start, end, func, args, opts):
+    '''run func over one shard in a worker process'''
+    log = open_shard(filename, start, end, **opts)
+    try:
+        return func(log, *args)
+    finally:
+        log.close()
+
+
+def map_log(filename, func, args=(), jobs=None, shards=None, **opts):
+    '''run func(log, *args) over shards of a log, returning the list of
+    results in log order.
+
+    jobs is the number of worker processes, defaulting to
+    default_jobs(), and shards the number of pieces to split the log
+    into, defaulting to jobs with none smaller than MIN_SHARD_SIZE. With
+    one job the shards are run one after another in this process. Other
+    keyword arguments are passed on to mavutil.mavlink_connection() to
+    open the log. With more than one worker the index of the log is kept
+    in a sidecar file, so that the workers don't each have to scan the
+    log.
+
+    func, args and the results have to be picklable, so func should be
+    a module level function.
+    '''
+    if jobs is None:
+        jobs = default_jobs()
+    if shards is None:
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            size = 0
+        shards = max(1, min(jobs, size // MIN_SHARD_SIZE))
+    parallel = jobs > 1 and shards > 1
+    if parallel:
+        opts.setdefault('cache_index', True)
+    log = mavutil.mavlink_connection(filename, **opts)
+    try:
+        if shards <= 1 or not hasattr(log, 'seek_offset') or log.data_len == 0:
+            return [func(log, *args)]
+        bounds = shard_bounds(log, shards)
+        if not parallel or len(bounds) == 1:
+            results = []
+            for (start, end) in bounds:
+                results.append(func(open_shard(filename, start, end, log=log), *args))
+            return results
+    finally:
+        log.close()
+
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_run_shard, filename, start, end, func, args, opts)
+                   for (start, end) in bounds]
+        return [f.result() for f in futures]
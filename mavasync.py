@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+'''
+asyncio MAVLink connections
+
+The connections in mavutil poll their sockets, so each link needs its
+own thread to wait for messages. The connections here are driven by an
+asyncio event loop instead, so one loop can serve many links:
+
+    conn = await mavasync.mavlink_connection_async("udpin:0.0.0.0:14550")
+    await conn.wait_heartbeat()
+    async for msg in conn:
+        ...
+
+Each connection is a mavutil.mavfile, so messages go through the same
+parser and post_message() state tracking, and the MAVLink send methods
+in conn.mav write to the transport without blocking. recv_match() and
+wait_heartbeat() are coroutines here. The other mavfile methods that
+block waiting for messages are not supported.
+
+Released under GNU LGPL version 3 or later
+'''
+
+import asyncio
+import os
+import socket
+import time
+
+from pymavlink import mavutil
+
+
+class mavasync(mavutil.mavfile):
+    '''a mavlink connection on an asyncio transport. Data from the
+    transport is buffered until recv_msg() parses it'''
+    def __init__(self, device, source_system=255, source_component=0, input=True, use_native=mavutil.default_native):
+        self.transport = None
+        self._rbuf = bytearray()
+        self._data_event = asyncio.Event()
+        mavutil.mavfile.__init__(self, None, device, source_system=source_system, source_component=source_component, input=input, use_native=use_native)
+
+    def data_received(self, data, addr=None):
+        '''called by the protocol with data from the transport'''
+        self._rbuf += data
+        self._data_event.set()
+
+    def connection_lost(self, exc):
+        '''called by the protocol when the transport is closed'''
+        self.transport = None
+        self.portdead = True
+        self._data_event.set()
+
+    def recv(self, n=None):
+        '''return all the buffered data, which may be more than one message'''
+        data = bytes(self._rbuf)
+        del self._rbuf[:]
+        return data
+
+    def write(self, buf):
+        if self.transport is None or self.transport.is_closing():
+            return
+        self.transport.write(buf)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+        self.portdead = True
+        self._data_event.set()
+
+    def select(self, timeout):
+        raise RuntimeError('use the coroutines of asyncio connections to wait for messages')
+
+    async def wait_data(self, timeout=None):
+        '''wait for up to timeout seconds for more data, returning False if
+        none arrived'''
+        if self._rbuf or self.portdead:
+            return True
+        self._data_event.clear()
+        try:
+            await asyncio.wait_for(self._data_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def recv_match(self, condition=None, type=None, blocking=False, timeout=None):
+        '''recv the next MAVLink message that matches the given condition
+        type can be a string or a list of strings
+        if blocking is set, wait for it without blocking the event loop'''
+        if type is not None and not isinstance(type, list) and not isinstance(type, set):
+            type = [type]
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            m = self.recv_msg()
+            if m is None:
+                if not blocking or self.portdead:
+                    return None
+                for hook in self.idle_hooks:
+                    hook(self)
+                wait = 0.05 if self.idle_hooks else None
+                if deadline is not None:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        return None
+                    wait = remaining if wait is None else min(wait, remaining)
+                await self.wait_data(wait)
+                continue
+            if type is not None and not m.get_type() in type:
+                continue
+            if not mavutil.evaluate_condition(condition, self.messages):
+                continue
+            return m
+
+    async def wait_heartbeat(self, blocking=True, timeout=None):
+        '''wait for a heartbeat so we know the target system IDs'''
+        return await self.recv_match(type='HEARTBEAT', blocking=blocking, timeout=timeout)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        '''return the next message, stopping when the connection is closed'''
+        while True:
+            m = self.recv_msg()
+            if m is not None:
+                return m
+            if self.portdead:
+                raise StopAsyncIteration
+            await self.wait_data()
+
+
+class mavasync_protocol(asyncio.Protocol):
+    '''pass the data from a stream transport to a connection'''
+    def __init__(self, conn):
+        self.conn = conn
+        self.transport = None
+
+    def connection_made(self, transport):
+        if self.conn.transport is not None:
+            # a new client replaces the old one
+            self.conn.transport.close()
+        self.transport = transport
+        self.conn.transport = transport
+        self.conn.portdead = False
+        sock = transport.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def data_received(self, data):
+        self.conn.data_received(data)
+
+    def connection_lost(self, exc):
+        if self.conn.transport is self.transport:
+            self.conn.connection_lost(exc)
+
+
+class mavasync_datagram_protocol(asyncio.DatagramProtocol):
+    '''pass the datagrams from a UDP transport to a connection'''
+    def __init__(self, conn):
+        self.conn = conn
+
+    def connection_made(self, transport):
+        self.conn.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.conn.data_received(data, addr)
+
+    def error_received(self, exc):
+        # ICMP errors such as connection refused from a UDP peer that
+        # isn't listening yet are ignored, as in mavudp
+        pass
+
+    def connection_lost(self, exc):
+        self.conn.connection_lost(exc)
+
+
+class mavasync_tcp(mavasync):
+    '''a TCP mavlink connection, as a client'''
+    async def connect(self, address):
+        loop = asyncio.get_event_loop()
+        await loop.create_connection(lambda: mavasync_protocol(self), address[0], address[1])
+
+
+class mavasync_tcpin(mavasync):
+    '''a TCP mavlink connection, as a server for a single client'''
+    def __init__(self, device, **kwargs):
+        mavasync.__init__(self, device, **kwargs)
+        self.server = None
+
+    async def listen(self, address):
+        loop = asyncio.get_event_loop()
+        self.server = await loop.create_server(lambda: mavasync_protocol(self), address[0], address[1], reuse_address=True)
+
+    def connection_lost(self, exc):
+        # wait for the next client
+        self.transport = None
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        mavasync.close(self)
+
+
+class mavasync_udp(mavasync):
+    '''a UDP mavlink connection. A server sends to all the clients it has
+    heard from, a client sends to its destination, which for broadcast is
+    replaced by the address of the first reply'''
+    def __init__(self, device, input=True, broadcast=False, timeout=0, **kwargs):
+        mavasync.__init__(self, device, input=input, **kwargs)
+        self.udp_server = input
+        self.broadcast = broadcast
+        self.timeout = timeout
+        self.destination_addr = None
+        self.last_address = None
+        self.clients = set()
+        self.clients_last_alive = {}
+
+    async def open(self, address):
+        loop = asyncio.get_event_loop()
+        if self.udp_server:
+            await loop.create_datagram_endpoint(lambda: mavasync_datagram_protocol(self),
+                                                local_addr=address)
+        else:
+            info = await loop.getaddrinfo(address[0], address[1], family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            self.destination_addr = info[0][4]
+            await loop.create_datagram_endpoint(lambda: mavasync_datagram_protocol(self),
+                                                family=socket.AF_INET, allow_broadcast=self.broadcast)
+
+    def data_received(self, data, addr=None):
+        if self.udp_server:
+            self.clients.add(addr)
+            self.clients_last_alive[addr] = time.time()
+        elif self.broadcast:
+            self.last_address = addr
+        mavasync.data_received(self, data, addr)
+
+    def write(self, buf):
+        if self.transport is None or self.transport.is_closing():
+            return
+        if self.udp_server:
+            current_time = time.time()
+            to_remove = set()
+            for address in self.clients:
+                if len(self.clients) == 1 or self.timeout <= 0 or self.clients_last_alive[address] + self.timeout > current_time:
+                    self.transport.sendto(buf, address)
+                elif len(to_remove) < len(self.clients) - 1:
+                    # we keep always at least 1 client, as mavudp does
+                    to_remove.add(address)
+                    self.clients_last_alive.pop(address)
+            self.clients -= to_remove
+        else:
+            if self.last_address and self.broadcast:
+                self.destination_addr = self.last_address
+                self.broadcast = False
+            self.transport.sendto(buf, self.destination_addr)
+
+
+class mavasync_serial(mavasync):
+    '''a serial mavlink connection. The port is read when the event loop
+    sees it is readable, so this needs an event loop with add_reader(),
+    which the default loop on Windows does not have'''
+    def __init__(self, device, baud=115200, **kwargs):
+        import serial
+        mavasync.__init__(self, device, **kwargs)
+        self.port = serial.Serial(device, baud, timeout=0, write_timeout=0,
+                                  dsrdtr=False, rtscts=False, xonxoff=False)
+        self.fd = self.port.fileno()
+        mavutil.set_close_on_exec(self.fd)
+        self.loop = asyncio.get_event_loop()
+        self.loop.add_reader(self.fd, self.read_ready)
+
+    def read_ready(self):
+        try:
+            data = self.port.read(self.port.in_waiting or 1)
+        except Exception as e:
+            self.close()
+            self.connection_lost(e)
+            return
+        if len(data) > 0:
+            self.data_received(data)
+
+    def write(self, buf):
+        if self.portdead:
+            return
+        try:
+            self.port.write(buf)
+        except Exception:
+            pass
+
+    def set_rtscts(self, enable):
+        '''enable/disable RTS/CTS if applicable'''
+        self.port.rtscts = enable
+
+    def close(self):
+        if not self.portdead:
+            self.loop.remove_reader(self.fd)
+            self.port.close()
+        self.portdead = True
+        self._data_event.set()
+
+
+def split_address(device, kind):
+    '''split host:port into a tuple'''
+    a = device.split(':')
+    if len(a) != 2:
+        raise ValueError("%s ports must be specified as host:port" % kind)
+    return (a[0], int(a[1]))
+
+
+async def mavlink_connection_async(device, baud=115200, source_system=255, source_component=0,
+                                   input=True, dialect=None, use_native=mavutil.default_native,
+                                   udp_timeout=0):
+    '''open a serial, UDP or TCP mavlink connection on the running event
+    loop, taking the same device strings as mavutil.mavlink_connection()'''
+    if dialect is not None:
+        mavutil.set_dialect(dialect)
+    kwargs = dict(source_system=source_system, source_component=source_component, use_native=use_native)
+    if device.startswith('tcp:'):
+        conn = mavasync_tcp("tcp:" + device[4:], **kwargs)
+        await conn.connect(split_address(device[4:], "TCP"))
+        return conn
+    if device.startswith('tcpin:'):
+        conn = mavasync_tcpin("tcpin:" + device[6:], **kwargs)
+        await conn.listen(split_address(device[6:], "TCP"))
+        return conn
+    udp = None
+    if device.startswith('udpin:'):
+        udp = (device[6:], True, False)
+    elif device.startswith('udpout:'):
+        udp = (device[7:], False, False)
+    elif device.startswith('udpbcast:'):
+        udp = (device[9:], False, True)
+    elif device.startswith('udp:'):
+        udp = (device[4:], input, False)
+    elif device.find(':') != -1 and not os.path.exists(device):
+        udp = (device, input, False)
+    if udp is not None:
+        (address, udp_input, broadcast) = udp
+        conn = mavasync_udp(address, input=udp_input, broadcast=broadcast, timeout=udp_timeout, **kwargs)
+        await conn.open(split_address(address, "UDP"))
+        return conn
+    if ',' in device and not os.path.exists(device):
+        device, baud = device.split(',')
+    return mavasync_serial(device, baud=int(baud), **kwargs)
@@ -0,0 +1,19 @@
+'''
+optional compiled MAVLink framing for the generated Python dialects
+
+The dialects use parse_frame() from here, when it has been built, to find
+the MAVLink frames in their input buffer and check their CRCs. Without
+it they fall back to their own pure Python parser. mavutil.mavmmaplog
+uses scan_tlog() to index telemetry logs in the same way.
+'''
+
+__all__ = ['available', 'parse_frame', 'scan_tlog', 'x25crc']
+
+try:
+    from .mavparser_cy import parse_frame, scan_tlog, x25crc  # type: ignore[import-not-found]
+    available = True
+except ImportError:
+    parse_frame = None
+    scan_tlog = None
+    x25crc = None
+    available = False
@@ -0,0 +1,271 @@
+#include "mavparser.h"
+#include <stdlib.h>
+#include <string.h>
+
+/*
+  CRC-16/MCRF4XX, as in checksum.h from the mavlink library
+ */
+uint16_t mav_crc_accumulate(const uint8_t *buf, size_t len, uint16_t crc) {
+    for (size_t i = 0; i < len; i++) {
+        uint8_t tmp = buf[i] ^ (uint8_t)(crc & 0xFF);
+        tmp ^= (uint8_t)(tmp << 4);
+        crc = (crc >> 8) ^ ((uint16_t)tmp << 8) ^ ((uint16_t)tmp << 3) ^ (tmp >> 4);
+    }
+    return crc;
+}
+
+/*
+  work out the framing of the MAVLink packet at the start of buf.
+
+  On MAV_FRAME_INCOMPLETE frame->frame_len is the number of bytes needed
+  before the frame can be parsed further, which is the whole frame once
+  the length byte has been seen
+ */
+int mav_parse_frame(const uint8_t *buf, size_t len, MavFrame *frame) {
+    if (len < 1) {
+        frame->frame_len = MAV_HEADER_LEN_V1 + 2;
+        return MAV_FRAME_INCOMPLETE;
+    }
+    frame->magic = buf[0];
+    if (frame->magic == MAV_MARKER_V2) {
+        frame->header_len = MAV_HEADER_LEN_V2;
+    } else if (frame->magic == MAV_MARKER_V1) {
+        frame->header_len = MAV_HEADER_LEN_V1;
+    } else {
+        return MAV_FRAME_BAD_PREFIX;
+    }
+    if (len < 3) {
+        frame->frame_len = frame->header_len + 2;
+        return MAV_FRAME_INCOMPLETE;
+    }
+    frame->mlen = buf[1];
+    frame->signature_len = 0;
+    if (frame->magic == MAV_MARKER_V2 && (buf[2] & MAV_IFLAG_SIGNED)) {
+        frame->signature_len = MAV_SIGNATURE_BLOCK_LEN;
+    }
+    frame->frame_len = frame->header_len + frame->mlen + 2 + frame->signature_len;
+    if (len < frame->frame_len) {
+        return MAV_FRAME_INCOMPLETE;
+    }
+    if (frame->magic == MAV_MARKER_V2) {
+        frame->incompat_flags = buf[2];
+        frame->compat_flags = buf[3];
+        frame->seq = buf[4];
+        frame->src_system = buf[5];
+        frame->src_component = buf[6];
+        frame->msgid = buf[7] | ((uint32_t)buf[8] << 8) | ((uint32_t)buf[9] << 16);
+    } else {
+        frame->incompat_flags = 0;
+        frame->compat_flags = 0;
+        frame->seq = buf[2];
+        frame->src_system = buf[3];
+        frame->src_component = buf[4];
+        frame->msgid = buf[5];
+    }
+    const uint8_t *crc_ptr = buf + frame->header_len + frame->mlen;
+    frame->crc = crc_ptr[0] | ((uint16_t)crc_ptr[1] << 8);
+    return MAV_FRAME_OK;
+}
+
+/*
+  calculate the CRC of a parsed frame, adding crc_extra if it is not
+  negative
+ */
+uint16_t mav_frame_crc(const uint8_t *buf, const MavFrame *frame, int crc_extra) {
+    uint16_t crc = mav_crc_accumulate(buf + 1, frame->header_len + frame->mlen - 1, 0xFFFF);
+    if (crc_extra >= 0) {
+        uint8_t extra = (uint8_t)crc_extra;
+        crc = mav_crc_accumulate(&extra, 1, crc);
+    }
+    return crc;
+}
+
+/*
+  find the entry for msgid in the table of a tlog index, adding an empty
+  one if it isn't there. Returns NULL if memory runs out
+ */
+MavTlogType *mav_tlog_type(MavTlogIndex *index, uint32_t msgid) {
+    if (index->table_size == 0 || 2 * (index->num_types + 1) > index->table_size) {
+        // keep the table at most half full
+        size_t new_size = index->table_size == 0 ? 256 : index->table_size * 2;
+        MavTlogType *table = calloc(new_size, sizeof(MavTlogType));
+        if (table == NULL) {
+            return NULL;
+        }
+        for (size_t i = 0; i < index->table_size; i++) {
+            MavTlogType *t = &index->types[i];
+            if (!t->used) {
+                continue;
+            }
+            size_t j = t->msgid & (new_size - 1);
+            while (table[j].used) {
+                j = (j + 1) & (new_size - 1);
+            }
+            table[j] = *t;
+        }
+        free(index->types);
+        index->types = table;
+        index->table_size = new_size;
+    }
+    size_t i = msgid & (index->table_size - 1);
+    while (index->types[i].used) {
+        if (index->types[i].msgid == msgid) {
+            return &index->types[i];
+        }
+        i = (i + 1) & (index->table_size - 1);
+    }
+    index->types[i].used = 1;
+    index->types[i].msgid = msgid;
+    index->num_types++;
+    return &index->types[i];
+}
+
+static int add_offset(MavTlogType *t, uint64_t ofs) {
+    if (t->num_offsets == t->offsets_cap) {
+        size_t new_cap = t->offsets_cap == 0 ? 64 : t->offsets_cap * 2;
+        uint64_t *offsets = realloc(t->offsets, new_cap * sizeof(uint64_t));
+        if (offsets == NULL) {
+            return 0;
+        }
+        t->offsets = offsets;
+        t->offsets_cap = new_cap;
+    }
+    t->offsets[t->num_offsets++] = ofs;
+    return 1;
+}
+
+/*
+  record the instance_len bytes at value as an instance of t seen in the
+  frame at ofs. The instance matched last time is checked first, as
+  instances tend to repeat
+ */
+static int add_instance(MavTlogType *t, const uint8_t *value, uint64_t ofs) {
+    size_t ilen = t->instance_len;
+    size_t i = t->last_instance;
+    if (t->num_instances == 0 || memcmp(&t->instances[i * ilen], value, ilen) != 0) {
+        for (i = 0; i < t->num_instances; i++) {
+            if (memcmp(&t->instances[i * ilen], value, ilen) == 0) {
+                break;
+            }
+        }
+    }
+    if (i == t->num_instances) {
+        if (t->num_instances == t->instances_cap) {
+            size_t new_cap = t->instances_cap == 0 ? 8 : t->instances_cap * 2;
+            uint8_t *instances = realloc(t->instances, new_cap * ilen);
+            if (instances == NULL) {
+                return 0;
+            }
+            t->instances = instances;
+            uint64_t *seen = realloc(t->instance_seen, new_cap * 2 * sizeof(uint64_t));
+            if (seen == NULL) {
+                return 0;
+            }
+            t->instance_seen = seen;
+            t->instances_cap = new_cap;
+        }
+        memcpy(&t->instances[i * ilen], value, ilen);
+        t->instance_seen[2 * i] = ofs;
+        t->num_instances++;
+    }
+    t->instance_seen[2 * i + 1] = ofs;
+    t->last_instance = i;
+    return 1;
+}
+
+/*
+  index the frames of a telemetry log, where each MAVLink frame follows
+  an 8 byte timestamp, starting with the frame at offset start and
+  stopping at the first frame starting at or after end. Returns the
+  offset of that frame. This follows the same rules as the Python loop
+  in mavmmaplog.init_arrays(): bytes which aren't a MAVLink marker are
+  skipped one at a time, and frames are recorded even if they run past
+  the end of the log.
+
+  For types given an instance_len before the scan, the distinct values
+  of the instance field are recorded, zero padded where the payload has
+  been truncated, with the offsets of the first and last frames they
+  were seen in. A frame whose instance field starts past the end of
+  the log ends the scan with MAV_TLOG_TRUNCATED
+ */
+size_t mav_scan_tlog(const uint8_t *data, size_t len, size_t start, size_t end,
+                     MavTlogIndex *index, int *status) {
+    size_t ofs = start;
+    uint8_t value[256];
+    MavTlogType *t = NULL;
+    *status = MAV_TLOG_OK;
+    while (ofs < end && ofs + 8 + 6 < len) {
+        const uint8_t *frame = data + ofs + 8;
+        size_t mlen = frame[1] + 8;
+        size_t data_ofs;
+        uint32_t msgid;
+        if (frame[0] == MAV_MARKER_V1) {
+            msgid = frame[5];
+            mlen += 8;
+            data_ofs = 8 + MAV_HEADER_LEN_V1;
+        } else if (frame[0] == MAV_MARKER_V2) {
+            if (ofs + 8 + 10 > len) {
+                break;
+            }
+            msgid = frame[7] | ((uint32_t)frame[8] << 8) | ((uint32_t)frame[9] << 16);
+            mlen += 12;
+            data_ofs = 8 + MAV_HEADER_LEN_V2;
+            if (frame[2] & MAV_IFLAG_SIGNED) {
+                mlen += MAV_SIGNATURE_BLOCK_LEN;
+            }
+        } else {
+            // unrecognised marker; probably a malformed log
+            ofs++;
+            continue;
+        }
+        if (t == NULL || t->msgid != msgid) {
+            t = mav_tlog_type(index, msgid);
+            if (t == NULL) {
+                *status = MAV_TLOG_NO_MEMORY;
+                return ofs;
+            }
+        }
+        if (t->instance_len > 0) {
+            size_t ifield = ofs + data_ofs + t->instance_offset;
+            if (ifield >= len) {
+                *status = MAV_TLOG_TRUNCATED;
+                return ofs;
+            }
+            // MAVLink2 payloads can have their trailing zeros removed,
+            // which leaves the instance field running into the CRC
+            size_t iend = ifield + t->instance_len;
+            if (iend > ofs + mlen - 2) {
+                iend = ofs + mlen - 2;
+            }
+            if (iend > len) {
+                iend = len;
+            }
+            memset(value, 0, t->instance_len);
+            if (iend > ifield) {
+                memcpy(value, data + ifield, iend - ifield);
+            }
+            if (!add_instance(t, value, ofs)) {
+                *status = MAV_TLOG_NO_MEMORY;
+                return ofs;
+            }
+        }
+        if (!add_offset(t, ofs)) {
+            *status = MAV_TLOG_NO_MEMORY;
+            return ofs;
+        }
+        ofs += mlen;
+    }
+    return ofs;
+}
+
+void mav_tlog_index_free(MavTlogIndex *index) {
+    for (size_t i = 0; i < index->table_size; i++) {
+        free(index->types[i].offsets);
+        free(index->types[i].instances);
+        free(index->types[i].instance_seen);
+    }
+    free(index->types);
+    index->types = NULL;
+    index->table_size = 0;
+    index->num_types = 0;
+}
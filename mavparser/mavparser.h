@@ -0,0 +1,80 @@
+#ifndef MAVPARSER_H
+#define MAVPARSER_H
+
+#include <stdint.h>
+#include <stddef.h>
+
+#define MAV_MARKER_V1 0xFE
+#define MAV_MARKER_V2 0xFD
+#define MAV_HEADER_LEN_V1 6
+#define MAV_HEADER_LEN_V2 10
+#define MAV_SIGNATURE_BLOCK_LEN 13
+#define MAV_IFLAG_SIGNED 0x01
+
+// status codes from mav_parse_frame
+#define MAV_FRAME_OK 0
+#define MAV_FRAME_INCOMPLETE 1
+#define MAV_FRAME_BAD_PREFIX 2
+
+typedef struct MavFrame {
+    uint8_t magic;
+    uint8_t mlen;
+    uint8_t incompat_flags;
+    uint8_t compat_flags;
+    uint8_t seq;
+    uint8_t src_system;
+    uint8_t src_component;
+    uint32_t msgid;
+    size_t header_len;
+    size_t signature_len;
+    size_t frame_len;
+    uint16_t crc;
+} MavFrame;
+
+uint16_t mav_crc_accumulate(const uint8_t *buf, size_t len, uint16_t crc);
+
+int mav_parse_frame(const uint8_t *buf, size_t len, MavFrame *frame);
+
+uint16_t mav_frame_crc(const uint8_t *buf, const MavFrame *frame, int crc_extra);
+
+// status codes from mav_scan_tlog
+#define MAV_TLOG_OK 0
+#define MAV_TLOG_TRUNCATED 1
+#define MAV_TLOG_NO_MEMORY 2
+
+// the frames of one message type in a telemetry log
+typedef struct MavTlogType {
+    int used;
+    uint32_t msgid;
+    uint64_t *offsets;
+    size_t num_offsets;
+    size_t offsets_cap;
+    // offset and length of the instance field in the payload, with
+    // instance_len 0 for types without one
+    uint16_t instance_offset;
+    uint8_t instance_len;
+    // distinct instance values, instance_len bytes each, in the order
+    // they were first seen, and the offsets of the first and last frames
+    // with each value
+    uint8_t *instances;
+    uint64_t *instance_seen;
+    size_t num_instances;
+    size_t instances_cap;
+    size_t last_instance;
+} MavTlogType;
+
+// hash table of the message types in a telemetry log, by msgid
+typedef struct MavTlogIndex {
+    MavTlogType *types;
+    size_t table_size;
+    size_t num_types;
+} MavTlogIndex;
+
+MavTlogType *mav_tlog_type(MavTlogIndex *index, uint32_t msgid);
+
+size_t mav_scan_tlog(const uint8_t *data, size_t len, size_t start, size_t end,
+                     MavTlogIndex *index, int *status);
+
+void mav_tlog_index_free(MavTlogIndex *index);
+
+#endif
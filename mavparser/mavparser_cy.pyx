@@ -0,0 +1,176 @@
+cdef extern from "mavparser.h":
+    cdef struct MavFrame:
+        unsigned char magic
+        unsigned char mlen
+        unsigned char incompat_flags
+        unsigned char compat_flags
+        unsigned char seq
+        unsigned char src_system
+        unsigned char src_component
+        unsigned int msgid
+        size_t header_len
+        size_t signature_len
+        size_t frame_len
+        unsigned short crc
+
+    unsigned short mav_crc_accumulate(const unsigned char* buf, size_t len, unsigned short crc)
+    int mav_parse_frame(const unsigned char* buf, size_t len, MavFrame* frame)
+    unsigned short mav_frame_crc(const unsigned char* buf, const MavFrame* frame, int crc_extra)
+
+    cdef int MAV_FRAME_OK
+    cdef int MAV_FRAME_INCOMPLETE
+
+    cdef struct MavTlogType:
+        int used
+        unsigned int msgid
+        unsigned long long* offsets
+        size_t num_offsets
+        unsigned short instance_offset
+        unsigned char instance_len
+        unsigned char* instances
+        unsigned long long* instance_seen
+        size_t num_instances
+
+    cdef struct MavTlogIndex:
+        MavTlogType* types
+        size_t table_size
+        size_t num_types
+
+    MavTlogType* mav_tlog_type(MavTlogIndex* index, unsigned int msgid)
+    size_t mav_scan_tlog(const unsigned char* data, size_t len, size_t start, size_t end,
+                         MavTlogIndex* index, int* status) nogil
+    void mav_tlog_index_free(MavTlogIndex* index)
+
+    cdef int MAV_TLOG_OK
+    cdef int MAV_TLOG_NO_MEMORY
+
+from cpython.bytes cimport PyBytes_FromStringAndSize
+import array
+
+# bytes of a log scanned between calls of the progress callback
+TLOG_SCAN_CHUNK = 1 << 24
+
+
+def x25crc(const unsigned char[:] buf, unsigned short crc=0xFFFF):
+    '''return the CRC-16/MCRF4XX of buf, continuing from crc'''
+    if buf.shape[0] == 0:
+        return crc
+    return mav_crc_accumulate(&buf[0], buf.shape[0], crc)
+
+
+def parse_frame(buf, Py_ssize_t start, dict crc_extras):
+    '''parse the MAVLink frame starting at offset start of buf.
+
+    Returns None if there is no MAVLink marker at start, or the number of
+    bytes from start which are needed before the frame can be parsed
+    further if it is incomplete. Otherwise returns a tuple of
+    (frame_len, msgid, header, payload, crc, crc_ok) where header is
+    (magic, mlen, incompat_flags, compat_flags, seq, srcSystem,
+    srcComponent) and payload is a memoryview of buf. crc_ok is None if
+    crc_extras doesn't have the message ID; if crc_extras is None the CRC
+    is checked without a CRC extra byte.
+
+    The payload memoryview stops a bytearray buf from being resized until
+    it is released'''
+    cdef const unsigned char[:] data = buf
+    cdef MavFrame frame
+    cdef int status
+    cdef int crc_extra = -1
+    cdef size_t payload_start
+
+    if start < 0 or start > data.shape[0]:
+        raise IndexError("start out of range")
+    if start == data.shape[0]:
+        status = mav_parse_frame(NULL, 0, &frame)
+    else:
+        status = mav_parse_frame(&data[start], data.shape[0] - start, &frame)
+    if status == MAV_FRAME_INCOMPLETE:
+        return frame.frame_len
+    if status != MAV_FRAME_OK:
+        return None
+
+    crc_ok = None
+    if crc_extras is None:
+        crc_ok = mav_frame_crc(&data[start], &frame, -1) == frame.crc
+    else:
+        extra = crc_extras.get(frame.msgid)
+        if extra is not None:
+            crc_extra = extra
+            crc_ok = mav_frame_crc(&data[start], &frame, crc_extra) == frame.crc
+
+    payload_start = start + frame.header_len
+    header = (frame.magic, frame.mlen, frame.incompat_flags, frame.compat_flags,
+              frame.seq, frame.src_system, frame.src_component)
+    return (frame.frame_len, frame.msgid, header,
+            memoryview(buf)[payload_start:payload_start+frame.mlen],
+            frame.crc, crc_ok)
+
+
+def scan_tlog(const unsigned char[:] data, dict instance_fields, progress_callback=None):
+    '''index a telemetry log, where each MAVLink frame follows an 8 byte
+    timestamp, in the same way as mavmmaplog.init_arrays(), releasing the
+    GIL while scanning.
+
+    instance_fields maps message IDs to the (offset, length) of their
+    instance field in the payload. Returns a tuple of (offsets,
+    instances) where offsets is a dict mapping each message ID in the log
+    to an array of the file offsets of its frames, and instances maps the
+    message IDs in instance_fields to a list of (value, first, last) for
+    the distinct values of their instance field, where value is bytes
+    zero padded to the field length and first and last are the offsets of
+    the first and last frames with that value'''
+    cdef MavTlogIndex index
+    cdef MavTlogType* t
+    cdef size_t ofs = 0
+    cdef size_t end
+    cdef size_t nxt
+    cdef size_t data_len = data.shape[0]
+    cdef int status = MAV_TLOG_OK
+    cdef size_t i
+    cdef size_t j
+    cdef int pct = 0
+
+    index.types = NULL
+    index.table_size = 0
+    index.num_types = 0
+    try:
+        for (msgid, (ioffset, ilen)) in instance_fields.items():
+            if ilen < 1 or ilen > 255:
+                raise ValueError("bad instance field length %s for msgid %u" % (ilen, msgid))
+            t = mav_tlog_type(&index, msgid)
+            if t == NULL:
+                raise MemoryError("no memory for tlog index")
+            t.instance_offset = ioffset
+            t.instance_len = ilen
+
+        while data_len > 0:
+            end = min(ofs + TLOG_SCAN_CHUNK, data_len)
+            with nogil:
+                nxt = mav_scan_tlog(&data[0], data_len, ofs, end, &index, &status)
+            if status == MAV_TLOG_NO_MEMORY:
+                raise MemoryError("no memory for tlog index")
+            if progress_callback is not None and data_len > 0:
+                new_pct = (100 * nxt) // data_len
+                if new_pct != pct:
+                    progress_callback(new_pct)
+                    pct = new_pct
+            if status != MAV_TLOG_OK or nxt < end or end == data_len:
+                break
+            ofs = nxt
+
+        offsets = {}
+        instances = {}
+        for i in range(index.table_size):
+            t = &index.types[i]
+            if not t.used or t.num_offsets == 0:
+                continue
+            a = array.array('Q')
+            a.frombytes(PyBytes_FromStringAndSize(<char*>t.offsets, t.num_offsets * sizeof(unsigned long long)))
+            offsets[t.msgid] = a
+            if t.instance_len > 0:
+                instances[t.msgid] = [(PyBytes_FromStringAndSize(<char*>&t.instances[j * t.instance_len], t.instance_len),
+                                       t.instance_seen[2 * j], t.instance_seen[2 * j + 1])
+                                      for j in range(t.num_instances)]
+    finally:
+        mav_tlog_index_free(&index)
+    return (offsets, instances)
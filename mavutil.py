@@ -8,11 +8,17 @@ Released under GNU LGPL version 3 or later
 
 import socket, math, struct, time, os, fnmatch, array, sys, errno
 import select
+import selectors
 import copy
+import collections
+import bisect
+import heapq
 import json
 import re
 import platform
 from pymavlink import mavexpression
+from pymavlink import mavparser
+from pymavlink import logindex
 import ssl
 
 # We want to re-export x25crc here
@@ -183,6 +189,9 @@ class mavfile(object):
         self.address = address
         self.timestamp = 0
         self.last_seq = {}
+        # the first sequence number from each source, so that the losses
+        # counted over separate parts of a log can be joined up
+        self.first_seq = {}
         self.mav_loss = 0
         self.mav_count = 0
         self.param_fetch_start = 0
@@ -200,6 +209,8 @@ class mavfile(object):
         self.source_component = source_component
         self.first_byte = True
         self.robust_parsing = True
+        self._lazy_decode = False
+        self._msgid_filter = None
         self.mav = mavlink.MAVLink(self, srcSystem=self.source_system, srcComponent=self.source_component, use_native=use_native)
         self.mav.robust_parsing = self.robust_parsing
         self.logfile = None
@@ -207,7 +218,8 @@ class mavfile(object):
         self.start_time = time.time()
         self.message_hooks = []
         self.idle_hooks = []
-        self.uptime = 0.0
+        self._uptime = 0.0
+        self._uptime_msg = None
         self.notimestamps = notimestamps
         self._timestamp = None
         self.WIRE_PROTOCOL_VERSION = mavlink.WIRE_PROTOCOL_VERSION
@@ -247,6 +259,51 @@ class mavfile(object):
                 return getattr(self.param_state[eff_tuple],'params')
         return getattr(self.param_state[self.param_sysid],'params')
 
+    @property
+    def lazy_decode(self):
+        '''if True, message fields are only unpacked when they are first read'''
+        return self._lazy_decode
+
+    @lazy_decode.setter
+    def lazy_decode(self, value):
+        self._lazy_decode = value
+        self.mav.lazy_decode = value
+
+    def set_msgid_filter(self, msgids):
+        '''only decode messages with the given numeric IDs, or all messages
+        if msgids is None. Other messages are dropped by the parser after
+        their CRC is checked, but still count towards packet loss. Note
+        that HEARTBEAT is needed for wait_heartbeat() and flightmode'''
+        if msgids is not None:
+            msgids = frozenset(msgids)
+        self._msgid_filter = msgids
+        self.mav.set_msgid_filter(msgids)
+        self.mav.filtered_callback = self.mav_filtered
+
+    def mav_filtered(self, msgId, seq, srcSystem, srcComponent):
+        '''called by the parser for each message dropped by the msgid filter'''
+        src_tuple = (srcSystem, srcComponent)
+        if msgId in mavlink.mavlink_map and src_tuple != (ord('3'), ord('D')):
+            self.update_seq(src_tuple, seq)
+
+    @property
+    def uptime(self):
+        # worked out from the last message with a timestamp field, so that
+        # lazily decoded messages are only unpacked if this is used
+        msg = self._uptime_msg
+        if msg is not None:
+            if 'time_boot_ms' in msg._fieldnames:
+                self._uptime = msg.time_boot_ms * 1.0e-3
+            else:
+                self._uptime = msg.usec * 1.0e-6
+            self._uptime_msg = None
+        return self._uptime
+
+    @uptime.setter
+    def uptime(self, value):
+        self._uptime = value
+        self._uptime_msg = None
+
     @property
     def messages(self):
         return getattr(self.sysid_state[self.sysid],'messages')
@@ -316,6 +373,9 @@ class mavfile(object):
                                                                      self.mav.send_callback_kwargs)
         self.mav = mavlink.MAVLink(self, srcSystem=self.source_system, srcComponent=self.source_component)
         self.mav.robust_parsing = self.robust_parsing
+        self.mav.lazy_decode = self._lazy_decode
+        self.mav.set_msgid_filter(self._msgid_filter)
+        self.mav.filtered_callback = self.mav_filtered
         self.WIRE_PROTOCOL_VERSION = mavlink.WIRE_PROTOCOL_VERSION
         (self.mav.callback, self.mav.callback_args, self.mav.callback_kwargs) = (callback,
                                                                                  callback_args,
@@ -352,6 +412,10 @@ class mavfile(object):
         '''default pre message call'''
         return
 
+    def post_filtered(self):
+        '''called by recv_msg() when messages have been dropped by the msgid filter'''
+        return
+
     def set_rtscts(self, enable):
         '''enable/disable RTS/CTS if applicable'''
         return
@@ -372,15 +436,13 @@ class mavfile(object):
 
     def post_message(self, msg):
         '''default post message call'''
-        if '_posted' in msg.__dict__:
+        if getattr(msg, '_posted', False):
             return
         msg._posted = True
         msg._timestamp = time.time()
 
-        if 'usec' in msg.__dict__:
-            self.uptime = msg.usec * 1.0e-6
-        if 'time_boot_ms' in msg.__dict__:
-            self.uptime = msg.time_boot_ms * 1.0e-3
+        if 'usec' in msg._fieldnames or 'time_boot_ms' in msg._fieldnames:
+            self._uptime_msg = msg
 
         if self._timestamp is not None:
             if self.notimestamps:
@@ -409,18 +471,7 @@ class mavfile(object):
 
         if not (src_tuple == radio_tuple or msg.get_msgId() < 0):
             # Don't use unknown messages to calculate number of lost packets
-            if not src_tuple in self.last_seq:
-                last_seq = -1
-            else:
-                last_seq = self.last_seq[src_tuple]
-            seq = (last_seq+1) % 256
-            seq2 = msg.get_seq()
-            if seq != seq2 and last_seq != -1:
-                diff = (seq2 - seq) % 256
-                self.mav_loss += diff
-                #print("lost %u seq=%u seq2=%u last_seq=%u src_tupe=%s %s" % (diff, seq, seq2, last_seq, str(src_tuple), msg.get_type()))
-            self.last_seq[src_tuple] = seq2
-            self.mav_count += 1
+            self.update_seq(src_tuple, msg.get_seq())
         
         self.timestamp = msg._timestamp
         if m_type == 'HEARTBEAT' and self.probably_vehicle_heartbeat(msg):
@@ -467,6 +518,28 @@ class mavfile(object):
             self.mav.signing.link_id = msg.get_link_id()
 
 
+    def update_seq(self, src_tuple, seq2):
+        '''count lost packets from the sequence number of a packet from src_tuple'''
+        if not src_tuple in self.last_seq:
+            last_seq = -1
+            self.first_seq[src_tuple] = seq2
+        else:
+            last_seq = self.last_seq[src_tuple]
+        seq = (last_seq+1) % 256
+        if seq != seq2 and last_seq != -1:
+            diff = (seq2 - seq) % 256
+            self.mav_loss += diff
+            #print("lost %u seq=%u seq2=%u last_seq=%u src_tupe=%s" % (diff, seq, seq2, last_seq, str(src_tuple)))
+        self.last_seq[src_tuple] = seq2
+        self.mav_count += 1
+
+    def reset_packet_loss(self):
+        '''start counting packets and lost packets again'''
+        self.last_seq = {}
+        self.first_seq = {}
+        self.mav_loss = 0
+        self.mav_count = 0
+
     def packet_loss(self):
         '''packet loss as a percentage'''
         if self.mav_count == 0:
@@ -490,6 +563,7 @@ class mavfile(object):
 
             # We always call parse_char even if the new string is empty, because the existing message buf might already have some valid packet
             # we can extract
+            filtered = self.mav.total_packets_filtered
             msg = self.mav.parse_char(s)
             if msg:
                 if self.logfile and  msg.get_type() != 'BAD_DATA' :
@@ -498,6 +572,8 @@ class mavfile(object):
                 self.post_message(msg)
                 return msg
             else:
+                if self.mav.total_packets_filtered != filtered:
+                    self.post_filtered()
                 # if we failed to parse any messages _and_ no new bytes arrived, return immediately so the client has the option to
                 # timeout
                 if numnew == 0:
@@ -505,7 +581,9 @@ class mavfile(object):
                 
     def recv_match(self, condition=None, type=None, blocking=False, timeout=None):
         '''recv the next MAVLink message that matches the given condition
-        type can be a string or a list of strings'''
+        type can be a string or a list of strings
+        the type is checked from the message header, so with lazy_decode
+        set other messages are skipped without unpacking their fields'''
         if type is not None and not isinstance(type, list) and not isinstance(type, set):
             type = [type]
         start_time = time.time()
@@ -1071,6 +1149,8 @@ class mavudp(mavfile):
         self.clients = set()
         self.clients_last_alive = {}
         self.resolved_destination_addr = None
+        # messages parsed from a datagram which haven't been returned yet
+        self._pending_msgs = collections.deque()
         mavfile.__init__(self, self.port.fileno(), device, source_system=source_system, source_component=source_component, input=input, use_native=use_native)
 
     def close(self):
@@ -1118,17 +1198,22 @@ class mavudp(mavfile):
             pass
 
     def recv_msg(self):
-        '''message receive routine for UDP link'''
+        '''message receive routine for UDP link. All the messages in a
+        datagram are parsed at once, and returned by this and the
+        following calls'''
         self.pre_message()
-        s = self.recv()
-        if len(s) > 0:
-            if self.first_byte:
-                self.auto_mavlink_version(s)
+        if len(self._pending_msgs) == 0:
+            s = self.recv()
+            if len(s) > 0:
+                if self.first_byte:
+                    self.auto_mavlink_version(s)
 
-        m = self.mav.parse_char(s)
-        if m is not None:
-            self.post_message(m)
+            self._pending_msgs.extend(self.mav.parse_many(s))
+            if len(self._pending_msgs) == 0:
+                return None
 
+        m = self._pending_msgs.popleft()
+        self.post_message(m)
         return m
 
 class mavmcast(mavfile):
@@ -1165,6 +1250,8 @@ class mavmcast(mavfile):
         self.port_out.connect((mcast_ip, mcast_port))
         set_close_on_exec(self.port_out.fileno())
         self.myport = None
+        # messages parsed from a datagram which haven't been returned yet
+        self._pending_msgs = collections.deque()
 
         mavfile.__init__(self, self.port.fileno(), device,
                          source_system=source_system, source_component=source_component,
@@ -1198,17 +1285,22 @@ class mavmcast(mavfile):
             pass
 
     def recv_msg(self):
-        '''message receive routine for UDP link'''
+        '''message receive routine for UDP link. All the messages in a
+        datagram are parsed at once, and returned by this and the
+        following calls'''
         self.pre_message()
-        s = self.recv()
-        if len(s) > 0:
-            if self.first_byte:
-                self.auto_mavlink_version(s)
+        if len(self._pending_msgs) == 0:
+            s = self.recv()
+            if len(s) > 0:
+                if self.first_byte:
+                    self.auto_mavlink_version(s)
 
-        m = self.mav.parse_char(s)
-        if m is not None:
-            self.post_message(m)
+            self._pending_msgs.extend(self.mav.parse_many(s))
+            if len(self._pending_msgs) == 0:
+                return None
 
+        m = self._pending_msgs.popleft()
+        self.post_message(m)
         return m
     
 
@@ -1372,16 +1464,44 @@ class mavtcpin(mavfile):
             pass
 
 
+# bytes read at a time by a mavlogfile streaming a log
+LOG_READ_AHEAD = 1 << 20
+
 class mavlogfile(mavfile):
-    '''a MAVLink logfile reader/writer'''
+    '''a MAVLink logfile reader/writer.
+
+    With read_ahead set a log is read read_ahead bytes at a time, and the
+    timestamps and frames are taken from that buffer, so that each frame
+    is passed to the parser in one go, giving the same messages as
+    reading the file directly. With follow also set a timestamp and frame
+    are only taken once they have all arrived, so a log which is still
+    being written can be followed. Bad data at the end of a followed log
+    is held back waiting for more to be written, so it can be reported
+    differently. Planner format logs are always read a frame at a time'''
     def __init__(self, filename, planner_format=None,
                  write=False, append=False,
-                 robust_parsing=True, notimestamps=False, source_system=255, source_component=0, use_native=default_native):
+                 robust_parsing=True, notimestamps=False, source_system=255, source_component=0, use_native=default_native,
+                 read_ahead=0, follow=False):
         self.filename = filename
         self.writeable = write
         self.robust_parsing = robust_parsing
         self.planner_format = planner_format
         self._two64 = math.pow(2.0, 63)
+        if write or planner_format:
+            read_ahead = 0
+        self.read_ahead = read_ahead
+        self.follow = follow
+        # the read ahead buffer, the read position in it and the offset
+        # of its first byte in the file
+        self._rbuf = b''
+        self._rpos = 0
+        self._rbase = 0
+        # set when the next timestamp and frame haven't all arrived yet
+        self._frame_pending = False
+        # set from reading a timestamp until its message is returned
+        self._in_record = False
+        # set when a scan for a good timestamp has reached the end
+        self._resyncing = False
         mode = 'rb'
         if self.writeable:
             if append:
@@ -1407,11 +1527,70 @@ class mavlogfile(mavfile):
     def recv(self,n=None):
         if n is None:
             n = self.mav.bytes_needed()
-        return self.f.read(n)
+        if self.read_ahead == 0:
+            return self.f.read(n)
+        if not self.follow:
+            if self.mav.buf_len() == 0 and self._fill(3) >= 3:
+                # give the parser the whole frame at once. It would ask
+                # for the rest of it next, so this parses the same
+                flen = self._frame_len(0)
+                if flen is not None:
+                    n = max(n, flen)
+            return self._read(n)
+        if self._frame_pending:
+            return b''
+        if self.mav.buf_len() == 0 and self._fill(3) >= 3:
+            # give the parser the whole frame at once
+            flen = self._frame_len(0)
+            if flen is not None and self._fill(flen) >= flen:
+                n = flen
+        if self._fill(n) < n:
+            # wait for the rest rather than parse part of it
+            return b''
+        return self._read(n)
 
     def write(self, buf):
         self.f.write(buf)
 
+    def _fill(self, need, keep=None):
+        '''read ahead until there are need bytes after the read position,
+        keeping the buffer from index keep on, which defaults to the read
+        position. Returns the number of bytes after the read position'''
+        avail = len(self._rbuf) - self._rpos
+        if avail >= need:
+            return avail
+        if keep is None:
+            keep = self._rpos
+        data = self.f.read(max(self.read_ahead, need - avail))
+        if len(data) > 0:
+            self._rbuf = self._rbuf[keep:] + data
+            self._rbase += keep
+            self._rpos -= keep
+        return len(self._rbuf) - self._rpos
+
+    def _read(self, n):
+        '''return up to n bytes from the read ahead buffer, as f.read()
+        would from the file'''
+        self._fill(n)
+        ret = self._rbuf[self._rpos:self._rpos+n]
+        self._rpos += len(ret)
+        return ret
+
+    def _frame_len(self, ofs):
+        '''return the length of the MAVLink frame starting ofs bytes after
+        the read position, which must have 3 bytes buffered, or None if
+        there is no MAVLink marker there'''
+        i = self._rpos + ofs
+        marker = self._rbuf[i]
+        if marker == mavlink.PROTOCOL_MARKER_V1:
+            return mavlink.HEADER_LEN_V1 + self._rbuf[i+1] + 2
+        if marker == mavlink.PROTOCOL_MARKER_V2:
+            flen = mavlink.HEADER_LEN_V2 + self._rbuf[i+1] + 2
+            if self._rbuf[i+2] & mavlink.MAVLINK_IFLAG_SIGNED:
+                flen += mavlink.MAVLINK_SIGNATURE_BLOCK_LEN
+            return flen
+        return None
+
     def scan_timestamp(self, tbuf):
         '''scan forward looking in a tlog for a timestamp in a reasonable range'''
         while True:
@@ -1425,9 +1604,121 @@ class mavlogfile(mavfile):
             tbuf = tbuf[1:] + c
         return t
 
+    def scan_timestamp_buffered(self):
+        '''scan forward in the read ahead buffer for a timestamp in a
+        reasonable range, as scan_timestamp() does for the timestamp just
+        before the read position. Any timestamp within 3 days of the last
+        one starts with the top 3 bytes of one end of that range, so
+        those are searched for instead of trying each offset in turn.
+        Returns None if the end of the log is reached first'''
+        window = 3*24*60*60
+        lo = max(0, int((self._last_timestamp - window) * 1.0e6) - 16)
+        hi = min(2**64 - 1, int((self._last_timestamp + window) * 1.0e6) + 16)
+        prefixes = set([struct.pack('>Q', lo)[:3], struct.pack('>Q', hi)[:3]])
+        pos = self._rpos - 7
+        while True:
+            found = [self._rbuf.find(prefix, pos) for prefix in prefixes]
+            found = [i for i in found if i != -1 and i + 8 <= len(self._rbuf)]
+            if len(found) > 0:
+                i = min(found)
+                (tusec,) = struct.unpack_from('>Q', self._rbuf, i)
+                t = tusec * 1.0e-6
+                if abs(t - self._last_timestamp) <= window:
+                    self._rpos = i + 8
+                    return t
+                pos = i + 1
+                continue
+            # nothing here, so read on, keeping the last 7 bytes which
+            # could be the start of a timestamp
+            pos = max(pos, len(self._rbuf) - 7)
+            self._rpos = len(self._rbuf)
+            keep = min(pos, len(self._rbuf) - 8)
+            if self._fill(1, keep=keep) == 0:
+                # end of the log for now, so start from the kept bytes
+                # next time in case more is written
+                self._rpos = keep
+                return None
+            pos -= keep
+
+    def pre_message_buffered(self):
+        '''read timestamp if needed from the read ahead buffer, once the
+        frame after it has arrived'''
+        if self.filesize != 0:
+            self.percent = (100.0 * (self._rbase + self._rpos)) / self.filesize
+        self._frame_pending = False
+        if self.notimestamps:
+            return
+        if not self.follow:
+            self._read_timestamp()
+            return
+        if self._in_record:
+            return
+        if self._resyncing:
+            self._resync(None)
+            return
+        need = 8 + 3
+        if self._fill(need) >= need:
+            flen = self._frame_len(8)
+            if flen is None:
+                need = 8
+            else:
+                need = 8 + flen
+        if self._fill(need) < need:
+            self._frame_pending = True
+            return
+        (tusec,) = struct.unpack_from('>Q', self._rbuf, self._rpos)
+        self._rpos += 8
+        t = tusec * 1.0e-6
+        if (self._last_timestamp is not None and
+            self._last_message.get_type() == "BAD_DATA" and
+            abs(t - self._last_timestamp) > 3*24*60*60):
+            self._resync(tusec)
+            return
+        self._in_record = True
+        self._link = tusec & 0x3
+        self._timestamp = t
+
+    def _read_timestamp(self):
+        '''read timestamp from the read ahead buffer as pre_message()
+        does from the file'''
+        tbuf = self._read(8)
+        if len(tbuf) != 8:
+            return
+        (tusec,) = struct.unpack('>Q', tbuf)
+        t = tusec * 1.0e-6
+        if (self._last_timestamp is not None and
+            self._last_message.get_type() == "BAD_DATA" and
+            abs(t - self._last_timestamp) > 3*24*60*60):
+            t = self.scan_timestamp_buffered()
+            if t is None:
+                # as scan_timestamp() the scan ends on the last 8 bytes
+                self._rpos = len(self._rbuf)
+                (tend,) = struct.unpack_from('>Q', self._rbuf, self._rpos - 8)
+                t = tend * 1.0e-6
+        self._link = tusec & 0x3
+        self._timestamp = t
+
+    def _resync(self, tusec):
+        '''scan for a good timestamp after bad data, tusec being the bad
+        timestamp the scan started from, which sets the link, or None when
+        carrying on a scan which reached the end of the log'''
+        if tusec is not None:
+            self._resync_link = tusec & 0x3
+        t = self.scan_timestamp_buffered()
+        if t is None:
+            self._resyncing = True
+            self._frame_pending = True
+            return
+        self._resyncing = False
+        self._in_record = True
+        self._link = self._resync_link
+        self._timestamp = t
 
     def pre_message(self):
         '''read timestamp if needed'''
+        if self.read_ahead > 0:
+            self.pre_message_buffered()
+            return
         # read the timestamp
         if self.filesize != 0:
             self.percent = (100.0 * self.f.tell()) / self.filesize
@@ -1454,9 +1745,17 @@ class mavlogfile(mavfile):
             self._link = tusec & 0x3
         self._timestamp = t
 
+    def post_filtered(self):
+        '''skip to the timestamp of the next message'''
+        if self.planner_format:
+            self.f.read(1) # trailing newline
+        self._in_record = False
+        self.pre_message()
+
     def post_message(self, msg):
         '''add timestamp to message'''
         # read the timestamp
+        self._in_record = False
         super(mavlogfile, self).post_message(msg)
         if self.planner_format:
             self.f.read(1) # trailing newline
@@ -1467,23 +1766,79 @@ class mavlogfile(mavfile):
         msg._link = self._link
 
 
+class TypeCursor(object):
+    '''walks the offsets of a set of message types in log order.
+
+    offsets is a list of sorted offset tables, one per message type, and
+    counts the number of valid entries in each. The tables are merged
+    with a heap, so each step costs O(log n) in the number of types
+    rather than a scan over all of them. A cursor can be kept for a type
+    set and moved with seek() instead of being built again'''
+    def __init__(self, offsets, counts):
+        self.offsets = offsets
+        self.counts = counts
+        self.seek(0)
+
+    def seek(self, ofs):
+        '''position the cursor at the first message at or after ofs'''
+        heap = []
+        for i in range(len(self.offsets)):
+            j = bisect.bisect_left(self.offsets[i], ofs, 0, self.counts[i])
+            if j < self.counts[i]:
+                heap.append((self.offsets[i][j], i, j))
+        heapq.heapify(heap)
+        self.heap = heap
+
+    def next(self):
+        '''return the offset of the next message, or None at the end'''
+        if len(self.heap) == 0:
+            return None
+        (ofs, i, j) = self.heap[0]
+        j += 1
+        if j < self.counts[i]:
+            heapq.heapreplace(self.heap, (self.offsets[i][j], i, j))
+        else:
+            heapq.heappop(self.heap)
+        return ofs
+
+
+# every TIME_INDEX_SPACING'th message of each type is put in the time
+# index of a mavmmaplog, leaving out timestamps more than
+# TIME_INDEX_MAX_JUMP microseconds after the latest one, as for
+# mavlogfile.scan_timestamp()
+TIME_INDEX_SPACING = 128
+TIME_INDEX_MAX_JUMP = 3*24*60*60*1000000
+
 class mavmmaplog(mavlogfile):
     '''a MAVLink log file accessed via mmap. Used for fast read-only
     access with low memory overhead where particular message types are wanted'''
-    def __init__(self, filename, progress_callback=None):
+    def __init__(self, filename, progress_callback=None, cache_index=None):
         import mmap
         mavlogfile.__init__(self, filename)
         self.f.seek(0, 2)
         self.data_len = self.f.tell()
         self.f.seek(0)
         self.data_map = None
+        # built by seek_time() when first needed
+        self._time_index_cache = None
+        # the offset set by seek_offset() to stop reading at
+        self._end = None
         if self.data_len != 0:
             if platform.system() == "Windows":
                 self.data_map = mmap.mmap(self.f.fileno(), self.data_len, None, mmap.ACCESS_READ)
             else:
                 self.data_map = mmap.mmap(self.f.fileno(), self.data_len, mmap.MAP_PRIVATE, mmap.PROT_READ)
             self._rewind()
-            self.init_arrays(progress_callback)
+            # optionally keep the index in a sidecar file so the next
+            # open of the same log can skip the scan
+            if cache_index is None:
+                cache_index = os.getenv('PYMAVLINK_INDEX_CACHE', '0') == '1'
+            if not cache_index or not self.load_index():
+                self.init_arrays(progress_callback)
+                if cache_index:
+                    self.save_index()
+            # the messages read while indexing aren't packets received
+            self.reset_packet_loss()
         self._flightmodes = None
 
     def _rewind(self):
@@ -1502,8 +1857,8 @@ class mavmmaplog(mavlogfile):
         if self.data_map is not None:
             self.data_map.close()
 
-    def init_arrays(self, progress_callback=None):
-        '''initialise arrays for fast recv_match()'''
+    def _reset_arrays(self):
+        '''set up empty arrays for fast recv_match()'''
 
         # dictionary indexed by msgid, mapping to arrays of file offsets where
         # each instance of a msg type is found
@@ -1523,7 +1878,98 @@ class mavmmaplog(mavlogfile):
         self.instance_lengths = {}
 
         self.type_nums = None
+        # TypeCursor for each set of type IDs asked for by skip_to_type()
+        self._type_cursors = {}
+
+    def _finish_arrays(self):
+        '''total up the message counts once the arrays are filled in'''
+        for mtype in self.counts:
+            self._count += self.counts[mtype]
+        self.offset = 0
+        self._rewind()
 
+    def init_arrays(self, progress_callback=None):
+        '''initialise arrays for fast recv_match()'''
+        self._reset_arrays()
+        self._switch_protocol()
+        # the compiled scanner gives the same tables as the Python loop
+        if mavparser.available and os.getenv('PYMAVLINK_FAST_INDEX', '1') == '1':
+            self.init_arrays_fast(progress_callback)
+        else:
+            self.init_arrays_python(progress_callback)
+        self._finish_arrays()
+
+    def _switch_protocol(self):
+        '''switch to the protocol version of the first frame in the log,
+        as reading the first message does, so that mavlink.mavlink_map
+        holds the messages the log will be decoded with'''
+        if self.first_byte and self.data_len > 8:
+            self.auto_mavlink_version(self.data_map[8:9])
+
+    def add_first_message(self, mtype, ofs):
+        '''read the first message of a type, at ofs, into the messages dict'''
+        self.offsets[mtype] = []
+        self.counts[mtype] = 0
+        msg = mavlink.mavlink_map[mtype]
+        self.name_to_id[msg.msgname] = mtype
+        self.id_to_name[mtype] = msg.msgname
+        self.f.seek(ofs)
+        m = self.recv_msg()
+        add_message(self.messages, msg.msgname, m)
+        return m
+
+    def add_instance_message(self, mtype, instance):
+        '''point messages at NAME[instance] to the message of type mtype'''
+        mname = self.id_to_name[mtype]
+        if mname in self.messages:
+            iname = "%s[%s]" % (mname, str(instance))
+            self.messages[iname] = self.messages[mname]
+
+    def init_arrays_fast(self, progress_callback=None):
+        '''fill in the arrays for fast recv_match() with the compiled tlog
+        scanner'''
+        instance_fields = {}
+        for (mtype, msg) in mavlink.mavlink_map.items():
+            if msg.instance_field is not None:
+                alen = msg.array_lengths[msg.ordered_fieldnames.index(msg.instance_field)]
+                instance_fields[mtype] = (msg.instance_offset, max(alen, 1))
+        (offsets, instances) = mavparser.scan_tlog(self.data_map, instance_fields,
+                                                   progress_callback=progress_callback)
+
+        # replay the first message of each type and each instance seen, in
+        # log order, as the Python loop does as it goes. Instances are
+        # also added again at their last frame, as the Python loop does
+        # at every frame, in case the vehicle the messages dict is for
+        # was found in between. This gives the same messages entries,
+        # though aliases may be added in a different order
+        events = []
+        for (mtype, type_offsets) in offsets.items():
+            if mtype in mavlink.mavlink_map:
+                events.append((type_offsets[0], 0, mtype, None))
+        for (mtype, values) in instances.items():
+            for (value, first, last) in values:
+                events.append((first, 1, mtype, value))
+                events.append((last, 1, mtype, value))
+        events.sort()
+        for (ofs, kind, mtype, value) in events:
+            if kind == 0:
+                self.add_first_message(mtype, ofs)
+                continue
+            if len(value) > 1:
+                # assume string
+                instance = value.rstrip(b'\0').decode('ASCII', errors='ignore').rstrip()
+            else:
+                instance, = struct.unpack('b', value)
+            self.add_instance_message(mtype, instance)
+
+        for mtype in self.offsets:
+            self.offsets[mtype] = offsets[mtype]
+            self.counts[mtype] = len(offsets[mtype])
+            if mtype in instances:
+                (self.instance_offsets[mtype], self.instance_lengths[mtype]) = instance_fields[mtype]
+
+    def init_arrays_python(self, progress_callback=None):
+        '''fill in the arrays for fast recv_match() by walking the log in Python'''
         ofs = 0
         pct = 0
 
@@ -1555,14 +2001,7 @@ class mavmmaplog(mavlogfile):
                 if not mtype in mavlink.mavlink_map:
                     ofs += mlen
                     continue
-                self.offsets[mtype] = []
-                self.counts[mtype] = 0
-                msg = mavlink.mavlink_map[mtype]
-                self.name_to_id[msg.msgname] = mtype
-                self.id_to_name[mtype] = msg.msgname
-                self.f.seek(ofs)
-                m = self.recv_msg()
-                add_message(self.messages, msg.msgname, m)
+                m = self.add_first_message(mtype, ofs)
                 if m._instance_field is not None:
                     instance_idx = m.ordered_fieldnames.index(m._instance_field)
                     self.instance_offsets[mtype] = m._instance_offset
@@ -1599,10 +2038,7 @@ class mavmmaplog(mavlogfile):
                     instance = b.decode('ASCII',errors='ignore').rstrip()
                 else:
                     instance, = struct.unpack('b', b[:1])
-                mname = self.id_to_name[mtype]
-                if mname in self.messages:
-                    iname = "%s[%s]" % (mname, str(instance))
-                    self.messages[iname] = self.messages[mname]
+                self.add_instance_message(mtype, instance)
 
             self.offsets[mtype].append(ofs)
             self.counts[mtype] += 1
@@ -1613,11 +2049,6 @@ class mavmmaplog(mavlogfile):
                 progress_callback(new_pct)
                 pct = new_pct
 
-        for mtype in self.counts:
-            self._count += self.counts[mtype]
-        self.offset = 0
-        self._rewind()
-
     def skip_to_type(self, type):
         '''skip fwd to next msg matching given type set'''
         if self.data_map is None:
@@ -1626,36 +2057,176 @@ class mavmmaplog(mavlogfile):
             # always add some key msg types so we can track flightmode, params etc
             type = type.copy()
             type.update(set(['HEARTBEAT','PARAM_VALUE']))
-            self.indexes = []
-            self.type_nums = []
-            for t in type:
-                if not t in self.name_to_id:
-                    continue
-                self.type_nums.append(self.name_to_id[t])
-                self.indexes.append(0)
-        smallest_index = -1
-        smallest_offset = self.data_len
-        for i in range(len(self.type_nums)):
-            mtype = self.type_nums[i]
-            if self.indexes[i] >= self.counts[mtype]:
+            self.type_nums = sorted(set([self.name_to_id[t] for t in type if t in self.name_to_id]))
+            key = tuple(self.type_nums)
+            if key not in self._type_cursors:
+                self._type_cursors[key] = TypeCursor([self.offsets[t] for t in self.type_nums],
+                                                     [self.counts[t] for t in self.type_nums])
+            self._type_cursor = self._type_cursors[key]
+            self._type_cursor.seek(self.offset)
+        ofs = self._type_cursor.next()
+        if ofs is not None:
+            self.offset = ofs
+            self.f.seek(ofs)
+
+    def _time_index(self):
+        '''return the sparse time index of the log, building it if needed.
+
+        The index is a tuple of two lists in log order: the largest
+        timestamp in microseconds seen up to each sampled message, which
+        can be binary searched, and the offset of the message. Only the
+        timestamp of every TIME_INDEX_SPACING'th message of each type is
+        read, and timestamps which jump forward by more than
+        TIME_INDEX_MAX_JUMP, which are probably from corrupt data, are
+        left out.
+        '''
+        if self._time_index_cache is not None:
+            return self._time_index_cache
+        samples = []
+        for type_offsets in self.offsets.values():
+            for ofs in type_offsets[::TIME_INDEX_SPACING]:
+                samples.append((ofs, struct.unpack_from('>Q', self.data_map, ofs)[0]))
+        samples.sort()
+        keys = []
+        offsets = []
+        latest = None
+        for (ofs, tusec) in samples:
+            if latest is not None and tusec > latest + TIME_INDEX_MAX_JUMP:
                 continue
-            ofs = self.offsets[mtype][self.indexes[i]]
-            if ofs < smallest_offset:
-                smallest_offset = ofs
-                smallest_index = i
-        if smallest_index >= 0:
-            self.indexes[smallest_index] += 1
-            self.offset = smallest_offset
-            self.f.seek(smallest_offset)
+            if latest is None or tusec > latest:
+                latest = tusec
+            keys.append(latest)
+            offsets.append(ofs)
+        self._time_index_cache = (keys, offsets)
+        return self._time_index_cache
+
+    def seek_time(self, t):
+        '''position the reader at the first message with a timestamp of at
+        least t, so that it is the next one returned by recv_msg() or
+        recv_match().
+
+        The sparse time index is binary searched for the last sampled
+        message before t, and the timestamps of the messages from there
+        are read until one is at least t. The latest message of each type
+        before that point is loaded into self.messages, which also sets
+        the flight mode, but params are left as they were, as for
+        rewind().
+        '''
+        if self.data_map is None:
+            return
+        (keys, offsets) = self._time_index()
+        i = bisect.bisect_left(keys, t * 1.0e6) - 1
+        start = 0
+        limit = None
+        if i >= 0:
+            start = offsets[i]
+            limit = keys[i] + TIME_INDEX_MAX_JUMP
+        types = list(self.offsets.keys())
+        cursor = TypeCursor([self.offsets[mtype] for mtype in types],
+                            [self.counts[mtype] for mtype in types])
+        cursor.seek(start)
+        target = self.data_len
+        while True:
+            ofs = cursor.next()
+            if ofs is None:
+                break
+            (tusec,) = struct.unpack_from('>Q', self.data_map, ofs)
+            if tusec * 1.0e-6 >= t and (limit is None or tusec <= limit):
+                target = ofs
+                break
+        self._seek_message(target)
 
-    def recv_match(self, condition=None, type=None, blocking=False, timeout=None):
+    def _source_key(self, mtype, ofs):
+        '''return the source system of the message at ofs, with the bytes
+        of its instance field if its type has one'''
+        if u_ord(self.data_map[ofs+8]) == mavlink.PROTOCOL_MARKER_V2:
+            (src, data_ofs) = (u_ord(self.data_map[ofs+13]), ofs+18)
+        else:
+            (src, data_ofs) = (u_ord(self.data_map[ofs+11]), ofs+14)
+        if not mtype in self.instance_offsets:
+            return src
+        i = data_ofs + self.instance_offsets[mtype]
+        return (src, self.data_map[i:i+self.instance_lengths[mtype]])
+
+    def _seek_message(self, target):
+        '''position the reader at the message at offset target, loading
+        the latest message of each type before it from each system, and of
+        each instance of the type. Only the last TIME_INDEX_SPACING
+        messages of each type are looked through for them'''
+        self._rewind()
+        hb_offsets = self.offsets.get(self.name_to_id.get('HEARTBEAT'), [])
+        for ofs in hb_offsets[:TIME_INDEX_SPACING]:
+            if self.sysid != 0 or ofs >= target:
+                break
+            # lock onto the first vehicle heartbeat, as reading the log
+            # from the start would
+            self.f.seek(ofs)
+            self.recv_msg()
+        latest = []
+        for (mtype, offsets) in self.offsets.items():
+            j = bisect.bisect_left(offsets, target)
+            seen = set()
+            for k in range(j-1, max(j-1-TIME_INDEX_SPACING, -1), -1):
+                key = self._source_key(mtype, offsets[k])
+                if not key in seen:
+                    seen.add(key)
+                    latest.append(offsets[k])
+        for prev in sorted(latest):
+            self.f.seek(prev)
+            self.recv_msg()
+        self.offset = target
+        self.f.seek(target)
+
+    def seek_offset(self, start, end=None):
+        '''position the reader at the first message at or after offset
+        start, loading the latest message of each type before it as
+        seek_time() does. If end is given no message at or after offset
+        end is read, as if the log stopped there, until the next call'''
+        self._end = end
+        if self.data_map is None:
+            return
+        types = list(self.offsets.keys())
+        cursor = TypeCursor([self.offsets[mtype] for mtype in types],
+                            [self.counts[mtype] for mtype in types])
+        cursor.seek(start)
+        target = cursor.next()
+        if target is None:
+            target = self.data_len
+        if start == 0:
+            # keep any bad data before the first message
+            target = 0
+        self._seek_message(target)
+
+    def pre_message(self):
+        '''read timestamp if needed, unless past the end set by
+        seek_offset()'''
+        if self._end is not None and self.f.tell() >= self._end:
+            self.f.seek(0, 2)
+            return
+        mavlogfile.pre_message(self)
+
+    def _skip_to_time(self, t):
+        '''seek forward to time t if that skips part of the log'''
+        if self.data_map is None:
+            return
+        (keys, offsets) = self._time_index()
+        i = bisect.bisect_left(keys, t * 1.0e6) - 1
+        if i >= 0 and self.f.tell() < offsets[i]:
+            self.seek_time(t)
+
+    def recv_match(self, condition=None, type=None, blocking=False, timeout=None,
+                   start_time=None, end_time=None):
         '''recv the next message that matches the given condition
-        type can be a string or a list of strings'''
+        type can be a string or a list of strings. If start_time or
+        end_time are given only messages with timestamps in that range
+        are returned, seeking forward to start_time where possible'''
         if type is not None:
             if isinstance(type, str):
                 type = set([type])
             elif isinstance(type, list):
                 type = set(type)
+        if start_time is not None:
+            self._skip_to_time(start_time)
         while True:
             if type is not None:
                 self.skip_to_type(type)
@@ -1672,6 +2243,10 @@ class mavmmaplog(mavlogfile):
                 return None
             if type is not None and not m.get_type() in type:
                 continue
+            if end_time is not None and m._timestamp > end_time:
+                return None
+            if start_time is not None and m._timestamp < start_time:
+                continue
             if not evaluate_condition(condition, self.messages):
                 continue
             return m
@@ -1703,6 +2278,82 @@ class mavmmaplog(mavlogfile):
         self._rewind()
         return self._flightmodes
 
+    def _index_key(self):
+        '''key used to validate a sidecar index against this log. The
+        protocol version is the one the log is read with, which is only
+        settled once _switch_protocol() has seen its first frame'''
+        self._switch_protocol()
+        return logindex.file_key(self.filename, self.data_map,
+                                 kind='tlog',
+                                 dialect=current_dialect,
+                                 wire_protocol=mavlink.WIRE_PROTOCOL_VERSION)
+
+    def save_index(self):
+        '''save the offset, instance and time indexes to a sidecar file'''
+        # the NAME[instance] entries in the messages dicts, which point
+        # at the entry for NAME in the same dict
+        aliases = []
+        for (sysid, state) in self.sysid_state.items():
+            for (name, m) in state.messages.items():
+                base = name.split('[')[0]
+                if base != name and state.messages.get(base) is m:
+                    aliases.append([sysid, name, base])
+        meta = {
+            'name_to_id': self.name_to_id,
+            'instances': [[mtype, self.instance_offsets[mtype], self.instance_lengths[mtype]]
+                          for mtype in self.instance_offsets],
+            'aliases': aliases,
+        }
+        (keys, offsets) = self._time_index()
+        arrays = {
+            'time_keys': keys,
+            'time_offsets': offsets,
+        }
+        for mtype in self.offsets:
+            arrays['offsets.%u' % mtype] = self.offsets[mtype]
+        try:
+            return logindex.save(self.filename, self._index_key(), meta, arrays)
+        except (TypeError, ValueError):
+            # something in the metadata is not serialisable
+            return False
+
+    def load_index(self):
+        '''load the offset, instance and time indexes from a sidecar file.
+        Returns False if there is no valid index for this log'''
+        try:
+            loaded = logindex.load(self.filename, self._index_key())
+        except (KeyError, TypeError, ValueError):
+            loaded = None
+        if loaded is None:
+            return False
+        (meta, arrays) = loaded
+        offsets = {}
+        for (name, a) in arrays.items():
+            if name.startswith('offsets.'):
+                offsets[int(name[8:])] = a
+        if not all(mtype in mavlink.mavlink_map and len(offsets[mtype]) > 0 for mtype in offsets):
+            return False
+
+        # re-read the first message of each type, as the scan did, so
+        # that the messages dicts have an entry for each type
+        self._reset_arrays()
+        for (ofs, mtype) in sorted((a[0], mtype) for (mtype, a) in offsets.items()):
+            self.add_first_message(mtype, ofs)
+        for (mtype, a) in offsets.items():
+            self.offsets[mtype] = a
+            self.counts[mtype] = len(a)
+        self.name_to_id = meta['name_to_id']
+        for (mtype, ofs, length) in meta['instances']:
+            self.instance_offsets[mtype] = ofs
+            self.instance_lengths[mtype] = length
+        for (sysid, name, base) in meta['aliases']:
+            state = self.sysid_state.get(sysid)
+            if state is not None and base in state.messages:
+                state.messages[name] = state.messages[base]
+        self._time_index_cache = (list(arrays['time_keys']), list(arrays['time_offsets']))
+        self._finish_arrays()
+        return True
+
 class mavchildexec(mavfile):
     '''a MAVLink child processes reader/writer'''
     def __init__(self, filename, source_system=255, source_component=0, use_native=default_native):
@@ -2019,8 +2670,12 @@ def mavlink_connection(device, baud=115200, source_system=255, source_component=
                        dialect=None, autoreconnect=False, zero_time_base=False,
                        retries=3, use_native=default_native,
                        force_connected=False, progress_callback=None,
-                       udp_timeout=0, **opts):
-    '''open a serial, UDP, TCP or file mavlink connection'''
+                       udp_timeout=0, read_ahead=0, follow=False, cache_index=None, **opts):
+    '''open a serial, UDP, TCP or file mavlink connection. With read_ahead
+    set, MAVLink logs are streamed read_ahead bytes at a time instead of
+    being indexed, and with follow as well a log still being written can
+    be followed. cache_index is passed to the log readers which keep
+    their index in a sidecar file'''
     global mavfile_global
 
     if force_connected:
@@ -2057,7 +2712,8 @@ def mavlink_connection(device, baud=115200, source_system=255, source_component=
     if device.lower().endswith('.bin') or device.lower().endswith('.px4log'):
         # support dataflash logs
         from pymavlink import DFReader
-        m = DFReader.DFReader_binary(device, zero_time_base=zero_time_base, progress_callback=progress_callback)
+        m = DFReader.DFReader_binary(device, zero_time_base=zero_time_base, progress_callback=progress_callback,
+                                     cache_index=cache_index)
         mavfile_global = m
         return m
 
@@ -2098,12 +2754,13 @@ def mavlink_connection(device, baud=115200, source_system=255, source_component=
         if device.endswith(".elf") or device.find("/bin/") != -1:
             print("executing '%s'" % device)
             return mavchildexec(device, source_system=source_system, source_component=source_component, use_native=use_native)
-        elif not write and not append and not notimestamps:
-            return mavmmaplog(device, progress_callback=progress_callback)
+        elif not write and not append and not notimestamps and read_ahead == 0:
+            return mavmmaplog(device, progress_callback=progress_callback, cache_index=cache_index)
         else:
             return mavlogfile(device, planner_format=planner_format, write=write,
                               append=append, robust_parsing=robust_parsing, notimestamps=notimestamps,
-                              source_system=source_system, source_component=source_component, use_native=use_native)
+                              source_system=source_system, source_component=source_component, use_native=use_native,
+                              read_ahead=read_ahead, follow=follow)
     return mavserial(device,
                      baud=baud,
                      source_system=source_system,
@@ -2112,6 +2769,152 @@ def mavlink_connection(device, baud=115200, source_system=255, source_component=
                      use_native=use_native,
                      force_connected=force_connected)
 
+class mavhub_link(object):
+    '''state of a connection in a mavhub'''
+    def __init__(self, callback):
+        self.callback = callback
+        self.fd = None
+        self.routes = []
+        # times the descriptor has been readable with nothing to read
+        self.empty_reads = 0
+
+
+class mavhub(object):
+    '''wait for messages on many mavlink connections at once. Each
+    connection's messages are passed to its callback as soon as its file
+    descriptor is readable, and can be forwarded to other connections'''
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.links = {}
+        # links with messages that may already be buffered, or with no
+        # file descriptor to wait on, which are read on every poll()
+        self.ready = set()
+        self.unselectable = set()
+
+    def add(self, link, callback=None):
+        '''add a connection, calling callback(link, msg) for each message
+        received on it'''
+        self.links[link] = mavhub_link(callback)
+        self.register(link)
+        self.ready.add(link)
+
+    def remove(self, link):
+        '''stop waiting for messages on a connection, without closing it'''
+        if link not in self.links:
+            return
+        self.unregister(link)
+        del self.links[link]
+        for state in self.links.values():
+            if link in state.routes:
+                state.routes.remove(link)
+        self.ready.discard(link)
+
+    def add_route(self, src, dst):
+        '''forward every message received on src to dst'''
+        if dst not in self.links[src].routes:
+            self.links[src].routes.append(dst)
+
+    def remove_route(self, src, dst):
+        '''stop forwarding messages from src to dst'''
+        if src in self.links and dst in self.links[src].routes:
+            self.links[src].routes.remove(dst)
+
+    def register(self, link):
+        self.links[link].fd = link.fd
+        if link.fd is None:
+            self.unselectable.add(link)
+            return
+        try:
+            self.selector.register(link.fd, selectors.EVENT_READ, link)
+        except (ValueError, OSError):
+            # not a file descriptor that can be selected on, such as a
+            # serial port on Windows
+            self.links[link].fd = None
+            self.unselectable.add(link)
+
+    def unregister(self, link):
+        if self.links[link].fd is not None:
+            self.selector.unregister(self.links[link].fd)
+        self.unselectable.discard(link)
+
+    def dispatch(self, link):
+        '''pass all the messages buffered or waiting on a connection to its
+        callback and routes, returning how many there were'''
+        state = self.links[link]
+        fd = state.fd
+        nbytes = link.mav.total_bytes_received
+        count = 0
+        while True:
+            m = link.recv_msg()
+            if m is None:
+                break
+            count += 1
+            if state.callback is not None:
+                state.callback(link, m)
+            if m.get_type() == 'BAD_DATA':
+                continue
+            for dst in state.routes:
+                dst.write(m.get_msgbuf())
+        if link not in self.links:
+            # removed by the callback
+            return count
+        if link.fd != fd:
+            # such as a TCP server accepting a connection
+            self.unregister(link)
+            self.register(link)
+        elif count == 0 and link.mav.total_bytes_received == nbytes and fd is not None:
+            # a readable descriptor with nothing to read has been closed
+            # by the other end. Give it a few tries, as some connections
+            # read data that isn't MAVLink
+            state.empty_reads += 1
+            if state.empty_reads >= 3:
+                self.remove(link)
+            return count
+        state.empty_reads = 0
+        return count
+
+    def poll(self, timeout=None):
+        '''wait for up to timeout seconds for messages on any of the
+        connections and dispatch them, returning how many there were'''
+        if self.ready:
+            timeout = 0
+        elif self.unselectable:
+            # these can only be polled
+            timeout = 0.05 if timeout is None else min(timeout, 0.05)
+        if self.selector.get_map():
+            events = self.selector.select(timeout)
+        else:
+            events = []
+            if timeout:
+                time.sleep(timeout)
+        links = self.ready | self.unselectable
+        self.ready = set()
+        links.update(key.data for (key, mask) in events)
+        count = 0
+        for link in links:
+            if link in self.links:
+                count += self.dispatch(link)
+        return count
+
+    def run(self, duration=None):
+        '''dispatch messages for duration seconds, or until all the
+        connections have been removed'''
+        end = None if duration is None else time.time() + duration
+        while self.links:
+            timeout = None
+            if end is not None:
+                timeout = end - time.time()
+                if timeout <= 0:
+                    break
+            self.poll(timeout)
+
+    def close(self):
+        '''remove all the connections, without closing them'''
+        for link in list(self.links):
+            self.remove(link)
+        self.selector.close()
+
+
 class periodic_event(object):
     '''a class for fixed frequency events'''
     def __init__(self, frequency):
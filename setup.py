@@ -34,6 +34,20 @@ if "--fast-index" in sys.argv:
     build_fast_index = True
     sys.argv.remove("--fast-index")
 
+# Option for building the compiled MAVLink frame parser, with the same
+# defaults as the fast indexer
+build_fast_parser = build_fast_index
+if os.getenv("PYMAVLINK_FAST_PARSER", None) == "0":
+    build_fast_parser = False
+elif os.getenv("PYMAVLINK_FAST_PARSER", None) == "1":
+    build_fast_parser = True
+if "--no-fast-parser" in sys.argv:
+    build_fast_parser = False
+    sys.argv.remove("--no-fast-parser")
+if "--fast-parser" in sys.argv:
+    build_fast_parser = True
+    sys.argv.remove("--fast-parser")
+
 # Debug build option for Cython
 debug_build = False
 if "--cython-debug" in sys.argv:
@@ -136,15 +150,17 @@ def test_python_h_available():
             compiler.compile([test_file], output_dir=tmpdir)
             return True
         except Exception as e:
-            warnings.warn(f"Disabling fast index: missing Python.h ({e})")
+            warnings.warn(f"Disabling fast index and parser: missing Python.h ({e})")
             return False
 
-if build_fast_index and not test_python_h_available():
+if (build_fast_index or build_fast_parser) and not test_python_h_available():
     build_fast_index = False
+    build_fast_parser = False
+
+extra_compile_args = ["-g", "-Og"] if debug_build else ["-O2"]
+extra_link_args = ["-g"] if debug_build else []
 
 if build_fast_index:
-    extra_compile_args = ["-g", "-Og"] if debug_build else ["-O2"]
-    extra_link_args = ["-g"] if debug_build else []
     ext_modules += cythonize([
         Extension(
             name="pymavlink.dfindexer.dfindexer_cy",
@@ -158,6 +174,20 @@ if build_fast_index:
         )
     ], language_level=3)
 
+if build_fast_parser:
+    ext_modules += cythonize([
+        Extension(
+            name="pymavlink.mavparser.mavparser_cy",
+            sources=[
+                "mavparser/mavparser_cy.pyx",
+                "mavparser/mavparser.c"
+            ],
+            include_dirs=["pymavlink/mavparser"],
+            extra_compile_args=extra_compile_args,
+            extra_link_args=extra_link_args,
+        )
+    ], language_level=3)
+
 setup (name = 'pymavlink',
        version = __version__,
        description = 'Python MAVLink code',
@@ -197,6 +227,7 @@ setup (name = 'pymavlink',
                    'pymavlink.dialects.v10',
                    'pymavlink.dialects.v20',
                    'pymavlink.dfindexer',
+                   'pymavlink.mavparser',
                    ],
        scripts = [ 'tools/magfit_delta.py', 'tools/mavextract.py',
                    'tools/mavgraph.py', 'tools/mavparmdiff.py',
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+
+"""
+regression tests for DFReader.py
+"""
+import unittest
+import os
+import shutil
+import tempfile
+import pkg_resources
+
+from pymavlink import DFReader
+from pymavlink import dfindexer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class DFReaderTest(unittest.TestCase):
+
+    """
+    Class to test DFReader
+    """
+
+    def setUp(self):
+        """copy the test log somewhere we can write sidecar files"""
+        self.tmpdir = tempfile.mkdtemp()
+        test_filepath = pkg_resources.resource_filename(__name__, "test.BIN")
+        self.filename = os.path.join(self.tmpdir, "test.BIN")
+        shutil.copy(test_filepath, self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def dump(self, log):
+        """return all messages in a log as strings with timestamps"""
+        ret = []
+        while True:
+            m = log.recv_msg()
+            if m is None:
+                break
+            ret.append("%.6f %s" % (m._timestamp, m))
+        return ret
+
+    def test_index_cache(self):
+        """Test a cached index gives the same results as a full scan"""
+        log = DFReader.DFReader_binary(self.filename, cache_index=True)
+        self.assertTrue(os.path.exists(self.filename + ".pmidx"))
+        expected_messages = sorted(log.messages.keys())
+        expected_params = dict(log.params)
+        expected = self.dump(log)
+
+        log2 = DFReader.DFReader_binary(self.filename, cache_index=True)
+        self.assertTrue(log2.load_index())
+        self.assertEqual(sorted(log2.messages.keys()), expected_messages)
+        self.assertEqual(log2.params, expected_params)
+        self.assertEqual(type(log2.clock), type(log.clock))
+        self.assertEqual(self.dump(log2), expected)
+
+    def test_index_cache_invalidated(self):
+        """Test a cached index is not used for a modified log"""
+        DFReader.DFReader_binary(self.filename, cache_index=True)
+        log = DFReader.DFReader_binary(self.filename, zero_time_base=True)
+        self.assertFalse(log.load_index())
+        with open(self.filename, 'ab') as f:
+            f.write(b'\0' * 16)
+        log = DFReader.DFReader_binary(self.filename)
+        self.assertFalse(log.load_index())
+
+    def test_lazy_clock(self):
+        """Test the clock is only worked out once it is needed"""
+        log = DFReader.DFReader_binary(self.filename)
+        self.assertIsInstance(log.clock, DFReader.DFReaderClock_lazy)
+        self.assertNotEqual(log.params, {})
+        m = log.recv_match(type='GPS')
+        self.assertIsInstance(log.clock, DFReader.DFReaderClock_usec)
+        # the timebase comes from the first GPS fix
+        self.assertAlmostEqual(m._timestamp, log.clock._gpsTimeToTime(m.GWk, m.GMS), places=6)
+
+    def test_message_class(self):
+        """Test per-format message classes read fields as DFMessage does"""
+        log = DFReader.DFReader_binary(self.filename)
+        while True:
+            m = log.recv_msg()
+            if m is None:
+                break
+            self.assertIsInstance(m, m.fmt.message_class)
+            g = DFReader.DFMessage(m.fmt, list(m._elements), True, log)
+            for field in m.get_fieldnames():
+                self.assertEqual(repr(getattr(m, field)), repr(g.__getattr__(field)))
+        m = log.messages['GPS']
+        m.Lat = 12.5
+        self.assertEqual(m.Lat, 12.5)
+
+    def test_iter_messages(self):
+        """Test raw iteration gives the same messages as recv_match"""
+        for types in [None, ['GPS', 'ATT'], 'PARM']:
+            log = DFReader.DFReader_binary(self.filename)
+            expected = []
+            while True:
+                m = log.recv_match(type=types, strict=True)
+                if m is None:
+                    break
+                expected.append((m._timestamp, str(m)))
+            log = DFReader.DFReader_binary(self.filename)
+            messages = dict(log.messages)
+            got = [(m._timestamp, str(m)) for m in log.iter_messages(types)]
+            self.assertEqual(got, expected)
+            # the reader itself hasn't moved
+            self.assertEqual(log.offset, 0)
+            self.assertEqual(log.messages, messages)
+            got = [(m._timestamp, str(m)) for m in log.iter_messages(types, track_state=True)]
+            self.assertEqual(got, expected)
+
+    def test_skip_to_type(self):
+        """Test reading many types matches filtering every message"""
+        log = DFReader.DFReader_binary(self.filename)
+        types = set(log.name_to_id.keys()) - set(['FMT', 'PARM'])
+        expected = [x for x in self.dump(log) if x.split()[1] in types]
+        for i in range(2):
+            log.rewind()
+            got = []
+            while True:
+                m = log.recv_match(type=types, strict=True)
+                if m is None:
+                    break
+                got.append("%.6f %s" % (m._timestamp, m))
+            self.assertEqual(got, expected)
+        # the cursor for the type set is kept across rewinds
+        self.assertEqual(len(log._type_cursors), 1)
+
+    def test_seek_time(self):
+        """Test seeking and time windows match a read from the start"""
+        log = DFReader.DFReader_binary(self.filename)
+        messages = []
+        while True:
+            m = log.recv_msg()
+            if m is None:
+                break
+            messages.append((m._timestamp, str(m)))
+        (start, end) = (messages[0][0], messages[-1][0])
+        for i in range(11):
+            t = start + (end - start) * i / 10.0
+            expected = [x for x in messages if x[0] >= t][0]
+            log.seek_time(t)
+            m = log.recv_msg()
+            self.assertEqual((m._timestamp, str(m)), expected)
+
+        (t0, t1) = (start + (end - start) * 0.4, start + (end - start) * 0.6)
+        expected = [x for x in messages
+                    if x[1].startswith('ATT ') and t0 <= x[0] <= t1]
+        self.assertTrue(len(expected) > 0)
+        log.rewind()
+        got = []
+        while True:
+            m = log.recv_match(type='ATT', start_time=t0, end_time=t1)
+            if m is None:
+                break
+            got.append((m._timestamp, str(m)))
+        self.assertEqual(got, expected)
+
+    @unittest.skipIf(numpy is None, "numpy not available")
+    def test_to_arrays(self):
+        """Test columnar extraction matches messages from recv_match"""
+        log = DFReader.DFReader_binary(self.filename)
+        for mtype in ['GPS', 'ATT', 'PARM', 'MODE']:
+            arr = log.to_arrays(mtype)
+            log.rewind()
+            msgs = []
+            while True:
+                m = log.recv_match(type=mtype, strict=True)
+                if m is None:
+                    break
+                msgs.append(m)
+            self.assertEqual(len(arr), len(msgs))
+            for (m, row) in zip(msgs, arr):
+                self.assertEqual(row['timestamp'], m._timestamp)
+                for field in m.get_fieldnames():
+                    value = row[field].item()
+                    if isinstance(value, bytes):
+                        value = value.decode('utf-8')
+                    self.assertEqual(value, getattr(m, field))
+
+        arr = log.to_arrays('GPS', fields=['Lat', 'Lng'])
+        self.assertEqual(arr.dtype.names, ('Lat', 'Lng', 'timestamp'))
+        with self.assertRaises(KeyError):
+            log.to_arrays('GPS', fields=['NoSuchField'])
+
+    @unittest.skipIf(not dfindexer.available, "dfindexer not available")
+    def test_parallel_index(self):
+        """Test a parallel scan finds the same offsets as a serial one"""
+        log = DFReader.DFReader_binary(self.filename, index_threads=1)
+        expected = [list(o) for o in log.offsets]
+        fmt = log.formats[log.name_to_id['FMT']]
+        for chunk_size in [1000, 4097, 65536]:
+            offsets = dfindexer.build_offsets_parallel(
+                log.data_map, fmt.type, fmt.len, 3, 4, log.HEAD1, log.HEAD2,
+                4, chunk_size=chunk_size)
+            self.assertEqual([list(o) for o in offsets], expected)
+        log2 = DFReader.DFReader_binary(self.filename, index_threads=4)
+        self.assertEqual(self.dump(log2), self.dump(log))
+
+    def test_python_index(self):
+        """Test the uncompiled indexers find the same offsets as the legacy one"""
+        log = DFReader.DFReader_binary(self.filename)
+        expected_dump = self.dump(log)
+        log.init_arrays()
+        expected = [list(o) for o in log.offsets]
+        fmt = log.formats[log.name_to_id['FMT']]
+        modes = [False]
+        if numpy is not None:
+            modes.append(True)
+        for use_numpy in modes:
+            offsets = dfindexer.build_offsets_python(
+                log.data_map, fmt.type, fmt.len, 3, 4, log.HEAD1, log.HEAD2,
+                use_numpy=use_numpy)
+            self.assertEqual([list(o) for o in offsets], expected)
+
+        available = dfindexer.available
+        dfindexer.available = False
+        try:
+            log2 = DFReader.DFReader_binary(self.filename)
+        finally:
+            dfindexer.available = available
+        self.assertEqual(self.dump(log2), expected_dump)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+
+"""
+regression tests for logcolumns.py
+"""
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import pkg_resources
+
+from pymavlink import logcolumns
+from pymavlink import mavutil
+from pymavlink import DFReader
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def write_columns(filename, directory, format, **kwargs):
+    """write all the messages of a log as columns"""
+    log = mavutil.mavlink_connection(filename)
+    writer = logcolumns.ColumnWriter(directory, format=format, **kwargs)
+    while True:
+        m = log.recv_match()
+        if m is None:
+            break
+        writer.add(m, m._timestamp)
+    writer.close()
+    log.close()
+    return writer.filenames()
+
+
+@unittest.skipIf(numpy is None, "numpy not available")
+class LogColumnsTest(unittest.TestCase):
+
+    """
+    Class to test writing logs as columns
+    """
+
+    def setUp(self):
+        """write a telemetry log with array and string fields, and copy
+        the dataflash test log"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.tlog = os.path.join(self.tmpdir, "test.tlog")
+        mav = mavutil.mavlink.MAVLink(None, 1, 1)
+        with open(self.tlog, 'wb') as f:
+            for i in range(1000):
+                if i % 3 == 0:
+                    msg = mavutil.mavlink.MAVLink_param_value_message(b"P%u" % i, i * 0.5, 9, 1000, i)
+                elif i % 3 == 1:
+                    msg = mavutil.mavlink.MAVLink_gps_rtcm_data_message(1, 180, [i % 256] * 180)
+                else:
+                    msg = mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 0, i, 0, 3)
+                f.write(struct.pack('>Q', 1700000000000000 + i * 1000))
+                f.write(msg.pack(mav))
+        test_filepath = pkg_resources.resource_filename(__name__, "test.BIN")
+        self.bin = os.path.join(self.tmpdir, "test.BIN")
+        shutil.copy(test_filepath, self.bin)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_dataflash_npz(self):
+        """Test the columns of a dataflash log match to_arrays()"""
+        files = write_columns(self.bin, os.path.join(self.tmpdir, "npz"), 'npz')
+        log = DFReader.DFReader_binary(self.bin)
+        for mtype in ['ATT', 'GPS', 'IMU', 'CTUN']:
+            expected = log.to_arrays(mtype)
+            got = numpy.load(files[mtype])
+            for field in expected.dtype.names:
+                self.assertEqual(got[field].dtype, expected[field].dtype)
+                self.assertTrue(numpy.array_equal(got[field], expected[field]))
+        msgs = numpy.load(files['MSG'])
+        self.assertEqual(msgs['Message'][0], 'ArduPlane V3.8.2-dev (8178ab40)')
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, "npz", "BAD_DATA.npz")))
+
+    def test_tlog_npz(self):
+        """Test the columns of a telemetry log written in many batches"""
+        files = write_columns(self.tlog, os.path.join(self.tmpdir, "npz"), 'npz',
+                              batch_rows=7, buffer_rows=10, show_source=True)
+        self.assertEqual(sorted(files.keys()), ['GPS_RTCM_DATA', 'HEARTBEAT', 'PARAM_VALUE'])
+        params = numpy.load(files['PARAM_VALUE'])
+        self.assertEqual(len(params['param_id']), 334)
+        self.assertEqual(params['param_id'][3], 'P9')
+        self.assertEqual(params['param_value'].dtype, numpy.float32)
+        self.assertEqual(params['param_value'][3], 4.5)
+        self.assertEqual(params['srcSystem'][0], 1)
+        self.assertAlmostEqual(params['timestamp'][1], 1700000000.003)
+        rtcm = numpy.load(files['GPS_RTCM_DATA'])
+        self.assertEqual(rtcm['data'].shape, (333, 180))
+        self.assertEqual(rtcm['data'][2][0], 7)
+        heartbeats = numpy.load(files['HEARTBEAT'])
+        self.assertEqual(list(heartbeats['custom_mode'][:3]), [2, 5, 8])
+
+    def test_unknown_message(self):
+        """Test messages the dialect doesn't know are skipped"""
+        mav = mavutil.mavlink.MAVLink(None, 1, 1)
+        buf = bytearray(mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3).pack(mav))
+        # a message ID which isn't in the dialect
+        buf[7:10] = struct.pack('<I', 42000)[:3]
+        with open(self.tlog, 'ab') as f:
+            f.write(struct.pack('>Q', 1700000001000000))
+            f.write(bytes(buf))
+        files = write_columns(self.tlog, os.path.join(self.tmpdir, "npz"), 'npz')
+        self.assertEqual(sorted(files.keys()), ['GPS_RTCM_DATA', 'HEARTBEAT', 'PARAM_VALUE'])
+
+    def test_arrow(self):
+        """Test parquet and arrow files hold the same columns as npz"""
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            self.skipTest("pyarrow not available")
+        for log in [self.tlog, self.bin]:
+            npz = write_columns(log, os.path.join(self.tmpdir, "npz"), 'npz', batch_rows=100)
+            parquet = write_columns(log, os.path.join(self.tmpdir, "parquet"), 'columnar', batch_rows=100)
+            arrow = write_columns(log, os.path.join(self.tmpdir, "arrow"), 'arrow', batch_rows=100)
+            self.assertEqual(sorted(npz.keys()), sorted(parquet.keys()))
+            for mtype in npz:
+                expected = numpy.load(npz[mtype])
+                self.assertTrue(parquet[mtype].endswith('.parquet'))
+                tables = [pyarrow.parquet.read_table(parquet[mtype]),
+                          pyarrow.ipc.open_file(arrow[mtype]).read_all()]
+                for table in tables:
+                    self.assertEqual(table.column_names, list(expected.keys()))
+                    for field in table.column_names:
+                        got = numpy.array(table.column(field).to_pylist())
+                        if got.ndim == 1 and got.dtype.kind in 'SU':
+                            got = got.astype(expected[field].dtype)
+                        self.assertTrue(numpy.array_equal(got, expected[field]), (mtype, field))
+
+
+if __name__ == '__main__':
+    unittest.main()
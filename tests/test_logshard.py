@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+
+"""
+regression tests for logshard.py
+"""
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+import pkg_resources
+
+from pymavlink import logshard
+from pymavlink import mavutil
+
+
+def dump(log, types=None, condition=None):
+    """return the messages in a shard with their timestamps, whether the
+    condition held for each, and the packet counts"""
+    ret = []
+    while True:
+        m = log.recv_match(type=types)
+        if m is None:
+            break
+        ret.append("%.6f %s %s" % (m._timestamp, m, log.check_condition(condition)))
+    if isinstance(log, mavutil.mavfile):
+        return (ret, log.mav_count, log.mav_loss, log.first_seq, log.last_seq)
+    return (ret, 0, 0, {}, {})
+
+
+class LogShardTest(unittest.TestCase):
+
+    """
+    Class to test splitting logs into shards
+    """
+
+    def setUp(self):
+        """write a telemetry log from two vehicles and a GCS, with some
+        lost packets and bad data, and copy the dataflash test log"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.tlog = os.path.join(self.tmpdir, "test.tlog")
+        random.seed(1)
+        mavs = [mavutil.mavlink.MAVLink(None, sysid, 1) for sysid in (255, 1, 2)]
+        with open(self.tlog, 'wb') as f:
+            for i in range(6000):
+                mav = mavs[i % 3]
+                if i % 10 < 3:
+                    msg = mavutil.mavlink.MAVLink_heartbeat_message(6 if i % 3 == 0 else 2, 3, 0, i // 1000, 0, 3)
+                else:
+                    msg = mavutil.mavlink.MAVLink_attitude_message(i, 0, 0, 0, 0, 0, 0)
+                buf = msg.pack(mav)
+                if i % 97 == 0:
+                    # lost in transmission
+                    continue
+                f.write(struct.pack('>Q', 1700000000000000 + i * 20000))
+                f.write(buf)
+                if i % 500 == 250:
+                    f.write(bytes(random.randrange(256) for j in range(random.randrange(1, 50))))
+        test_filepath = pkg_resources.resource_filename(__name__, "test.BIN")
+        self.bin = os.path.join(self.tmpdir, "test.BIN")
+        shutil.copy(test_filepath, self.bin)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_shards(self, filename, types, condition, jobs=1):
+        """check shards of a log give the same messages as reading it all"""
+        (expected, count, loss, first, last) = logshard.map_log(filename, dump, (types, condition), shards=1)[0]
+        self.assertTrue(len(expected) > 0)
+        for shards in [2, 5, 13]:
+            results = logshard.map_log(filename, dump, (types, condition), jobs=jobs, shards=shards)
+            self.assertEqual(len(results), shards)
+            got = []
+            for r in results:
+                got.extend(r[0])
+            self.assertEqual(got, expected)
+        return (results, count, loss)
+
+    def test_tlog_shards(self):
+        """Test shards of a telemetry log match reading it in one go"""
+        self.check_shards(self.tlog, None, 'HEARTBEAT.custom_mode==3')
+        self.check_shards(self.tlog, ['HEARTBEAT'], 'HEARTBEAT.type==2')
+
+        # the packets lost between the shards can be counted from the
+        # first and last sequence numbers of each
+        (results, count, loss) = self.check_shards(self.tlog, None, None)
+        self.assertTrue(loss > 0)
+        shard_count = 0
+        shard_loss = 0
+        last_seq = {}
+        for (msgs, c, l, first, last) in results:
+            shard_count += c
+            shard_loss += l
+            for (src, seq) in first.items():
+                if src in last_seq:
+                    shard_loss += (seq - last_seq[src] - 1) % 256
+            last_seq.update(last)
+        self.assertEqual((shard_count, shard_loss), (count, loss))
+
+    def test_dataflash_shards(self):
+        """Test shards of a dataflash log match reading it in one go"""
+        self.check_shards(self.bin, None, 'ATT.Roll>0')
+        self.check_shards(self.bin, ['ATT', 'GPS', 'MODE'], 'GPS.Status>=3')
+
+    def test_worker_processes(self):
+        """Test shards run in worker processes give the same results"""
+        self.check_shards(self.tlog, None, 'HEARTBEAT.custom_mode==3', jobs=2)
+        self.check_shards(self.bin, ['ATT', 'GPS'], None, jobs=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+
+"""
+regression tests for asyncio MAVLink connections
+"""
+import asyncio
+import unittest
+
+from pymavlink import mavasync
+
+
+class MAVAsyncTest(unittest.TestCase):
+
+    """
+    Class to test connections on an asyncio event loop
+    """
+
+    async def udp_pair(self, source_system=1):
+        """return a UDP server and a client sending to it"""
+        srv = await mavasync.mavlink_connection_async("udpin:127.0.0.1:0")
+        port = srv.transport.get_extra_info('sockname')[1]
+        cli = await mavasync.mavlink_connection_async("udpout:127.0.0.1:%u" % port,
+                                                      source_system=source_system, source_component=1)
+        return (srv, cli)
+
+    def test_udp(self):
+        """Test messages are passed both ways over UDP"""
+        async def run():
+            (srv, cli) = await self.udp_pair()
+            cli.mav.heartbeat_send(2, 3, 0, 0, 0)
+            m = await srv.wait_heartbeat(timeout=5)
+            self.assertEqual(m.get_type(), "HEARTBEAT")
+            self.assertEqual(srv.target_system, 1)
+            srv.mav.ping_send(1000, 2, 1, 1)
+            m = await cli.recv_match(type='PING', blocking=True, timeout=5)
+            self.assertEqual(m.time_usec, 1000)
+            self.assertIsNone(await cli.recv_match(type='PING', blocking=True, timeout=0.1))
+            self.assertIsNone(await cli.recv_match(type='PING'))
+
+            for i in range(10):
+                cli.mav.attitude_send(i, 0, 0, 0, 0, 0, 0)
+            received = []
+            async for m in srv:
+                received.append(m.time_boot_ms)
+                if len(received) == 10:
+                    break
+            self.assertEqual(received, list(range(10)))
+            self.assertEqual(srv.packet_loss(), 0)
+            cli.close()
+            srv.close()
+            self.assertEqual([m async for m in srv], [])
+        asyncio.run(run())
+
+    def test_tcp(self):
+        """Test messages are passed both ways over TCP, until the connection is closed"""
+        async def run():
+            srv = await mavasync.mavlink_connection_async("tcpin:127.0.0.1:0")
+            port = srv.server.sockets[0].getsockname()[1]
+            cli = await mavasync.mavlink_connection_async("tcp:127.0.0.1:%u" % port, source_system=7)
+            cli.mav.heartbeat_send(2, 3, 0, 0, 0)
+            await srv.wait_heartbeat(timeout=5)
+            self.assertEqual(srv.target_system, 7)
+            srv.mav.ping_send(1000, 2, 7, 0)
+            m = await cli.recv_match(type='PING', blocking=True, timeout=5)
+            self.assertEqual(m.seq, 2)
+            srv.close()
+            self.assertEqual([m async for m in cli], [])
+            self.assertTrue(cli.portdead)
+        asyncio.run(run())
+
+    def test_many_links(self):
+        """Test one event loop serves many links at once"""
+        async def run():
+            pairs = [await self.udp_pair(source_system=i + 1) for i in range(50)]
+            for (srv, cli) in pairs:
+                cli.mav.heartbeat_send(2, 3, 0, 0, 0)
+            heartbeats = await asyncio.gather(*[srv.wait_heartbeat(timeout=5) for (srv, cli) in pairs])
+            self.assertEqual([m.get_srcSystem() for m in heartbeats], list(range(1, 51)))
+            for (srv, cli) in pairs:
+                srv.close()
+                cli.close()
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
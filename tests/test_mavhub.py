@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+
+"""
+regression tests for waiting on many mavlink connections with mavhub
+"""
+import socket
+import unittest
+
+from pymavlink import mavutil
+
+
+class MAVHubTest(unittest.TestCase):
+
+    """
+    Class to test messages are dispatched and routed between connections
+    """
+
+    def setUp(self):
+        self.hub = mavutil.mavhub()
+        self.links = []
+        self.sockets = []
+
+    def tearDown(self):
+        self.hub.close()
+        for link in self.links:
+            link.close()
+        for sock in self.sockets:
+            sock.close()
+
+    def udp_link(self):
+        """return a UDP server link and a socket sending to it"""
+        link = mavutil.mavudp("127.0.0.1:0", input=True)
+        self.links.append(link)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect(link.port.getsockname())
+        self.sockets.append(sock)
+        return (link, sock)
+
+    def packet(self, msg, srcSystem=1):
+        mav = mavutil.mavlink.MAVLink(None, srcSystem, 1)
+        return msg.pack(mav)
+
+    def poll_until(self, done):
+        for i in range(100):
+            self.hub.poll(0.1)
+            if done():
+                return
+        self.fail("timed out")
+
+    def test_dispatch(self):
+        """Test messages go to the callback of the link they arrived on"""
+        received = []
+        udp = [self.udp_link() for i in range(5)]
+        for i, (link, sock) in enumerate(udp):
+            self.hub.add(link, lambda link, m, i=i: received.append((i, m.get_srcSystem(), m.time_boot_ms)))
+        for i, (link, sock) in enumerate(udp):
+            sock.send(self.packet(mavutil.mavlink.MAVLink_attitude_message(i, 0, 0, 0, 0, 0, 0), srcSystem=i + 1))
+        self.poll_until(lambda: len(received) == 5)
+        self.assertEqual(sorted(received), [(i, i + 1, i) for i in range(5)])
+        # post_message() state is kept for each link
+        self.assertEqual(udp[2][0].sysid_state[3].messages['ATTITUDE'].time_boot_ms, 2)
+
+        # a removed link is no longer read
+        self.hub.remove(udp[0][0])
+        udp[0][1].send(self.packet(mavutil.mavlink.MAVLink_attitude_message(9, 0, 0, 0, 0, 0, 0)))
+        self.hub.poll(0.1)
+        self.assertEqual(len(received), 5)
+
+    def test_route(self):
+        """Test messages are forwarded between links"""
+        (link1, sock1) = self.udp_link()
+        (link2, sock2) = self.udp_link()
+        # link2 learns where to send from the first packet it receives
+        sock2.send(self.packet(mavutil.mavlink.MAVLink_heartbeat_message(6, 8, 0, 0, 0, 3), srcSystem=255))
+        received = []
+        self.hub.add(link1)
+        self.hub.add(link2, lambda link, m: received.append(m))
+        self.hub.add_route(link1, link2)
+        self.poll_until(lambda: len(received) == 1)
+
+        buf = self.packet(mavutil.mavlink.MAVLink_attitude_message(1000, 0, 0, 0, 0, 0, 0))
+        sock1.send(buf)
+        self.poll_until(lambda: 'ATTITUDE' in link1.sysid_state[1].messages)
+        sock2.settimeout(5)
+        self.assertEqual(sock2.recv(1000), buf)
+
+        self.hub.remove_route(link1, link2)
+        self.assertEqual(self.hub.links[link1].routes, [])
+
+    def test_closed_link(self):
+        """Test a TCP link closed by the other end is removed"""
+        link = mavutil.mavtcpin("127.0.0.1:0")
+        self.links.append(link)
+        received = []
+        self.hub.add(link, lambda link, m: received.append(m))
+        sock = socket.create_connection(link.listen.getsockname())
+        self.sockets.append(sock)
+        sock.send(self.packet(mavutil.mavlink.MAVLink_heartbeat_message(6, 8, 0, 0, 0, 3)))
+        self.poll_until(lambda: len(received) == 1)
+        self.assertIsNot(self.hub.links[link].fd, link.listen.fileno())
+        sock.close()
+        self.poll_until(lambda: link not in self.hub.links)
+        self.hub.run(0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+
+"""
+regression tests for streaming telemetry logs with mavlogfile
+"""
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+from pymavlink import mavutil
+
+
+class MAVLogFileTest(unittest.TestCase):
+
+    """
+    Class to test reading a telemetry log ahead in chunks
+    """
+
+    def setUp(self):
+        """write a telemetry log with runs of junk in it"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "test.tlog")
+        random.seed(1)
+        mav = mavutil.mavlink.MAVLink(None, 1, 1)
+        with open(self.filename, 'wb') as f:
+            for i in range(1000):
+                if i % 10 == 0:
+                    msg = mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 0, i, 0, 3)
+                else:
+                    msg = mavutil.mavlink.MAVLink_attitude_message(i, 0, 0, 0, 0, 0, 0)
+                f.write(struct.pack('>Q', 1700000000000000 + i * 20000 + i % 4))
+                f.write(msg.pack(mav, force_mavlink1=(i % 7 == 0)))
+                if i % 100 == 50:
+                    f.write(bytes(random.randrange(256) for j in range(random.randrange(1, 500))))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, log):
+        """return the messages available in a log with their timestamps and links"""
+        ret = []
+        while True:
+            m = log.recv_msg()
+            if m is None:
+                break
+            ret.append((str(m), m._timestamp, m._link))
+        return ret
+
+    def test_read_ahead(self):
+        """Test reading ahead gives the same messages as reading each frame"""
+        log = mavutil.mavlogfile(self.filename)
+        expected = self.read(log)
+        log.close()
+        self.assertTrue(any(m[0].startswith('BAD_DATA') for m in expected))
+        for read_ahead in [1, 7, 100, mavutil.LOG_READ_AHEAD]:
+            log = mavutil.mavlogfile(self.filename, read_ahead=read_ahead)
+            self.assertEqual(self.read(log), expected)
+            log.close()
+
+    def test_corrupt(self):
+        """Test reading ahead gives the same messages and bad data as
+        reading each frame from logs with truncated and damaged frames"""
+        mav = mavutil.mavlink.MAVLink(None, 1, 1)
+        filename = os.path.join(self.tmpdir, "corrupt.tlog")
+        bad_tails = 0
+        for seed in range(40):
+            r = random.Random(seed)
+            with open(filename, 'wb') as f:
+                for i in range(100):
+                    if i % 5 == 0:
+                        msg = mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 0, i, 0, 3)
+                    else:
+                        msg = mavutil.mavlink.MAVLink_attitude_message(i, 0, 0, 0, 0, 0, 0)
+                    rec = struct.pack('>Q', 1700000000000000 + i * 20000) + msg.pack(mav, force_mavlink1=(i % 7 == 0))
+                    k = r.random()
+                    if k < 0.05:
+                        rec = rec[:r.randrange(1, len(rec))]
+                    elif k < 0.1:
+                        rec = bytearray(rec)
+                        rec[r.randrange(len(rec))] = r.randrange(256)
+                    f.write(rec)
+                # junk at the end of the log
+                f.write(bytes(r.randrange(256) for j in range(r.randrange(1, 40))))
+            log = mavutil.mavlogfile(filename)
+            expected = self.read(log)
+            log.close()
+            if expected[-1][0].startswith('BAD_DATA'):
+                bad_tails += 1
+            for read_ahead in [7, mavutil.LOG_READ_AHEAD]:
+                log = mavutil.mavlogfile(filename, read_ahead=read_ahead)
+                self.assertEqual(self.read(log), expected)
+                log.close()
+        self.assertTrue(bad_tails > 0)
+
+    def test_follow(self):
+        """Test following a log while it is written gives the same messages"""
+        log = mavutil.mavlogfile(self.filename)
+        expected = self.read(log)
+        log.close()
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        filename = os.path.join(self.tmpdir, "follow.tlog")
+        got = []
+        with open(filename, 'wb') as f:
+            log = mavutil.mavlogfile(filename, read_ahead=4096, follow=True)
+            pos = 0
+            while pos < len(data):
+                n = random.randrange(1, 60)
+                f.write(data[pos:pos+n])
+                f.flush()
+                pos += n
+                got.extend(self.read(log))
+            log.close()
+        self.assertEqual(got, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+
+"""
+regression tests for reading telemetry logs with mavmmaplog
+"""
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from pymavlink import mavutil
+
+
+class MAVMmapLogTest(unittest.TestCase):
+
+    """
+    Class to test the index and time index of mavmmaplog
+    """
+
+    def setUp(self):
+        """write a telemetry log somewhere we can write sidecar files"""
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "test.tlog")
+        mav = mavutil.mavlink.MAVLink(None, 1, 1)
+        with open(self.filename, 'wb') as f:
+            for i in range(2000):
+                if i % 10 == 0:
+                    msg = mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 0, i // 500, 0, 3)
+                elif i % 10 == 5:
+                    msg = mavutil.mavlink.MAVLink_param_value_message(b"P%u" % (i % 7), i, 9, 7, i % 7)
+                else:
+                    msg = mavutil.mavlink.MAVLink_attitude_message(i, 0, 0, 0, 0, 0, 0)
+                f.write(struct.pack('>Q', 1700000000000000 + i * 20000))
+                f.write(msg.pack(mav))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def dump(self, log):
+        """return all messages in a log as strings with timestamps"""
+        ret = []
+        while True:
+            m = log.recv_msg()
+            if m is None:
+                break
+            ret.append("%.6f %s" % (m._timestamp, m))
+        return ret
+
+    def test_index_cache(self):
+        """Test a cached index gives the same results as a full scan"""
+        log = mavutil.mavmmaplog(self.filename, cache_index=True)
+        self.assertTrue(os.path.exists(self.filename + ".pmidx"))
+        expected_messages = sorted(log.messages.keys())
+        expected_counts = dict(log.counts)
+        expected_time_index = log._time_index()
+        expected = self.dump(log)
+
+        log2 = mavutil.mavmmaplog(self.filename, cache_index=True)
+        self.assertTrue(log2.load_index())
+        self.assertEqual(sorted(log2.messages.keys()), expected_messages)
+        self.assertEqual(log2.counts, expected_counts)
+        self.assertEqual(log2.name_to_id, log.name_to_id)
+        self.assertEqual(log2._time_index(), expected_time_index)
+        self.assertEqual(self.dump(log2), expected)
+        log.close()
+        log2.close()
+
+    def test_index_cache_invalidated(self):
+        """Test a cached index is not used for a modified log"""
+        mavutil.mavmmaplog(self.filename, cache_index=True).close()
+        with open(self.filename, 'ab') as f:
+            f.write(b'\0' * 16)
+        log = mavutil.mavmmaplog(self.filename)
+        self.assertFalse(log.load_index())
+        log.close()
+
+    def test_index_cache_mavlink2(self):
+        """Test the cached index of a MAVLink2 log is used when the log
+        is opened with the MAVLink1 dialect"""
+        from pymavlink.dialects.v20 import ardupilotmega as mavlink2
+        mav = mavlink2.MAVLink(None, 1, 1)
+        with open(self.filename, 'wb') as f:
+            for i in range(300):
+                f.write(struct.pack('>Q', 1700000000000000 + i * 20000))
+                f.write(mavlink2.MAVLink_button_change_message(i, i, i % 256).pack(mav))
+        sidecar = self.filename + ".pmidx"
+        mavlink20 = os.environ.pop('MAVLINK20', None)
+        try:
+            for i in range(2):
+                os.environ.pop('MAVLINK20', None)
+                mavutil.set_dialect(mavutil.current_dialect)
+                log = mavutil.mavmmaplog(self.filename, cache_index=True)
+                self.assertEqual(log.counts, {mavlink2.MAVLINK_MSG_ID_BUTTON_CHANGE: 300})
+                log.close()
+                if i == 0:
+                    # the second open must not write the index again
+                    os.utime(sidecar, ns=(0, 0))
+            self.assertEqual(os.stat(sidecar).st_mtime_ns, 0)
+        finally:
+            if mavlink20 is not None:
+                os.environ['MAVLINK20'] = mavlink20
+            mavutil.set_dialect(mavutil.current_dialect)
+
+    def test_seek_time(self):
+        """Test seeking and time windows match a read from the start"""
+        log = mavutil.mavmmaplog(self.filename)
+        messages = []
+        while True:
+            m = log.recv_msg()
+            if m is None:
+                break
+            messages.append((m._timestamp, str(m)))
+        (start, end) = (messages[0][0], messages[-1][0])
+        for i in range(11):
+            t = start + (end - start) * i / 10.0 + 0.001
+            expected = [x for x in messages if x[0] >= t]
+            log.seek_time(t)
+            m = log.recv_match(type=['ATTITUDE', 'HEARTBEAT', 'PARAM_VALUE'])
+            if len(expected) == 0:
+                self.assertIsNone(m)
+            else:
+                self.assertEqual((m._timestamp, str(m)), expected[0])
+        # the latest heartbeat before the seek is loaded
+        log.seek_time(start + (end - start) * 0.9)
+        self.assertEqual(log.messages['HEARTBEAT'].custom_mode, 3)
+
+        (t0, t1) = (start + (end - start) * 0.4, start + (end - start) * 0.6)
+        expected = [x for x in messages
+                    if x[1].startswith('ATTITUDE ') and t0 <= x[0] <= t1]
+        self.assertTrue(len(expected) > 0)
+        log.rewind()
+        got = []
+        while True:
+            m = log.recv_match(type='ATTITUDE', start_time=t0, end_time=t1)
+            if m is None:
+                break
+            got.append((m._timestamp, str(m)))
+        self.assertEqual(got, expected)
+        log.close()
+
+    def test_time_window_other_types(self):
+        """Test a late timestamp on a message of another type doesn't
+        end a time window"""
+        mav = mavutil.mavlink.MAVLink(None, 1, 1)
+        with open(self.filename, 'wb') as f:
+            for i in range(200):
+                t = 1700000000000000 + i * 20000
+                if i % 10 == 0:
+                    msg = mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3)
+                    if i == 100:
+                        # a day out
+                        t += 86400 * 1000000
+                else:
+                    msg = mavutil.mavlink.MAVLink_attitude_message(i, 0, 0, 0, 0, 0, 0)
+                f.write(struct.pack('>Q', t))
+                f.write(msg.pack(mav))
+        log = mavutil.mavmmaplog(self.filename)
+        (t0, t1) = (1700000000.5, 1700000003.5)
+        got = []
+        while True:
+            m = log.recv_match(type='ATTITUDE', start_time=t0, end_time=t1)
+            if m is None:
+                break
+            got.append(m.time_boot_ms)
+        self.assertEqual(got, [i for i in range(25, 176) if i % 10 != 0])
+        log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
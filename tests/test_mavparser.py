@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+
+
+"""
+regression tests for MAVLink parsing in the generated dialects
+"""
+import hashlib
+import importlib.util
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from pymavlink import mavparser
+from pymavlink.generator import mavgen
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+
+
+class MAVParserTest(unittest.TestCase):
+
+    """
+    Class to test the compiled parser gives the same results as the Python one
+    """
+
+    secret_key = bytes(range(32))
+
+    def make_stream(self):
+        """return a stream of packets, some of them signed, MAVLink1 or bad"""
+        mav = mavlink.MAVLink(None, 1, 1)
+        msgs = [
+            mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3),
+            mavlink.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0, 0, 0),
+            mavlink.MAVLink_statustext_message(3, b"hello"),
+            mavlink.MAVLink_param_value_message(b"PARAM", 1.5, 9, 100, 3),
+        ]
+        stream = bytearray()
+        for i in range(200):
+            mav.signing.secret_key = self.secret_key if i % 5 == 0 else None
+            mav.signing.sign_outgoing = i % 5 == 0
+            buf = bytearray(msgs[i % len(msgs)].pack(mav, force_mavlink1=(i % 7 == 0)))
+            if i % 11 == 0:
+                # bad CRC
+                buf[-3] ^= 0xFF
+            elif i % 13 == 0:
+                # unknown message ID
+                buf[7] = 0x77
+            elif i % 17 == 0:
+                buf = bytearray(b"\x01\x02\x03")
+            stream += buf
+        return bytes(stream)
+
+    def parse(self, stream, fast, robust, signing):
+        """parse stream in small chunks, returning what was received"""
+        mav = mavlink.MAVLink(None)
+        mav.use_fast_parser = fast
+        mav.robust_parsing = robust
+        if signing:
+            mav.signing.secret_key = self.secret_key
+            mav.signing.allow_unsigned_callback = lambda mav, msgId: msgId != 0
+        ret = []
+        for ofs in range(0, len(stream), 7):
+            try:
+                msgs = mav.parse_buffer(stream[ofs:ofs+7])
+            except mavlink.MAVError as e:
+                ret.append(str(e))
+                continue
+            for m in msgs or []:
+                ret.append((str(m), bytes(m.get_msgbuf()), m.get_signed()))
+        ret.append((mav.total_packets_received, mav.total_receive_errors,
+                    mav.signing.goodsig_count, mav.signing.reject_count))
+        return ret
+
+    @unittest.skipIf(not mavparser.available, "mavparser not available")
+    def test_parse_same(self):
+        """Test both parsers receive the same messages and errors"""
+        stream = self.make_stream()
+        for robust in [False, True]:
+            for signing in [False, True]:
+                expected = self.parse(stream, False, robust, signing)
+                self.assertEqual(self.parse(stream, True, robust, signing), expected)
+
+    def test_parse_many(self):
+        """Test parsing a whole buffer at once matches parse_char"""
+        stream = self.make_stream()
+        for fast in [False, True]:
+            if fast and not mavparser.available:
+                continue
+            for robust in [False, True]:
+                mav = mavlink.MAVLink(None)
+                mav.use_fast_parser = fast
+                mav.robust_parsing = robust
+                # bad data is grouped by how it arrives, so robust parsing
+                # is compared with the same chunks
+                chunk = 100 if robust else 1
+                expected = []
+                for ofs in range(0, len(stream), chunk):
+                    try:
+                        msgs = mav.parse_buffer(stream[ofs:ofs+chunk])
+                    except mavlink.MAVError:
+                        continue
+                    expected.extend([str(m) for m in msgs or []])
+
+                for parse in ["parse_many", "parse_iter"]:
+                    mav2 = mavlink.MAVLink(None)
+                    mav2.use_fast_parser = fast
+                    mav2.robust_parsing = robust
+                    called = []
+                    mav2.set_callback(lambda m: called.append(str(m)))
+                    got = []
+                    for ofs in range(0, len(stream), 100):
+                        got.extend([str(m) for m in getattr(mav2, parse)(stream[ofs:ofs+100])])
+                    self.assertEqual(got, expected)
+                    self.assertEqual(called, expected)
+                    self.assertEqual(mav2.total_packets_received, mav.total_packets_received)
+                    self.assertEqual(mav2.buf_len(), 0)
+                    if robust:
+                        self.assertEqual(mav2.total_receive_errors, mav.total_receive_errors)
+
+    def test_buffer_bounded(self):
+        """Test the receive buffer doesn't grow when it always holds a partial frame"""
+        mav = mavlink.MAVLink(None, 1, 1)
+        buf = mavlink.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0, 0, 0).pack(mav)
+        stream = buf * 1000
+        for fast in [False, True]:
+            if fast and not mavparser.available:
+                continue
+            mav = mavlink.MAVLink(None)
+            mav.use_fast_parser = fast
+            half = len(buf) // 2
+            self.assertIsNone(mav.parse_char(stream[:half]))
+            for ofs in range(half, len(stream) - len(buf), len(buf)):
+                m = mav.parse_char(stream[ofs:ofs+len(buf)])
+                self.assertEqual(m.get_type(), "ATTITUDE")
+                self.assertEqual(mav.buf_len(), half)
+                self.assertTrue(len(mav.buf) < 2 * len(buf))
+
+    def test_lazy_decode(self):
+        """Test lazily decoded messages match eagerly decoded ones"""
+        stream = self.make_stream()
+        for fast in [False, True]:
+            if fast and not mavparser.available:
+                continue
+            mav = mavlink.MAVLink(None)
+            mav.use_fast_parser = fast
+            mav.robust_parsing = True
+            expected = mav.parse_buffer(stream)
+            mav2 = mavlink.MAVLink(None)
+            mav2.use_fast_parser = fast
+            mav2.robust_parsing = True
+            mav2.lazy_decode = True
+            got = mav2.parse_buffer(stream)
+            self.assertEqual(len(got), len(expected))
+            for (m, m2) in zip(expected, got):
+                self.assertEqual(m2.get_type(), m.get_type())
+                self.assertEqual(m2.get_seq(), m.get_seq())
+                if m.get_type() != 'BAD_DATA':
+                    self.assertIn('_lazy_payload', m2.__dict__)
+                self.assertEqual(m2.to_dict(), m.to_dict())
+                self.assertEqual(str(m2), str(m))
+                self.assertEqual(m2.get_msgbuf(), m.get_msgbuf())
+                self.assertEqual(m2.get_signed(), m.get_signed())
+                self.assertNotIn('_lazy_payload', m2.__dict__)
+
+        # fields set before the payload is unpacked are kept
+        mav = mavlink.MAVLink(None, 1, 1)
+        buf = mavlink.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0, 0, 0).pack(mav)
+        mav.lazy_decode = True
+        m = mav.parse_char(buf)
+        m.time_boot_ms = 2000
+        self.assertAlmostEqual(m.roll, 0.1, places=6)
+        self.assertEqual(m.time_boot_ms, 2000)
+        with self.assertRaises(AttributeError):
+            m.no_such_field
+
+        # fields named like a class attribute, such as id
+        mav = mavlink.MAVLink(None, 1, 1)
+        msgs = [
+            mavlink.MAVLink_battery_status_message(3, 0, 0, 20, [0] * 10, 0, 0, 0, 50),
+            mavlink.MAVLink_distance_sensor_message(1000, 10, 400, 100, 0, 4, 25, 0),
+            mavlink.MAVLink_collision_message(0, 5, 0, 0, 1.5, 2.5, 3.5),
+            mavlink.MAVLink_log_entry_message(6, 7, 8, 9, 10),
+            mavlink.MAVLink_log_request_data_message(1, 1, 7, 0, 90),
+            mavlink.MAVLink_log_data_message(8, 0, 90, [1] * 90),
+            mavlink.MAVLink_named_value_float_message(1000, b"NAME", 1.5),
+        ]
+        for msg in msgs:
+            buf = msg.pack(mav)
+            expected = mavlink.MAVLink(None).parse_char(buf)
+            mav2 = mavlink.MAVLink(None)
+            mav2.lazy_decode = True
+            m = mav2.parse_char(buf)
+            for field in m.get_fieldnames():
+                self.assertEqual(getattr(m, field), getattr(expected, field))
+            self.assertEqual(m.to_dict(), expected.to_dict())
+        self.assertEqual(m.name, "NAME")
+
+    def test_msgid_filter(self):
+        """Test filtered frames are counted but not decoded"""
+        stream = self.make_stream()
+        wanted = set([mavlink.MAVLINK_MSG_ID_ATTITUDE, mavlink.MAVLINK_MSG_ID_STATUSTEXT])
+        for fast in [False, True]:
+            if fast and not mavparser.available:
+                continue
+            mav = mavlink.MAVLink(None)
+            mav.use_fast_parser = fast
+            mav.robust_parsing = True
+            expected = [str(m) for m in mav.parse_buffer(stream)
+                        if m.get_msgId() in wanted or m.get_type() == 'BAD_DATA']
+            dropped = mav.total_packets_received - len(expected)
+
+            for parse in ["parse_buffer", "parse_many"]:
+                mav2 = mavlink.MAVLink(None)
+                mav2.use_fast_parser = fast
+                mav2.robust_parsing = True
+                mav2.set_msgid_filter(wanted)
+                filtered = []
+                mav2.filtered_callback = lambda *args: filtered.append(args)
+                got = [str(m) for m in getattr(mav2, parse)(stream)]
+                self.assertEqual(got, expected)
+                self.assertEqual(mav2.total_packets_filtered, dropped)
+                self.assertEqual(len(filtered), dropped)
+                self.assertEqual(mav2.total_receive_errors, mav.total_receive_errors)
+
+    def test_mavfile_msgid_filter(self):
+        """Test a filtered log gives the wanted messages and packet loss"""
+        from pymavlink import mavutil
+        mav = mavlink.MAVLink(None, 1, 1)
+        msgs = [
+            mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3),
+            mavlink.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0, 0, 0),
+            mavlink.MAVLink_param_value_message(b"PARAM", 1.5, 9, 100, 3),
+        ]
+        with tempfile.NamedTemporaryFile(suffix=".tlog", delete=False) as f:
+            filename = f.name
+            for i in range(100):
+                buf = msgs[i % len(msgs)].pack(mav)
+                if i % 10 != 5:
+                    # every tenth packet is lost
+                    f.write(struct.pack('>Q', i * 1000) + buf)
+        try:
+            expected = []
+            for msgid_filter in [None, [mavlink.MAVLINK_MSG_ID_ATTITUDE]]:
+                mlog = mavutil.mavlogfile(filename)
+                mlog.set_msgid_filter(msgid_filter)
+                got = []
+                while True:
+                    m = mlog.recv_match(type='ATTITUDE')
+                    if m is None:
+                        break
+                    got.append((m._timestamp, str(m)))
+                mlog.close()
+                if msgid_filter is None:
+                    expected = got
+                    loss = (mlog.mav_count, mlog.mav_loss)
+                    self.assertEqual(len(expected), 30)
+                else:
+                    self.assertEqual(got, expected)
+                    self.assertEqual((mlog.mav_count, mlog.mav_loss), loss)
+        finally:
+            os.unlink(filename)
+
+    def generate(self, tmpdir, slots):
+        """generate and import a dialect from the common message definitions"""
+        xml = os.path.join(os.path.dirname(__file__), "snapshottests", "resources", "common.xml")
+        name = "common_slots" if slots else "common_dict"
+        output = os.path.join(tmpdir, name + ".py")
+        opts = mavgen.Opts(output, wire_protocol="2.0", language="Python3", validate=False, python_slots=slots)
+        self.assertTrue(mavgen.mavgen(opts, [xml]))
+        spec = importlib.util.spec_from_file_location(name, output)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def test_slots(self):
+        """Test messages with __slots__ pack and parse as the default ones do"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            dialects = [self.generate(tmpdir, False), self.generate(tmpdir, True)]
+        finally:
+            shutil.rmtree(tmpdir)
+        results = []
+        for dialect in dialects:
+            mav = dialect.MAVLink(None, 1, 1)
+            msgs = [
+                dialect.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3),
+                dialect.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0, 0, 0),
+                dialect.MAVLink_param_value_message(b"PARAM", 1.5, 9, 100, 3),
+                dialect.MAVLink_log_entry_message(1, 2, 3, 4, 5),
+                dialect.MAVLink_gps_raw_int_message(1, 3, 0, 0, 0, 0, 0, 0, 0, 0),
+                # fields kept in __dict__
+                dialect.MAVLink_debug_vect_message(b"VECT", 1000, 1.5, 2.5, 3.5),
+                dialect.MAVLink_named_value_float_message(1000, b"FLOAT", 1.5),
+                dialect.MAVLink_named_value_int_message(1000, b"INT", 2),
+            ]
+            stream = b""
+            for (i, m) in enumerate(msgs * 4):
+                mav.signing.secret_key = self.secret_key if i % 3 == 0 else None
+                mav.signing.sign_outgoing = i % 3 == 0
+                stream += m.pack(mav, force_mavlink1=(i % 4 == 1))
+            got = [stream]
+            eager_msgids = dialect._eager_decode_msgids
+            # the last pass leaves every message packed, so _unpack_lazy()
+            # fills in the fields of the messages above kept in __dict__
+            for (lazy, eager) in [(False, eager_msgids), (True, eager_msgids), (True, frozenset())]:
+                dialect._eager_decode_msgids = eager
+                mav = dialect.MAVLink(None)
+                mav.lazy_decode = lazy
+                for m in mav.parse_buffer(stream):
+                    m._timestamp = 1.5
+                    if m.get_type() in ["DEBUG_VECT", "NAMED_VALUE_FLOAT", "NAMED_VALUE_INT"]:
+                        got.append(m.name)
+                    got.append((m.to_dict(), str(m), m.get_seq(), m.get_signed(), m._timestamp, m.pack(mav)))
+            dialect._eager_decode_msgids = eager_msgids
+            results.append(got)
+        self.assertEqual(results[1], results[0])
+
+        m = dialects[1].MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0, 0, 0)
+        self.assertFalse(hasattr(m, "__dict__"))
+        with self.assertRaises(AttributeError):
+            m.no_such_field = 1
+
+    def test_check_signatures(self):
+        """Test signatures are checked with the cached key hash, one at a time or in a batch"""
+        mav = mavlink.MAVLink(None, 1, 1)
+        mav.signing.secret_key = self.secret_key
+        mav.signing.sign_outgoing = True
+        frames = [bytearray(mavlink.MAVLink_attitude_message(i, 0, 0, 0, 0, 0, 0).pack(mav)) for i in range(5)]
+        h = hashlib.sha256()
+        h.update(self.secret_key)
+        h.update(frames[0][:-6])
+        self.assertEqual(h.digest()[:6], frames[0][-6:])
+
+        frames[3][-1] ^= 0xFF
+        mav2 = mavlink.MAVLink(None)
+        mav2.signing.secret_key = self.secret_key
+        self.assertEqual(mav2.check_signatures(frames), [True, True, True, False, True])
+        # replayed frames have old timestamps
+        self.assertEqual(mav2.check_signatures(frames[4:]), [False])
+
+        # changing the key drops the cached hash
+        mav3 = mavlink.MAVLink(None)
+        mav3.signing.secret_key = self.secret_key
+        self.assertTrue(mav3.check_signature(frames[0], 1, 1))
+        mav3.signing.secret_key = bytes(32)
+        self.assertFalse(mav3.check_signature(frames[1], 1, 1))
+
+    def test_array_fields(self):
+        """Test messages with arrays and strings unpack into the right fields"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            dialect = self.generate(tmpdir, False)
+        finally:
+            shutil.rmtree(tmpdir)
+        mav = dialect.MAVLink(None, 1, 1)
+        distances = list(range(100, 172))
+        msgs = [
+            dialect.MAVLink_obstacle_distance_message(1000, 0, distances, 5, 20, 4000, 1.5, 2.5, 12),
+            dialect.MAVLink_gps_rtcm_data_message(3, 4, list(range(1, 5)) + [0] * 176),
+            dialect.MAVLink_param_set_message(1, 1, b"PARAM", 2.5, 9),
+        ]
+        for m in msgs:
+            m2 = dialect.MAVLink(None).parse_char(m.pack(mav))
+            for field in m.get_fieldnames():
+                self.assertEqual(getattr(m2, field), getattr(m, field))
+        self.assertEqual(msgs[0].get_type(), "OBSTACLE_DISTANCE")
+
+    @unittest.skipIf(not mavparser.available, "mavparser not available")
+    def test_parse_frame(self):
+        """Test framing of a single packet"""
+        mav = mavlink.MAVLink(None, 1, 1)
+        buf = mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3).pack(mav)
+        self.assertEqual(mavparser.parse_frame(buf[:2], 0, mavlink.mavlink_crc_extras), 12)
+        self.assertEqual(mavparser.parse_frame(buf[:5], 0, mavlink.mavlink_crc_extras), len(buf))
+        self.assertIsNone(mavparser.parse_frame(b"\x00" + buf, 0, mavlink.mavlink_crc_extras))
+        (frame_len, msgid, header, payload, crc, crc_ok) = mavparser.parse_frame(
+            b"\x00" + buf, 1, mavlink.mavlink_crc_extras)
+        self.assertEqual(frame_len, len(buf))
+        self.assertEqual(msgid, mavlink.MAVLINK_MSG_ID_HEARTBEAT)
+        self.assertEqual(header[4:], (0, 1, 1))
+        self.assertEqual(bytes(payload), buf[10:-2])
+        self.assertTrue(crc_ok)
+        self.assertIsNone(mavparser.parse_frame(buf, 0, {})[5])
+
+    @unittest.skipIf(not mavparser.available, "mavparser not available")
+    def test_tlog_index(self):
+        """Test the compiled tlog indexer gives the same tables as the Python loop"""
+        from pymavlink import mavutil
+        mav = mavutil.mavlink.MAVLink(None, 1, 1)
+        msgs = [
+            mavutil.mavlink.MAVLink_heartbeat_message(2, 3, 0, 0, 0, 3),
+            mavutil.mavlink.MAVLink_attitude_message(1000, 0.1, 0.2, 0.3, 0, 0, 0),
+            mavutil.mavlink.MAVLink_battery_status_message(1, 0, 0, 20, [0] * 10, 0, 0, 0, 50),
+            mavutil.mavlink.MAVLink_param_value_message(b"PARAM", 1.5, 9, 100, 3),
+        ]
+        tmp = tempfile.NamedTemporaryFile(suffix='.tlog', delete=False)
+        for i in range(500):
+            mav.signing.secret_key = self.secret_key if i % 5 == 0 else None
+            mav.signing.sign_outgoing = i % 5 == 0
+            tmp.write(struct.pack('>Q', i * 1000))
+            tmp.write(msgs[i % len(msgs)].pack(mav, force_mavlink1=(i % 7 == 0)))
+            if i % 37 == 0:
+                # junk between frames
+                tmp.write(b"\x01\x02\x03")
+        # a frame cut off by the end of the log
+        tmp.write(struct.pack('>Q', 0) + msgs[1].pack(mav)[:8])
+        tmp.close()
+
+        def index(fast):
+            os.environ['PYMAVLINK_FAST_INDEX'] = '1' if fast else '0'
+            try:
+                log = mavutil.mavmmaplog(tmp.name)
+            finally:
+                del os.environ['PYMAVLINK_FAST_INDEX']
+            ret = ({k: list(v) for k, v in log.offsets.items()}, log.counts, log._count,
+                   log.name_to_id, log.instance_offsets, log.instance_lengths, log.sysid,
+                   sorted(log.messages.keys()))
+            count = 0
+            while log.recv_match(type='ATTITUDE') is not None:
+                count += 1
+            log.close()
+            return ret + (count,)
+
+        try:
+            python = index(False)
+            self.assertEqual(python[-1], 125)
+            self.assertEqual(index(True), python)
+        finally:
+            os.unlink(tmp.name)
+
+    def test_tlog_index_mavlink2(self):
+        """Test a MAVLink2 log is indexed with the MAVLink2 dialect when
+        opened with the MAVLink1 one"""
+        from pymavlink import mavutil
+        mav = mavlink.MAVLink(None, 1, 1)
+        tmp = tempfile.NamedTemporaryFile(suffix='.tlog', delete=False)
+        for i in range(300):
+            tmp.write(struct.pack('>Q', i * 1000))
+            tmp.write(mavlink.MAVLink_button_change_message(i, i, i % 256).pack(mav))
+        tmp.close()
+        mavlink20 = os.environ.pop('MAVLINK20', None)
+        try:
+            for fast in [False, True]:
+                if fast and not mavparser.available:
+                    continue
+                os.environ.pop('MAVLINK20', None)
+                mavutil.set_dialect(mavutil.current_dialect)
+                self.assertEqual(mavutil.mavlink.WIRE_PROTOCOL_VERSION, "1.0")
+                os.environ['PYMAVLINK_FAST_INDEX'] = '1' if fast else '0'
+                try:
+                    log = mavutil.mavlink_connection(tmp.name)
+                finally:
+                    del os.environ['PYMAVLINK_FAST_INDEX']
+                self.assertEqual(log.counts, {mavlink.MAVLINK_MSG_ID_BUTTON_CHANGE: 300})
+                count = 0
+                while log.recv_match(type='BUTTON_CHANGE') is not None:
+                    count += 1
+                log.close()
+                self.assertEqual(count, 300)
+        finally:
+            if mavlink20 is not None:
+                os.environ['MAVLINK20'] = mavlink20
+            mavutil.set_dialect(mavutil.current_dialect)
+            os.unlink(tmp.name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,12 +30,13 @@ parser.add_argument("--condition", default=None, help="select packets by conditi
 parser.add_argument("-q", "--quiet", action='store_true', help="don't display packets")
 parser.add_argument("-o", "--output", default=None, help="output matching packets to give file")
 parser.add_argument("-p", "--parms", action='store_true', help="preserve parameters in output with -o")
-parser.add_argument("--format", default=None, help="Change the output format between 'standard', 'json', 'csv' and 'mat'. For the CSV output, you must supply types that you want. For MAT output, specify output file with --mat_file")
+parser.add_argument("--format", default=None, help="Change the output format between 'standard', 'json', 'csv', 'mat' and the columnar formats 'parquet', 'arrow', 'npz' and 'columnar' (parquet if pyarrow is available, otherwise npz). For the CSV output, you must supply types that you want. For MAT output, specify output file with --mat_file. For columnar output, specify output directory with --columnar_dir")
 parser.add_argument("--csv_sep", dest="csv_sep", default=",", help="Select the delimiter between columns for the output CSV file. Use 'tab' to specify tabs. Only applies when --format=csv")
 parser.add_argument("--types", default=None, help="types of messages (comma separated with wildcard)")
 parser.add_argument("--nottypes", default=None, help="types of messages not to include (comma separated with wildcard)")
 parser.add_argument("--mat_file", dest="mat_file", help="Output file path for MATLAB file output. Only applies when --format=mat")
-parser.add_argument("-c", "--compress", action='store_true', help="Compress .mat file data")
+parser.add_argument("--columnar_dir", dest="columnar_dir", help="Output directory for columnar output, one file per message type. Only applies when --format is a columnar format")
+parser.add_argument("-c", "--compress", action='store_true', help="Compress .mat and .npz file data")
 parser.add_argument("--dialect", default="ardupilotmega", help="MAVLink dialect")
 parser.add_argument("--zero-time-base", action='store_true', help="use Z time base for DF logs")
 parser.add_argument("--no-bad-data", action='store_true', help="Don't output corrupted messages")
@@ -62,6 +63,7 @@ if not args.mav10:
 import inspect
 
 from pymavlink import mavutil
+from pymavlink import logcolumns
 
 
 if args.profile:
@@ -77,12 +79,31 @@ if args.format == 'mat':
     import scipy.io
     import numpy as np
 
+columns = None
+if args.format in logcolumns.FORMATS:
+    if args.columnar_dir is None:
+        print("columnar_dir argument must be specified when a columnar format is selected")
+        sys.exit(1)
+    try:
+        columns = logcolumns.ColumnWriter(args.columnar_dir, format=args.format,
+                                          show_source=args.show_source,
+                                          compress=args.compress)
+    except ImportError as ex:
+        print("Unable to write %s format: %s" % (args.format, str(ex)))
+        sys.exit(1)
+
 filename = args.log
+# a log being followed is streamed rather than indexed when it is opened
+read_ahead = 0
+if args.follow:
+    read_ahead = mavutil.LOG_READ_AHEAD
 mlog = mavutil.mavlink_connection(filename, planner_format=args.planner,
                                   notimestamps=args.notimestamps,
                                   robust_parsing=args.robust,
                                   dialect=args.dialect,
-                                  zero_time_base=args.zero_time_base)
+                                  zero_time_base=args.zero_time_base,
+                                  read_ahead=read_ahead,
+                                  follow=args.follow)
 
 output = None
 if args.output:
@@ -351,6 +372,10 @@ while True:
                     MAT[m_type][col].append(md[col])
                 else:
                     MAT[m_type][col] = [md[col]]
+    # Columnar formats write each message type as typed columns to a
+    # file in the --columnar_dir directory, a batch at a time
+    elif columns is not None:
+        columns.add(m, timestamp)
     elif args.show_types:
         # do nothing
         pass
@@ -379,6 +404,10 @@ while True:
 if args.format == 'mat':
     scipy.io.savemat(args.mat_file, MAT, do_compression=args.compress)
 
+# Finish the columnar files
+if columns is not None:
+    columns.close()
+
 if args.show_types:
     for msgType in available_types:
         print(msgType)
@@ -10,28 +10,21 @@ parser.add_argument("--planner", action='store_true', help="use planner file for
 parser.add_argument("--robust", action='store_true', help="Enable robust parsing (skip over bad data)")
 parser.add_argument("--condition", default=None, help="condition for packets")
 parser.add_argument("--dialect", default="ardupilotmega", help="MAVLink dialect")
+parser.add_argument("--jobs", type=int, default=None, help="number of processes to split each log across")
 parser.add_argument("logs", metavar="LOG", nargs="+")
 
-args = parser.parse_args()
-
 from pymavlink import mavutil
+from pymavlink import logshard
 
 
-def mavloss(logfile):
-    '''work out signal loss times for a log file'''
-    print("Processing log %s" % filename)
-    mlog = mavutil.mavlink_connection(filename,
-                                      planner_format=args.planner,
-                                      notimestamps=args.notimestamps,
-                                      dialect=args.dialect,
-                                      robust_parsing=args.robust)
-
+def mavloss_shard(mlog, condition):
+    '''count packets, losses and the reasons for them in part of a log'''
     # Track the reasons for MAVLink parsing errors and print them all out at the end.
     reason_ids = set()
     reasons = []
 
     while True:
-        m = mlog.recv_match(condition=args.condition)
+        m = mlog.recv_match(condition=condition)
 
         # Stop parsing the file once we've reached the end
         if m is None:
@@ -42,11 +35,45 @@ def mavloss(logfile):
             reason_id = ''.join(m.reason.split(' ')[0:3])
             if reason_id not in reason_ids:
                 reason_ids.add(reason_id)
-                reasons.append(m.reason)
+                reasons.append((reason_id, m.reason))
+
+    return (mlog.mav_count, mlog.mav_loss, mlog.first_seq, mlog.last_seq, reasons)
+
+
+def mavloss(filename, args):
+    '''work out signal loss times for a log file'''
+    print("Processing log %s" % filename)
+    results = logshard.map_log(filename, mavloss_shard, (args.condition,),
+                               jobs=args.jobs,
+                               planner_format=args.planner,
+                               notimestamps=args.notimestamps,
+                               dialect=args.dialect,
+                               robust_parsing=args.robust)
+
+    # join up the shards, counting the packets lost between them
+    mav_count = 0
+    mav_loss = 0
+    last_seq = {}
+    reason_ids = set()
+    reasons = []
+    for (count, loss, first, last, shard_reasons) in results:
+        mav_count += count
+        mav_loss += loss
+        for (src, seq) in first.items():
+            if src in last_seq:
+                mav_loss += (seq - last_seq[src] - 1) % 256
+        last_seq.update(last)
+        for (reason_id, reason) in shard_reasons:
+            if reason_id not in reason_ids:
+                reason_ids.add(reason_id)
+                reasons.append(reason)
 
     # Print out the final packet loss results
+    packet_loss = 0
+    if mav_count != 0:
+        packet_loss = (100.0*mav_loss)/(mav_count+mav_loss)
     print("%u packets, %u lost %.1f%%" % (
-            mlog.mav_count, mlog.mav_loss, mlog.packet_loss()))
+            mav_count, mav_loss, packet_loss))
 
     # Also print out the reasons why losses occurred
     if len(reasons) > 0:
@@ -54,5 +81,8 @@ def mavloss(logfile):
         for r in reasons:
             print("  * " + r)
 
-for filename in args.logs:
-    mavloss(filename)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for filename in args.logs:
+        mavloss(filename, args)
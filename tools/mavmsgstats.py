@@ -9,13 +9,13 @@ import fnmatch
 
 from argparse import ArgumentParser
 parser = ArgumentParser(description=__doc__)
+parser.add_argument("--jobs", type=int, default=None, help="number of processes to split each telemetry log across")
 parser.add_argument("logs", metavar="LOG", nargs="+")
 
-args = parser.parse_args()
-
 os.environ['MAVLINK20'] = '1'
 
 from pymavlink import mavutil
+from pymavlink import logshard
 
 categories = {
     'EKF2' : ['NK*'],
@@ -30,10 +30,29 @@ categories = {
                  'R??H', 'R??I', 'R??J'],
 }
 
-def show_stats(logfile):
+def count_messages(mlog):
+    '''count the messages of each type in part of a telemetry log,
+    returning the counts, the size of each type and the types in the
+    order they were first seen'''
+    sizes = {}
+    counts = {}
+    names = []
+    while True:
+        m = mlog.recv_match()
+        if m is None:
+            break
+        t = m.get_type()
+        if t not in counts:
+            sizes[t] = m._header.mlen
+            counts[t] = 0
+            names.append(t)
+        counts[t] += 1
+    return (counts, sizes, names)
+
+
+def show_stats(filename, jobs=None):
     '''show stats on a file'''
     print("Processing log %s" % filename)
-    mlog = mavutil.mavlink_connection(filename)
 
     sizes = {}
     total_size = 0
@@ -42,16 +61,13 @@ def show_stats(logfile):
     if filename.endswith("tlog"):
         counts = {}
         names = []
-        while True:
-            m = mlog.recv_match()
-            if m is None:
-                break
-            t = m.get_type()
-            if t not in counts:
-                sizes[t] = m._header.mlen
-                counts[t] = 0
-                names.append(t)
-            counts[t] += 1
+        for (shard_counts, shard_sizes, shard_names) in logshard.map_log(filename, count_messages, jobs=jobs):
+            for t in shard_names:
+                if t not in counts:
+                    sizes[t] = shard_sizes[t]
+                    counts[t] = 0
+                    names.append(t)
+                counts[t] += shard_counts[t]
         for (name, size) in sizes.items():
             size_for_this_message = size * counts[name]
             pairs.append((name, size_for_this_message))
@@ -59,6 +75,7 @@ def show_stats(logfile):
 
     else:
 
+        mlog = mavutil.mavlink_connection(filename)
         names = mlog.name_to_id.keys()
 
         for name in names:
@@ -93,5 +110,8 @@ def show_stats(logfile):
             print("@%s %.2f%%" % (c, 100.0 * total / total_size))
     print("@OTHER %.2f%%" % (100.0 * (total_size-category_total) / total_size))
 
-for filename in args.logs:
-    show_stats(filename)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for filename in args.logs:
+        show_stats(filename, jobs=args.jobs)
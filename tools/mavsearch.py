@@ -4,6 +4,7 @@
 search a set of log files for a condition
 '''
 from pymavlink import mavutil
+from pymavlink import logshard
 
 from argparse import ArgumentParser
 parser = ArgumentParser(description=__doc__)
@@ -11,28 +12,44 @@ parser.add_argument("--condition", default=None, help="conditional check on log"
 parser.add_argument("--types", default=None, help="message types to look for (comma separated)")
 parser.add_argument("--stop", action='store_true', help="stop when message type found")
 parser.add_argument("--stopcondition", action='store_true', help="stop when condition met")
+parser.add_argument("--jobs", type=int, default=None, help="number of processes to split each log across")
 parser.add_argument("logs", metavar="LOG", nargs="+")
 
-args = parser.parse_args()
 
-def mavsearch(filename):
+def mavsearch_shard(mlog, types, condition, stop, stopcondition):
+    '''search part of a log, returning the matching messages as strings
+    and whether the search stopped'''
+    found = []
+    while True:
+        m = mlog.recv_match(type=types)
+        if m is None:
+            break
+        if mlog.check_condition(condition):
+            found.append(str(m))
+            if stopcondition:
+                return (found, True)
+        if stop:
+            return (found, True)
+    return (found, False)
+
+
+def mavsearch(filename, args):
     print("Loading %s ..." % filename)
-    mlog = mavutil.mavlink_connection(filename)
     if args.types is not None:
         types = args.types.split(',')
     else:
         types = None
-    while True:
-        m = mlog.recv_match(type=types)
-        if m is None:
-            break
-        if mlog.check_condition(args.condition):
+    results = logshard.map_log(filename, mavsearch_shard,
+                               (types, args.condition, args.stop, args.stopcondition),
+                               jobs=args.jobs)
+    for (found, stopped) in results:
+        for m in found:
             print(m)
-            if args.stopcondition:
-                break
-        if args.stop:
+        if stopped:
             break
 
 
-for f in args.logs:
-    mavsearch(f)
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for f in args.logs:
+        mavsearch(f, args)
@@ -75,9 +75,9 @@ def PrintSummary(logfile):
         if true_time is None:
             if not args.notimestamps and timestamp >= 1230768000:
                 true_time = timestamp
-            elif 'time_unix_usec' in m.__dict__ and m.time_unix_usec >= 1230768000:
+            elif 'time_unix_usec' in m.get_fieldnames() and m.time_unix_usec >= 1230768000:
                 true_time = m.time_unix_usec * 1.0e-6
-            elif 'time_usec' in m.__dict__ and m.time_usec >= 1230768000:
+            elif 'time_usec' in m.get_fieldnames() and m.time_usec >= 1230768000:
                 true_time = m.time_usec * 1.0e-6
 
         # Track the vehicle's speed and status